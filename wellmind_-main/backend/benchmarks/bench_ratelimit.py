@@ -0,0 +1,66 @@
+"""Cost of one rate-limit check, per bucket store and thread count.
+
+    python benchmarks/bench_ratelimit.py --checks 200000 --keys 10000 --threads 1 8
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from src.ratelimit import MemoryBucketStore, SQLiteBucketStore  # noqa: E402
+
+
+def bench(store, checks, keys, threads):
+    """Return the mean wall-clock microseconds per check across ``threads``."""
+    per_thread = checks // threads
+    key_names = [f'mood.save_mood:ip:10.0.{i // 256}.{i % 256}' for i in range(keys)]
+    start_event = threading.Event()
+
+    def run(offset):
+        start_event.wait()
+        consume = store.consume
+        for n in range(per_thread):
+            consume(key_names[(offset + n) % keys], 60, 1.0)
+
+    pool = [threading.Thread(target=run, args=(t * 7919,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    started = time.perf_counter()
+    start_event.set()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return elapsed / (per_thread * threads) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checks', type=int, default=200000)
+    parser.add_argument('--keys', type=int, default=10000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--sqlite-checks', type=int, default=20000)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='wellmind-ratelimit-')
+    try:
+        print(f"{'store':<8} {'threads':>7} {'us/check':>9}")
+        for threads in args.threads:
+            us = bench(MemoryBucketStore(), args.checks, args.keys, threads)
+            print(f"{'memory':<8} {threads:>7} {us:>9.2f}")
+        for threads in args.threads:
+            store = SQLiteBucketStore(os.path.join(tmp_dir, f'buckets-{threads}.db'))
+            us = bench(store, args.sqlite_checks, args.keys, threads)
+            print(f"{'sqlite':<8} {threads:>7} {us:>9.2f}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
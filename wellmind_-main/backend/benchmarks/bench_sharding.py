@@ -0,0 +1,121 @@
+"""Concurrent POST /api/mood write throughput per shard count (DB_SHARDS).
+
+Each worker process builds its own app against the same on-disk databases
+(production profile) and writes moods for many users from several threads.
+With shards, writers for users on different shards take different SQLite
+write locks.
+
+    python benchmarks/bench_sharding.py --shards 0 2 4 8 --processes 4 --threads 4 --requests 200
+
+``--synchronous FULL`` fsyncs every commit, which is where a single write
+lock hurts most.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def _worker(db_uri, shards, synchronous, headers, threads, requests_per_thread, offset, start_event, results):
+    import threading
+    from main import create_app
+    from src.extensions import db
+    from src.storage import install_sqlite_pragmas
+
+    app = create_app(database_uri=db_uri, db_profile='production', db_shards=shards)
+    if synchronous:
+        with app.app_context():
+            for engine in db.engines.values():
+                install_sqlite_pragmas(engine, {'synchronous': synchronous})
+    errors = []
+
+    def run(thread_index):
+        client = app.test_client()
+        for i in range(requests_per_thread):
+            user_headers = headers[(offset + thread_index + i * threads) % len(headers)]
+            resp = client.post('/api/mood', json={'mood_level': (i % 5) + 1, 'notes': 'bench'}, headers=user_headers)
+            if resp.status_code != 201:
+                errors.append(resp.status_code)
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    start_event.wait()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put(len(errors))
+
+
+def run_shards(shards, users, synchronous, processes, threads, requests_per_thread):
+    os.environ.setdefault('RATELIMIT_ENABLED', '0')  # all writers share one IP
+    tmp_dir = tempfile.mkdtemp(prefix='wellmind-bench-shards-')
+    db_uri = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    try:
+        # Create the schema and the users once, outside the timed section
+        from main import create_app, init_db
+        from src.auth import issue_token
+        from src.extensions import db
+        from src.models.user import User
+
+        app = create_app(database_uri=db_uri, db_profile='production', db_shards=shards)
+        init_db(app)
+        with app.app_context():
+            accounts = [User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash='x')
+                        for i in range(users)]
+            db.session.add_all(accounts)
+            db.session.commit()
+            headers = [{'Authorization': f'Bearer {issue_token(user)}'} for user in accounts]
+            db.engine.dispose()
+
+        ctx = multiprocessing.get_context('spawn')
+        start_event = ctx.Event()
+        results = ctx.Queue()
+        workers = [
+            ctx.Process(target=_worker, args=(db_uri, shards, synchronous, headers, threads, requests_per_thread,
+                                              p * threads, start_event, results))
+            for p in range(processes)
+        ]
+        for w in workers:
+            w.start()
+        time.sleep(1.5)  # let every worker finish importing / building its app
+
+        started = time.perf_counter()
+        start_event.set()
+        errors = sum(results.get() for _ in workers)
+        elapsed = time.perf_counter() - started
+        for w in workers:
+            w.join()
+
+        total = processes * threads * requests_per_thread
+        return total, errors, elapsed
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 2, 4, 8])
+    parser.add_argument('--users', type=int, default=64)
+    parser.add_argument('--synchronous', choices=['NORMAL', 'FULL'], default=None)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200, help='requests per thread')
+    args = parser.parse_args()
+
+    print(f"{'shards':>6} {'writes':>7} {'errors':>6} {'seconds':>8} {'writes/s':>9}")
+    for shards in args.shards:
+        total, errors, elapsed = run_shards(
+            shards, args.users, args.synchronous, args.processes, args.threads, args.requests
+        )
+        print(f'{shards:>6} {total:>7} {errors:>6} {elapsed:>8.2f} {total / elapsed:>9.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Concurrent POST /api/mood write throughput per SQLite profile.
+
+Each worker process builds its own app (like a gunicorn worker) against a
+fresh on-disk database and fires mood writes from several threads.
+
+    python benchmarks/bench_sqlite_profile.py --processes 4 --threads 4 --requests 200
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def _worker(db_uri, profile, threads, requests_per_thread, start_event, results):
+    import threading
+    from main import create_app
+
+    app = create_app(database_uri=db_uri, db_profile=profile)
+    errors = []
+
+    def run():
+        client = app.test_client()
+        for i in range(requests_per_thread):
+            resp = client.post('/api/mood', json={'mood_level': (i % 5) + 1, 'notes': 'bench'})
+            if resp.status_code != 201:
+                errors.append(resp.status_code)
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    start_event.wait()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put(len(errors))
+
+
+def run_profile(profile, processes, threads, requests_per_thread):
+    os.environ.setdefault('RATELIMIT_ENABLED', '0')  # all writers share one IP
+    tmp_dir = tempfile.mkdtemp(prefix='wellmind-bench-')
+    db_uri = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    try:
+        # Create the schema once, outside the timed section
+        from main import create_app, init_db
+        init_db(create_app(database_uri=db_uri, db_profile=profile))
+
+        ctx = multiprocessing.get_context('spawn')
+        start_event = ctx.Event()
+        results = ctx.Queue()
+        workers = [
+            ctx.Process(target=_worker, args=(db_uri, profile, threads, requests_per_thread, start_event, results))
+            for _ in range(processes)
+        ]
+        for w in workers:
+            w.start()
+        time.sleep(1.0)  # let every worker finish importing / building its app
+
+        started = time.perf_counter()
+        start_event.set()
+        errors = sum(results.get() for _ in workers)
+        elapsed = time.perf_counter() - started
+        for w in workers:
+            w.join()
+
+        total = processes * threads * requests_per_thread
+        return total, errors, elapsed
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200, help='requests per thread')
+    parser.add_argument('--profiles', nargs='+', default=['default', 'production'])
+    args = parser.parse_args()
+
+    print(f'{args.processes} processes x {args.threads} threads x {args.requests} requests')
+    for profile in args.profiles:
+        total, errors, elapsed = run_profile(profile, args.processes, args.threads, args.requests)
+        print(f'{profile:>12}: {total / elapsed:8.1f} writes/s  ({total} writes, {errors} errors, {elapsed:.2f}s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Cold-start time of a worker: importing main and building the app.
+
+Each sample runs in a fresh interpreter against an already-initialized
+database, as a gunicorn worker or test process would. The ``per-boot
+schema`` row also runs ``init_db`` on every start, which is what every
+``create_app`` call used to do.
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SAMPLE = '''
+import json, sys, time
+started = time.perf_counter()
+from main import create_app, init_db
+imported = time.perf_counter()
+app = create_app(database_uri=sys.argv[1])
+if sys.argv[2] == '1':
+    init_db(app)
+built = time.perf_counter()
+print(json.dumps({"import": imported - started, "create_app": built - imported}))
+'''
+
+
+def sample(db_uri, with_schema):
+    out = subprocess.run(
+        [sys.executable, '-c', _SAMPLE, db_uri, '1' if with_schema else '0'],
+        cwd=BACKEND_DIR, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(runs):
+    tmp_dir = tempfile.mkdtemp(prefix='wellmind-startup-')
+    db_uri = f"sqlite:///{os.path.join(tmp_dir, 'startup.db')}"
+    try:
+        sample(db_uri, with_schema=True)  # initialize the schema once
+        results = {}
+        for label, with_schema in (('per-boot schema', True), ('create_app only', False)):
+            samples = [sample(db_uri, with_schema) for _ in range(runs)]
+            results[label] = {
+                key: statistics.median(s[key] for s in samples) * 1000
+                for key in ('import', 'create_app')
+            }
+        return results
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    results = run(args.runs)
+    print(f"{'mode':<16} {'import ms':>10} {'build ms':>10} {'total ms':>10}   (median of {args.runs})")
+    for label, r in results.items():
+        print(f"{label:<16} {r['import']:>10.1f} {r['create_app']:>10.1f} {r['import'] + r['create_app']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""Load-testing harness for the Flask API with stored regression baselines.
+
+Seeds a throwaway SQLite database with N users and M moods, then drives
+the real WSGI app concurrently (in-process test clients, one per thread,
+optionally across several worker processes). For each endpoint it reports
+throughput, latency percentiles and peak RSS. Results can be stored as a
+baseline, and later runs fail when they regress beyond a tolerance.
+
+    python benchmarks/harness.py --users 200 --moods 5000 --threads 4 --processes 2
+    python benchmarks/harness.py --update-baseline      # record the current numbers
+    python benchmarks/harness.py --check                # exit 1 on regression
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+BENCH_PASSWORD = 'bench-password'
+
+
+def _mood_list(client, i, users):
+    return client.get('/api/mood?limit=10')
+
+
+def _mood_create(client, i, users):
+    return client.post('/api/mood', json={'mood_level': (i % 5) + 1, 'notes': 'benchmark entry'})
+
+
+def _login(client, i, users):
+    return client.post('/api/login', json={'username': f'user{i % users}', 'password': BENCH_PASSWORD})
+
+
+def _shell(client, i, users):
+    return client.get('/dashboard')
+
+
+def _health(client, i, users):
+    return client.get('/api/health')
+
+
+# name -> (request function, expected status)
+ENDPOINTS = {
+    'mood_list': (_mood_list, 200),
+    'mood_create': (_mood_create, 201),
+    'login': (_login, 200),
+    'shell': (_shell, 200),
+    'health': (_health, 200),
+}
+
+
+def seed_database(db_uri, users, moods):
+    """Create the schema and bulk insert benchmark users and moods."""
+    from sqlalchemy import insert
+    from main import create_app, init_db
+    from src.extensions import db, password_hasher
+    from src.models.mood import Mood
+    from src.models.user import User
+
+    app = create_app(database_uri=db_uri)
+    init_db(app)
+    with app.app_context():
+        # Every user shares one password, so hash it once
+        password_hash = password_hasher.hash(BENCH_PASSWORD)
+        db.session.execute(insert(User), [
+            {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': password_hash}
+            for i in range(users)
+        ])
+        rng = random.Random(42)
+        start = datetime.now(timezone.utc) - timedelta(days=365)
+        rows = [
+            {
+                'user_id': rng.randint(1, users) if users else None,
+                'mood_level': rng.randint(1, 5),
+                'notes': 'seeded',
+                'date_created': start + timedelta(minutes=i),
+            }
+            for i in range(moods)
+        ]
+        for offset in range(0, len(rows), 5000):
+            db.session.execute(insert(Mood), rows[offset:offset + 5000])
+        db.session.commit()
+        db.engine.dispose()
+
+
+def _run_worker(db_uri, endpoint, threads, requests_per_thread, users, start_event=None):
+    """Fire requests at one endpoint from ``threads`` threads of this process.
+
+    Returns ``(latencies_seconds, errors, peak_rss_kb)``.
+    """
+    from main import create_app
+
+    app = create_app(database_uri=db_uri)
+    func, expected = ENDPOINTS[endpoint]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def run(thread_index):
+        client = app.test_client()
+        local = []
+        local_errors = 0
+        for n in range(requests_per_thread):
+            i = thread_index * requests_per_thread + n
+            started = time.perf_counter()
+            resp = func(client, i, users or 1)
+            local.append(time.perf_counter() - started)
+            if resp.status_code != expected:
+                local_errors += 1
+            resp.close()
+        with lock:
+            latencies.extend(local)
+            errors.append(local_errors)
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    if start_event is not None:
+        start_event.wait()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return latencies, sum(errors), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _process_entry(args, results):
+    results.put(_run_worker(*args))
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def run_endpoint(db_uri, endpoint, processes, threads, requests_per_thread, users):
+    """Benchmark one endpoint and return its summary dict."""
+    if processes <= 1:
+        started = time.perf_counter()
+        latencies, errors, rss_kb = _run_worker(db_uri, endpoint, threads, requests_per_thread, users)
+        elapsed = time.perf_counter() - started
+        worker_results = [(latencies, errors, rss_kb)]
+    else:
+        ctx = multiprocessing.get_context('spawn')
+        start_event = ctx.Event()
+        queue = ctx.Queue()
+        workers = [
+            ctx.Process(
+                target=_process_entry,
+                args=((db_uri, endpoint, threads, requests_per_thread, users, start_event), queue),
+            )
+            for _ in range(processes)
+        ]
+        for w in workers:
+            w.start()
+        time.sleep(1.0)  # let every worker import and build its app
+        started = time.perf_counter()
+        start_event.set()
+        worker_results = [queue.get() for _ in workers]
+        elapsed = time.perf_counter() - started
+        for w in workers:
+            w.join()
+
+    latencies = sorted(lat for result in worker_results for lat in result[0])
+    total = len(latencies)
+    return {
+        'requests': total,
+        'errors': sum(result[1] for result in worker_results),
+        'rps': round(total / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'peak_rss_mb': round(max(result[2] for result in worker_results) / 1024, 1),
+    }
+
+
+@contextmanager
+def benchmark_env():
+    """Environment for the benchmarked apps, restored on exit.
+
+    Spawned workers read it too, so it is set in os.environ, but only for
+    the duration of the run.
+    """
+    saved = os.environ.get('RATELIMIT_ENABLED')
+    # Every simulated client shares one IP; measure the endpoints, not the limiter
+    os.environ['RATELIMIT_ENABLED'] = '0'
+    try:
+        yield
+    finally:
+        if saved is None:
+            os.environ.pop('RATELIMIT_ENABLED', None)
+        else:
+            os.environ['RATELIMIT_ENABLED'] = saved
+
+
+def run_benchmark(endpoints, users=100, moods=1000, processes=1, threads=4, requests=100):
+    """Seed a fresh database and benchmark each endpoint against it."""
+    tmp_dir = tempfile.mkdtemp(prefix='wellmind-harness-')
+    db_uri = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    try:
+        with benchmark_env():
+            seed_database(db_uri, users, moods)
+            return {
+                endpoint: run_endpoint(db_uri, endpoint, processes, threads, requests, users)
+                for endpoint in endpoints
+            }
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def config_key(args):
+    return f'{args.processes}p{args.threads}t-{args.users}u{args.moods}m'
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return human-readable regressions of ``results`` against ``baseline``."""
+    regressions = []
+    for endpoint, current in results.items():
+        base = baseline.get(endpoint)
+        if not base:
+            continue
+        if current['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {current['rps']} < baseline {base['rps']} req/s")
+        if current['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p99 {current['p99_ms']} > baseline {base['p99_ms']} ms")
+        if current['errors'] > base.get('errors', 0):
+            regressions.append(f"{endpoint}: {current['errors']} errors (baseline {base.get('errors', 0)})")
+    return regressions
+
+
+def _print_table(results):
+    print(f"{'endpoint':<12} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rss MB':>8} {'errors':>7}")
+    for endpoint, r in results.items():
+        print(f"{endpoint:<12} {r['rps']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} "
+              f"{r['peak_rss_mb']:>8} {r['errors']:>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--moods', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=100, help='requests per thread per endpoint')
+    parser.add_argument('--endpoints', nargs='+', default=list(ENDPOINTS), choices=list(ENDPOINTS))
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed fractional regression')
+    parser.add_argument('--check', action='store_true', help='exit 1 if results regress past the baseline')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--output', help='write the results as JSON to this path')
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.endpoints, args.users, args.moods, args.processes, args.threads, args.requests)
+    _print_table(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baselines = json.load(f)
+    key = config_key(args)
+
+    if args.update_baseline:
+        baselines.setdefault(key, {}).update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline {key} written to {args.baseline}')
+        return 0
+
+    if args.check:
+        if key not in baselines:
+            print(f'No baseline for {key}; run with --update-baseline first')
+            return 1
+        regressions = compare_to_baseline(results, baselines[key], args.tolerance)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            return 1
+        print(f'No regressions against baseline {key} (tolerance {args.tolerance:.0%})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
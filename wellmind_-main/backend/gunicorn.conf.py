@@ -0,0 +1,47 @@
+"""Gunicorn settings for production.
+
+    gunicorn -c gunicorn.conf.py
+
+The app is built once in the master (``preload_app``) and forked into the
+workers, so imports, config and the app shell are shared copy-on-write.
+The schema is brought up to date once in the master before any worker
+starts. Each worker then disposes the engine it inherited, so no SQLite
+connection is shared across processes.
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'main:create_app()'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+preload_app = True
+# Skip the one-off schema step, e.g. when `flask --app main init-db` runs at deploy time
+init_db_on_start = os.getenv('INIT_DB_ON_START', '1').lower() in ('1', 'true', 'yes')
+
+
+def on_starting(server):
+    if not init_db_on_start:
+        return
+    from main import init_db
+    from src.extensions import db
+
+    app = server.app.wsgi()
+    init_db(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def post_fork(server, worker):
+    from src.extensions import db, retention
+
+    app = worker.app.wsgi()
+    with app.app_context():
+        # Drop pooled connections inherited from the master without closing
+        # them, since the master still owns the underlying file handles
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    # Threads don't survive fork: each worker runs its own scheduler, and a
+    # file lock lets only one of them do each run
+    retention.start(app)
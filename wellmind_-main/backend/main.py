@@ -1,11 +1,32 @@
+import json
 import os
-from flask import Flask, send_from_directory
+from functools import lru_cache
+
+import click
+from flask import Flask
 from flask_cors import CORS
-from src.extensions import db
+from src.extensions import (
+    availability_index, chat_proxy, db, metrics, password_hasher, rate_limiter, response_cache,
+    retention, score_distributions,
+)
+from src.analytics import DEFAULT_MIN_SAMPLES
+from src.auth import DEFAULT_TOKEN_MAX_AGE
+from src.chat import DEFAULT_UPSTREAM_URL
+from src.hashing import DEFAULT_HASH_METHOD
+from src.frontend import IndexShell, StaticAssets
+from src.pagination import MAX_PAGE_SIZE, PAGINATION_HEADERS
+from src.storage import apply_sqlite_profile, configure_sqlite_profile
 from src.routes.user import user_bp
-from src.routes.mood import mood_bp
-
-# Load environment variables from .env file
+from src.routes.mood import DEFAULT_BATCH_MAX_ITEMS, mood_bp
+from src.routes.export import export_bp
+from src.routes.chat import chat_bp
+from src.migrations import init_schema, run_migrations
+from src.retention import run_retention
+from src.search import rebuild_search_index
+from src.sharding import bind_key, create_shard_schema, shard_binds
+
+# Load environment variables from .env file (once per process)
+@lru_cache(maxsize=None)
 def load_env_file():
     env_path = os.path.join(os.path.dirname(__file__), '.env')
     if os.path.exists(env_path):
@@ -16,86 +37,190 @@ def load_env_file():
                     key, value = line.split('=', 1)
                     os.environ[key.strip()] = value.strip()
 
-load_env_file()
-
 # Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_FOLDER = os.path.join(BASE_DIR, 'database')
 DIST_PATH = os.path.join(BASE_DIR, 'src', 'static')
-
-os.makedirs(DB_FOLDER, exist_ok=True)
 DB_PATH = os.path.join(DB_FOLDER, 'app.db')
 
 
-def create_app(testing: bool = False, database_uri: str | None = None) -> Flask:
+def create_app(testing: bool = False, database_uri: str | None = None,
+               db_profile: str | None = None, db_shards: int | None = None) -> Flask:
     """Application factory to create configured Flask app instances.
 
+    Building an app has no side effects on the database schema: run
+    ``init_db`` (``flask --app main init-db``) once per deploy for that.
+
     Args:
         testing: Enable testing mode.
         database_uri: Optional explicit database URI. If not provided,
                       defaults to SQLite file under database folder.
+        db_profile: SQLite tuning profile ('default' or 'production').
+                    Falls back to the DB_PROFILE environment variable.
+        db_shards: Number of per-user shard files for mood and test-result
+                   data (0 = everything in the main database). Falls back
+                   to the DB_SHARDS environment variable.
     """
     # Load environment variables FIRST
     load_env_file()
 
     app = Flask(__name__, static_folder=DIST_PATH, template_folder=DIST_PATH)
-    app.config['SECRET_KEY'] = 'change-me-in-prod'
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'change-me-in-prod')
+    # Lifetime of the signed tokens issued by /api/login, in seconds
+    app.config['AUTH_TOKEN_MAX_AGE'] = int(os.getenv('AUTH_TOKEN_MAX_AGE', DEFAULT_TOKEN_MAX_AGE))
 
     # Database configuration
     if database_uri:
         app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
     else:
+        os.makedirs(DB_FOLDER, exist_ok=True)
         app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['DB_SHARDS'] = db_shards if db_shards is not None else int(os.getenv('DB_SHARDS', 0))
+    if app.config['DB_SHARDS']:
+        app.config['SQLALCHEMY_BINDS'] = shard_binds(app.config['SQLALCHEMY_DATABASE_URI'], app.config['DB_SHARDS'])
     app.config['TESTING'] = testing
+    configure_sqlite_profile(app, db_profile or os.getenv('DB_PROFILE', 'default'))
+    # Upper bound for ?limit= on the paginated list endpoints
+    app.config['PAGE_SIZE_MAX'] = int(os.getenv('PAGE_SIZE_MAX', MAX_PAGE_SIZE))
+    # Largest accepted /api/mood/batch and /api/test-results/batch payload
+    app.config['BATCH_MAX_ITEMS'] = int(os.getenv('BATCH_MAX_ITEMS', DEFAULT_BATCH_MAX_ITEMS))
+    # Password hashing pool (0 workers = hash on the request thread)
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD)
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', 0 if testing else min(4, os.cpu_count() or 1)))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32))
+    # Seconds before the username/email availability index is reloaded
+    app.config['AVAILABILITY_INDEX_TTL'] = int(os.getenv('AVAILABILITY_INDEX_TTL', 300))
+    # Upstream model endpoint for /api/chat and its concurrency cap
+    app.config['CHAT_UPSTREAM_URL'] = os.getenv('CHAT_UPSTREAM_URL', DEFAULT_UPSTREAM_URL)
+    app.config['CHAT_MAX_CONCURRENCY'] = int(os.getenv('CHAT_MAX_CONCURRENCY', 8))
+    # Cache for the mood/test-result list responses: memory, sqlite (shared
+    # by the workers on this host, stored at RESPONSE_CACHE_PATH) or none
+    app.config['RESPONSE_CACHE_BACKEND'] = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+    app.config['RESPONSE_CACHE_PATH'] = os.getenv('RESPONSE_CACHE_PATH', os.path.join(DB_FOLDER, 'cache.db'))
+    app.config['RESPONSE_CACHE_TTL'] = int(os.getenv('RESPONSE_CACHE_TTL', 30))
+    # Token-bucket limits on the auth and write endpoints (off in tests).
+    # RATELIMITS overrides a route's default: "user.login=5/minute,mood.save_mood=30/minute"
+    app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', '0' if testing else '1').lower() in ('1', 'true', 'yes')
+    app.config['RATELIMIT_BACKEND'] = os.getenv('RATELIMIT_BACKEND', 'memory')
+    app.config['RATELIMIT_STORAGE_PATH'] = os.getenv('RATELIMIT_STORAGE_PATH', os.path.join(DB_FOLDER, 'ratelimit.db'))
+    app.config['RATELIMITS'] = dict(
+        item.strip().split('=', 1) for item in os.getenv('RATELIMITS', '').split(',') if item.strip()
+    )
+    # Test-result categories from the score percentile within its test_type:
+    # JSON {"<test_type>": [[upper_percentile, category], ...]}, applied once a
+    # listed type has TEST_RESULT_MIN_SAMPLES results. Unlisted types (all of
+    # them by default) keep the client's category
+    app.config['TEST_RESULT_CUTOFFS'] = json.loads(os.getenv('TEST_RESULT_CUTOFFS', '{}'))
+    app.config['TEST_RESULT_MIN_SAMPLES'] = int(os.getenv('TEST_RESULT_MIN_SAMPLES', DEFAULT_MIN_SAMPLES))
+    app.config['TEST_RESULT_SKETCH_TTL'] = int(os.getenv('TEST_RESULT_SKETCH_TTL', 60))
+    # Archive and delete moods/test results older than RETENTION_DAYS (all rows)
+    # or RETENTION_ANONYMOUS_DAYS (rows without a user); 0 keeps them forever.
+    # RETENTION_INTERVAL > 0 also runs the job in-process every that many seconds
+    app.config['RETENTION_DAYS'] = int(os.getenv('RETENTION_DAYS', 0))
+    app.config['RETENTION_ANONYMOUS_DAYS'] = int(os.getenv('RETENTION_ANONYMOUS_DAYS', 0))
+    app.config['RETENTION_ARCHIVE_DIR'] = os.getenv('RETENTION_ARCHIVE_DIR', os.path.join(DB_FOLDER, 'archive'))
+    app.config['RETENTION_BATCH_SIZE'] = int(os.getenv('RETENTION_BATCH_SIZE', 1000))
+    app.config['RETENTION_BATCH_PAUSE'] = float(os.getenv('RETENTION_BATCH_PAUSE', 0.05))
+    app.config['RETENTION_INTERVAL'] = int(os.getenv('RETENTION_INTERVAL', 0))
+    # Build missing .br/.gz siblings of static assets at startup
+    app.config['STATIC_PRECOMPRESS'] = os.getenv('STATIC_PRECOMPRESS', '').lower() in ('1', 'true', 'yes')
 
     db.init_app(app)
+    password_hasher.init_app(app)
+    availability_index.init_app(app)
+    chat_proxy.init_app(app)
+    metrics.init_app(app)
+    response_cache.init_app(app)
+    rate_limiter.init_app(app)
+    score_distributions.init_app(app)
+    retention.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            apply_sqlite_profile(app, engine)
+            metrics.instrument_engine(engine)
 
     # Enable CORS
-    CORS(app)
+    CORS(app, expose_headers=PAGINATION_HEADERS)
 
     # Register Blueprints
     app.register_blueprint(user_bp, url_prefix='/api')
     app.register_blueprint(mood_bp, url_prefix='/api')
+    app.register_blueprint(export_bp, url_prefix='/api')
+    app.register_blueprint(chat_bp, url_prefix='/api')
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing tables and apply pending schema migrations."""
+        applied = init_db(app)
+        click.echo(f'Applied migrations: {applied}' if applied else 'Schema is up to date')
+
+    @app.cli.command('rebuild-search')
+    def rebuild_search_command():
+        """Re-index every mood note for /api/mood/search."""
+        # With sharding the notes live in the shard files, not the main database
+        shards = app.config['DB_SHARDS']
+        engines = [db.engines[bind_key(index)] for index in range(shards)] if shards else [db.engine]
+        for engine in engines:
+            with engine.begin() as conn:
+                rebuild_search_index(conn)
+        click.echo(f'Search index rebuilt in {shards} shards' if shards else 'Search index rebuilt')
+
+    @app.cli.command('retention')
+    @click.option('--dry-run', is_flag=True, help='Only count the rows that would be archived.')
+    def retention_command(dry_run):
+        """Archive and delete expired rows, then compact the database."""
+        if not (app.config['RETENTION_DAYS'] or app.config['RETENTION_ANONYMOUS_DAYS']):
+            click.echo('Retention is disabled (set RETENTION_DAYS or RETENTION_ANONYMOUS_DAYS)')
+            return
+        report = run_retention(dry_run=dry_run)
+        if report is None:
+            raise click.ClickException('Another retention run is in progress')
+        verb = 'Would archive' if dry_run else 'Archived'
+        for table, count in report['rows'].items():
+            click.echo(f'{verb} {count} {table} rows')
+        if not dry_run:
+            click.echo(f"Freed {report['pages_freed']} pages in {report['seconds']}s")
+
+    # Serve frontend (shell read once, cached by mtime)
+    index_shell = IndexShell(os.path.join(DIST_PATH, 'index.html'))
+    index_shell.warm()
+    static_assets = StaticAssets(DIST_PATH)
+    static_assets.scan(build=app.config['STATIC_PRECOMPRESS'])
 
-    # Create tables if they don't exist
-    with app.app_context():
-        # Ensure models are imported before create_all
-        from src.models import user as _user  # noqa: F401
-        from src.models import mood as _mood  # noqa: F401
-        db.create_all()
-
-    # Serve frontend with API key replacement
     @app.route('/', defaults={'path': ''})
     @app.route('/<path:path>')
     def serve(path):
         if path != '' and os.path.exists(os.path.join(DIST_PATH, path)):
-            return send_from_directory(DIST_PATH, path)
+            return static_assets.send(path)
         else:
-            # Read index.html and replace API key placeholder
-            index_path = os.path.join(DIST_PATH, 'index.html')
-            with open(index_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # Inject API key as JavaScript variable
-            api_key = os.getenv('GOOGLE_API_KEY')
-            if not api_key:
-                raise ValueError("GOOGLE_API_KEY environment variable is required. Please set it in your .env file.")
-            content = content.replace(
-                "const API_KEY = window.API_KEY || 'fallback-key';",
-                f"const API_KEY = '{api_key}';"
-            )
-
-            from flask import Response
-            return Response(content, mimetype='text/html')
+            return index_shell.response()
 
     return app
 
 
+def init_db(app):
+    """Create missing tables and apply pending migrations for ``app``.
+
+    Returns the migration versions that were applied to the main database
+    or to any shard.
+    """
+    with app.app_context():
+        applied = set(init_schema(db.engine))
+        for index in range(app.config['DB_SHARDS']):
+            shard_engine = db.engines[bind_key(index)]
+            create_shard_schema(shard_engine, index, db.metadata)
+            applied.update(run_migrations(shard_engine))
+        availability_index.build()
+    return sorted(applied)
+
+
 if __name__ == '__main__':
     import webbrowser
 
     app = create_app()
+    init_db(app)
+    retention.start(app)
 
     # Open the web interface automatically
     webbrowser.open("http://127.0.0.1:5000")
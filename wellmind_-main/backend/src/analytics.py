@@ -0,0 +1,194 @@
+"""Per-test-type score distributions and percentile-based categories.
+
+Every saved test result increments one ``score_sketch_bucket`` row for its
+``test_type`` (an upsert in the same transaction, like the mood rollups).
+The buckets form a DDSketch-style quantile sketch: bucket ``k`` holds the
+scores in ``(gamma**(k-2), gamma**(k-1)]`` with ``gamma = (1+a)/(1-a)``,
+so any quantile read back is within ``a`` (relative) of the true score
+while a distribution needs only a few hundred rows whatever the number of
+results.
+
+A loaded ``ScoreSketch`` keeps a dense cumulative-count array indexed by
+bucket, so the percentile of a score is one array lookup. Loaded sketches
+are cached per worker for TEST_RESULT_SKETCH_TTL seconds.
+
+``result_category`` is derived from the percentile only for the test types
+listed in TEST_RESULT_CUTOFFS: ``{test_type: [[upper_percentile, category], ...]}``.
+There are no default cutoffs: every other type keeps the client's category.
+"""
+import math
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from src.cache import TTLCache
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+
+DEFAULT_QUANTILES = (0.25, 0.5, 0.75, 0.9, 0.99)
+DEFAULT_MIN_SAMPLES = 30
+
+
+def bucket_key(score):
+    """Sketch bucket of a score: 0 for zero, +/-(ceil(log_gamma |x|) + 1) otherwise."""
+    if score == 0:
+        return 0
+    key = math.ceil(math.log(abs(score)) / _LOG_GAMMA) + 1
+    return key if score > 0 else -key
+
+
+def bucket_value(key):
+    """Representative score of a bucket (relative error at most RELATIVE_ACCURACY)."""
+    if key == 0:
+        return 0.0
+    value = 2 * GAMMA ** (abs(key) - 1) / (GAMMA + 1)
+    return value if key > 0 else -value
+
+
+class ScoreSketch:
+    """Read-only view of one distribution, from ``{bucket: count}``."""
+
+    def __init__(self, counts):
+        counts = {key: count for key, count in counts.items() if count > 0}
+        self.count = sum(counts.values())
+        if not counts:
+            self._low = 0
+            self._counts = []
+            self._below = []
+            return
+        self._low = min(counts)
+        high = max(counts)
+        self._counts = [counts.get(key, 0) for key in range(self._low, high + 1)]
+        # _below[i]: number of scores in buckets before bucket _low + i
+        self._below = []
+        running = 0
+        for count in self._counts:
+            self._below.append(running)
+            running += count
+
+    def percentile(self, score):
+        """Percentage of scores below ``score`` (ties count half), 0-100."""
+        if not self.count:
+            return None
+        index = bucket_key(score) - self._low
+        if index < 0:
+            return 0.0
+        if index >= len(self._counts):
+            return 100.0
+        return 100.0 * (self._below[index] + self._counts[index] / 2) / self.count
+
+    def quantile(self, q):
+        """Approximate score at quantile ``q`` (0-1)."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        for index, below in enumerate(self._below):
+            if below + self._counts[index] > rank:
+                return bucket_value(self._low + index)
+        return bucket_value(self._low + len(self._counts) - 1)
+
+
+def load_counts(session, test_type):
+    """``{bucket: count}`` of a test type's sketch."""
+    # Model imports are deferred: this module is loaded by src.extensions
+    from src.models.mood import ScoreSketchBucket
+    rows = session.execute(
+        select(ScoreSketchBucket.bucket, ScoreSketchBucket.count).where(ScoreSketchBucket.test_type == test_type)
+    )
+    return dict(rows.all())
+
+
+def _upsert(executor, counts):
+    from src.models.mood import ScoreSketchBucket
+    rows = [{'test_type': test_type, 'bucket': key, 'count': count} for (test_type, key), count in counts.items()]
+    if not rows:
+        return
+    stmt = insert(ScoreSketchBucket)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['test_type', 'bucket'],
+        set_={'count': ScoreSketchBucket.count + stmt.excluded.count},
+    )
+    executor.execute(stmt, rows)
+
+
+def record_scores(session, entries):
+    """Fold ``(test_type, score)`` entries into the sketches. Call before committing."""
+    _upsert(session, Counter((test_type, bucket_key(score)) for test_type, score in entries))
+
+
+def rebuild_sketches(conn):
+    """Recompute every sketch from the raw ``test_result`` table."""
+    conn.exec_driver_sql('DELETE FROM score_sketch_bucket')
+    counts = Counter()
+    for test_type, score, count in conn.exec_driver_sql(
+        'SELECT test_type, score, COUNT(*) FROM test_result WHERE score IS NOT NULL GROUP BY 1, 2'
+    ):
+        counts[(test_type, bucket_key(score))] += count
+    _upsert(conn, counts)
+
+
+def categorize(cutoffs, percentile):
+    """First category whose upper percentile bound is >= ``percentile``."""
+    for upper, category in cutoffs:
+        if percentile <= upper:
+            return category
+    return cutoffs[-1][1] if cutoffs else None
+
+
+class ScoreDistributions:
+    """Flask extension caching loaded sketches and deriving result categories."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TEST_RESULT_CUTOFFS', {})
+        app.config.setdefault('TEST_RESULT_MIN_SAMPLES', DEFAULT_MIN_SAMPLES)
+        app.config.setdefault('TEST_RESULT_SKETCH_TTL', 60)
+        for cutoffs in app.config['TEST_RESULT_CUTOFFS'].values():
+            if not cutoffs or any(len(cutoff) != 2 for cutoff in cutoffs):
+                raise ValueError(f'Invalid TEST_RESULT_CUTOFFS entry: {cutoffs!r}')
+        app.extensions['score_distributions'] = TTLCache(maxsize=256, ttl=app.config['TEST_RESULT_SKETCH_TTL'])
+
+    def sketch(self, test_type):
+        cache = current_app.extensions['score_distributions']
+        sketch = cache.get(test_type)
+        if sketch is None:
+            from src.extensions import db
+            from src.sharding import fan_out
+
+            # Sketches merge by adding bucket counts, so sharded data sums up
+            counts = Counter()
+            for shard_counts in fan_out(lambda: load_counts(db.session, test_type)):
+                counts.update(shard_counts)
+            sketch = ScoreSketch(counts)
+            cache.set(test_type, sketch)
+        return sketch
+
+    def invalidate(self, test_types):
+        cache = current_app.extensions['score_distributions']
+        for test_type in test_types:
+            cache.delete(test_type)
+
+    def cutoffs(self, test_type):
+        # Percentile upper bounds, checked in order; None for unlisted types
+        return current_app.config['TEST_RESULT_CUTOFFS'].get(test_type)
+
+    def category(self, test_type, score):
+        """Category of ``score`` among the saved results of ``test_type``.
+
+        None when the type isn't listed in TEST_RESULT_CUTOFFS or has fewer
+        than TEST_RESULT_MIN_SAMPLES results.
+        """
+        cutoffs = self.cutoffs(test_type)
+        if not cutoffs:
+            return None
+        sketch = self.sketch(test_type)
+        if sketch.count < current_app.config['TEST_RESULT_MIN_SAMPLES']:
+            return None
+        return categorize(cutoffs, sketch.percentile(score))
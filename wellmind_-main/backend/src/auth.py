@@ -0,0 +1,90 @@
+"""Signed, expiring session tokens.
+
+``login`` issues a token signed with the app's SECRET_KEY (itsdangerous).
+Requests send it as ``Authorization: Bearer <token>``, and validating it is
+a pure in-memory HMAC check: it needs no database query and no password
+hash.
+"""
+from functools import wraps
+
+from flask import current_app, g, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+TOKEN_SALT = 'wellmind-auth'
+DEFAULT_TOKEN_MAX_AGE = 7 * 24 * 3600  # seconds
+
+
+def _serializer():
+    serializer = current_app.extensions.get('auth_serializer')
+    if serializer is None or serializer.secret_key != current_app.secret_key.encode('utf-8'):
+        serializer = URLSafeTimedSerializer(current_app.secret_key, salt=TOKEN_SALT)
+        current_app.extensions['auth_serializer'] = serializer
+    return serializer
+
+
+def issue_token(user):
+    """Compact signed token carrying the user's id."""
+    return _serializer().dumps(user.id)
+
+
+def verify_token(token):
+    """Return the user id in ``token``, or None if invalid/expired."""
+    max_age = current_app.config.get('AUTH_TOKEN_MAX_AGE', DEFAULT_TOKEN_MAX_AGE)
+    try:
+        user_id = _serializer().loads(token, max_age=max_age)
+    except (SignatureExpired, BadSignature):
+        return None
+    return user_id if isinstance(user_id, int) else None
+
+
+def _bearer_token():
+    header = request.headers.get('Authorization', '')
+    scheme, _, token = header.partition(' ')
+    if scheme.lower() == 'bearer' and token:
+        return token.strip()
+    return None
+
+
+def auth_optional(view):
+    """Set ``g.user_id`` from a valid bearer token, or None for anonymous calls.
+
+    A token that is present but invalid or expired gets a 401 rather than
+    being silently treated as anonymous.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _bearer_token()
+        g.user_id = None
+        if token is not None:
+            g.user_id = verify_token(token)
+            if g.user_id is None:
+                return jsonify({'error': 'Invalid or expired token'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def auth_required(view):
+    """Like ``auth_optional`` but rejects anonymous calls with 401."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = _bearer_token()
+        g.user_id = verify_token(token) if token is not None else None
+        if g.user_id is None:
+            return jsonify({'error': 'Authentication required'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def scoped_user_id():
+    """``(user_id, error_response)`` for a read that may be scoped to one user.
+
+    The scope is the caller's own id, or None (all users) for anonymous
+    callers. ``?user_id=`` is only honoured when it names the caller: asking
+    for another user's data gets 401 anonymously and 403 otherwise.
+    """
+    requested = request.args.get('user_id', type=int)
+    if requested is None or requested == g.user_id:
+        return g.user_id, None
+    if g.user_id is None:
+        return None, (jsonify({'error': 'Authentication required'}), 401)
+    return None, (jsonify({'error': 'Cannot read another user\'s data'}), 403)
@@ -0,0 +1,96 @@
+"""In-memory index of taken usernames and emails.
+
+``check-username``/``check-email`` run on every keystroke of the signup
+form. The index answers "available" for names it has never seen without
+touching the database. Names it does know about still go to the
+authoritative query, since the user may have been renamed or deleted by
+another worker.
+
+Each worker keeps its own index. It is updated after this worker's commits
+and rebuilt every AVAILABILITY_INDEX_TTL seconds to pick up writes made by
+other workers. ``register`` still relies on the unique constraints, so a
+stale "available" answer can only lead to a 409, never a duplicate.
+"""
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+
+def normalize_username(username):
+    return username.strip()
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class _Index:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.usernames = set()
+        self.emails = set()
+        self.built_at = None
+        self.lock = threading.Lock()
+
+
+class AvailabilityIndex:
+    """Flask extension keeping a hash set of taken usernames and emails per app."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AVAILABILITY_INDEX_TTL', 300)
+        app.extensions['availability_index'] = _Index(app.config['AVAILABILITY_INDEX_TTL'])
+
+    @property
+    def _index(self):
+        return current_app.extensions['availability_index']
+
+    def build(self):
+        """(Re)load the index from the user table. Returns False if it can't."""
+        # Imported here: this module is loaded by src.extensions, before the models
+        from src.extensions import db
+        from src.models.user import User
+
+        index = self._index
+        try:
+            rows = db.session.execute(select(User.username, User.email)).all()
+        except SQLAlchemyError:
+            # Schema not created yet: every lookup falls through to the database
+            db.session.rollback()
+            return False
+        with index.lock:
+            index.usernames = {normalize_username(row.username) for row in rows}
+            index.emails = {normalize_email(row.email) for row in rows}
+            index.built_at = time.monotonic()
+        return True
+
+    def _ready(self):
+        index = self._index
+        if index.built_at is None or time.monotonic() - index.built_at > index.ttl:
+            return self.build()
+        return True
+
+    def may_have_username(self, username):
+        """False means the username is definitely free (as of the last refresh)."""
+        return not self._ready() or normalize_username(username) in self._index.usernames
+
+    def may_have_email(self, email):
+        return not self._ready() or normalize_email(email) in self._index.emails
+
+    def add(self, username, email):
+        index = self._index
+        with index.lock:
+            index.usernames.add(normalize_username(username))
+            index.emails.add(normalize_email(email))
+
+    def remove(self, username, email):
+        index = self._index
+        with index.lock:
+            index.usernames.discard(normalize_username(username))
+            index.emails.discard(normalize_email(email))
@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache:
+    """Cache shared by every worker on a host, stored in a local SQLite file.
+
+    Same interface as TTLCache, for bytes values. Stands in for a network
+    cache such as Redis or memcached. Expired entries are skipped on read
+    and pruned every ``prune_every`` writes.
+    """
+
+    def __init__(self, path, ttl=300, prune_every=1000):
+        self.path = path
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._writes = 0
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+
+    @property
+    def _conn(self):
+        # One connection per thread, reopened after a fork
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = self._connect()
+            local.conn.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.conn
+
+    def get(self, key, default=None):
+        row = self._conn.execute(
+            'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return default if row is None else row[0]
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        conn = self._conn
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, value, now + (self.ttl if ttl is None else ttl)),
+        )
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            conn.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+
+    def delete(self, key):
+        self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self._conn.execute('DELETE FROM cache')
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM cache WHERE expires_at > ?', (time.time(),)).fetchone()[0]
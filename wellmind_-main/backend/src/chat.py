@@ -0,0 +1,259 @@
+"""Server-side proxy for the MindHelper chat model.
+
+The browser no longer calls the model API itself. ``/api/chat`` forwards the
+prompt to a configurable upstream (Gemini's streamGenerateContent by
+default). It reuses keep-alive connections from a small pool, caps the
+number of in-flight upstream calls with a semaphore, and streams the reply
+back as server-sent events. Single-turn prompts such as the quick-topic
+buttons are answered from an LRU+TTL cache when possible.
+"""
+import http.client
+import json
+import os
+import queue
+import re
+import threading
+from urllib.parse import urlsplit
+
+from flask import current_app
+
+from src.cache import TTLCache
+
+DEFAULT_UPSTREAM_URL = (
+    'https://generativelanguage.googleapis.com/v1beta/models/'
+    'gemini-2.0-flash:streamGenerateContent?alt=sse'
+)
+
+# Same prompt the embedded widget in index.html sends
+SYSTEM_PROMPT = """You are MindHelper, the AI assistant for Well Mind - created by Basel Hossam Alshawqery to support mental wellness journeys.
+
+🌟 WEBSITE FEATURES:
+• Mood Tracker - Daily emotional check-ins with smart AI recommendations based on mood levels and personal notes
+• Therapy Sessions - Book sessions with top mental health professionals specializing in anxiety, depression, relationships, trauma recovery
+• Mental Health Library - Curated articles from trusted sources covering anxiety, depression, sleep, meditation, work stress, and self-development
+• Wellness Podcasts - Expert-led episodes on stress management, confidence building, healthy relationships, and overcoming challenges
+• Professional Assessments - Certified psychological tests including PHQ-9 Depression Scale, GAD-7 Anxiety Scale, Stress Assessment, and Sleep Quality Index
+
+🎯 YOUR ROLE & MISSION:
+→ Provide compassionate mental health support and active listening
+→ Be the warm, knowledgeable friend who always knows the right resource
+→ Guide users to perfect website features that match their needs
+→ Suggest relevant tools when they can help the user's situation
+→ Encourage professional care while offering immediate support
+→ Never diagnose conditions - always recommend consulting qualified professionals
+→ Help users navigate website features effectively
+
+💫 COMMUNICATION STYLE:
+Warm • Encouraging • Professional • Empathetic • Supportive • Informative
+
+PERFECT RESPONSE EXAMPLES:
+"Hey there! 👋 I'm here to listen and help you find the right support. What's on your mind today?"
+"That sounds really challenging 💙 Our mood tracker could help you spot patterns and get personalized insights!"
+"Professional support makes such a difference! We have amazing psychologists ready to help you 🩺"
+"I understand how that feels. Our articles on [specific topic] might give you some helpful strategies!"
+"That's a great step toward self-awareness! Our assessments can help you understand yourself better 📊"
+
+KEY PRINCIPLES:
+• Always be warm and empathetic in every interaction
+• Use simple, encouraging language that makes users feel heard
+• Ask open-ended questions to understand user needs deeply
+• Offer specific suggestions from our website features
+• Empower users with information and clear next steps
+• Maintain professional boundaries while being genuinely caring"""
+
+GENERATION_CONFIG = {'temperature': 0.8, 'maxOutputTokens': 500}
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+class ChatUnavailable(Exception):
+    """The proxy can't take the request (not configured, or saturated)."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamError(Exception):
+    pass
+
+
+def normalize_prompt(message):
+    return _WHITESPACE_RE.sub(' ', message).strip().lower()
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections to one upstream host."""
+
+    def __init__(self, url, maxsize=10, timeout=30):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path + (f'?{parts.query}' if parts.query else '')
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize)
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, method, body, headers):
+        """Send a request, returning ``(conn, response)``.
+
+        A pooled connection the server has since closed is retried once on
+        a fresh connection.
+        """
+        conn, reused = self._acquire()
+        try:
+            conn.request(method, self.path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionError, http.client.CannotSendRequest):
+            conn.close()
+            if not reused:
+                raise
+        conn = self._connect()
+        try:
+            conn.request(method, self.path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+
+def _iter_sse_data(response):
+    """Yield the JSON payload of each ``data:`` line of an SSE response."""
+    while True:
+        line = response.readline()
+        if not line:
+            return
+        line = line.strip()
+        if line.startswith(b'data:'):
+            payload = line[5:].strip()
+            if payload and payload != b'[DONE]':
+                yield json.loads(payload)
+
+
+def _candidate_text(payload):
+    try:
+        parts = payload['candidates'][0]['content']['parts']
+    except (KeyError, IndexError, TypeError):
+        return ''
+    return ''.join(part.get('text', '') for part in parts)
+
+
+class _ChatState:
+    def __init__(self, config):
+        self.upstream_url = config['CHAT_UPSTREAM_URL']
+        self.pool = ConnectionPool(
+            self.upstream_url, maxsize=config['CHAT_POOL_SIZE'], timeout=config['CHAT_UPSTREAM_TIMEOUT']
+        )
+        self.slots = threading.BoundedSemaphore(config['CHAT_MAX_CONCURRENCY'])
+        self.queue_timeout = config['CHAT_QUEUE_TIMEOUT']
+        self.cache = TTLCache(maxsize=config['CHAT_CACHE_SIZE'], ttl=config['CHAT_CACHE_TTL'])
+
+
+class ChatProxy:
+    """Flask extension holding the upstream pool, concurrency cap and cache."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHAT_UPSTREAM_URL', DEFAULT_UPSTREAM_URL)
+        app.config.setdefault('CHAT_POOL_SIZE', 10)
+        app.config.setdefault('CHAT_UPSTREAM_TIMEOUT', 30)
+        app.config.setdefault('CHAT_MAX_CONCURRENCY', 8)
+        app.config.setdefault('CHAT_QUEUE_TIMEOUT', 2)
+        app.config.setdefault('CHAT_CACHE_SIZE', 256)
+        app.config.setdefault('CHAT_CACHE_TTL', 3600)
+        app.extensions['chat_proxy'] = _ChatState(app.config)
+
+    @property
+    def _state(self):
+        return current_app.extensions['chat_proxy']
+
+    def cached_reply(self, message, history):
+        """The cached reply for a single-turn prompt, or None."""
+        if history:
+            return None
+        return self._state.cache.get(normalize_prompt(message))
+
+    def stream_reply(self, message, history=None):
+        """Yield reply text fragments from the upstream.
+
+        Takes a concurrency slot (raising ChatUnavailable if none frees up in
+        time) and connects before returning, so upstream failures raise
+        UpstreamError here rather than mid-stream. The slot is held until
+        the generator is exhausted or closed. A complete single-turn reply
+        is stored in the cache.
+        """
+        state = self._state
+        api_key = os.getenv('GOOGLE_API_KEY')
+        if not api_key:
+            raise ChatUnavailable('Chat is not configured')
+        if not state.slots.acquire(timeout=state.queue_timeout):
+            raise ChatUnavailable('Chat is busy, please retry shortly', retry_after=1)
+        body = json.dumps(self._build_payload(message, history)).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'x-goog-api-key': api_key}
+        stream = self._stream(state, message, history, body, headers)
+        next(stream)  # runs up to the upstream status check
+        return stream
+
+    def _stream(self, state, message, history, body, headers):
+        conn = None
+        reusable = False
+        try:
+            try:
+                conn, response = state.pool.request('POST', body, headers)
+            except (OSError, http.client.HTTPException) as e:
+                raise UpstreamError(f'Upstream unreachable: {e}')
+            if response.status != 200:
+                response.read()
+                reusable = not response.will_close
+                raise UpstreamError(f'Upstream returned HTTP {response.status}')
+            yield None
+
+            fragments = []
+            for payload in _iter_sse_data(response):
+                text = _candidate_text(payload)
+                if text:
+                    fragments.append(text)
+                    yield text
+            response.read()  # drain to EOF so the connection can be reused
+            reusable = not response.will_close
+            if fragments and not history:
+                state.cache.set(normalize_prompt(message), ''.join(fragments))
+        finally:
+            if conn is not None:
+                if reusable:
+                    state.pool.release(conn)
+                else:
+                    conn.close()
+            state.slots.release()
+
+    @staticmethod
+    def _build_payload(message, history):
+        contents = []
+        for turn in history or []:
+            role = 'model' if turn.get('role') in ('bot', 'model', 'assistant') else 'user'
+            contents.append({'role': role, 'parts': [{'text': str(turn.get('content', ''))}]})
+        contents.append({'role': 'user', 'parts': [{'text': message}]})
+        return {
+            'systemInstruction': {'parts': [{'text': SYSTEM_PROMPT}]},
+            'contents': contents,
+            'generationConfig': GENERATION_CONFIG,
+        }
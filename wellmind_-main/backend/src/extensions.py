@@ -1,6 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
+from src.analytics import ScoreDistributions
+from src.availability import AvailabilityIndex
+from src.chat import ChatProxy
+from src.hashing import PasswordHasher
+from src.metrics import Metrics
+from src.ratelimit import RateLimiter
+from src.response_cache import ResponseCache
+from src.retention import RetentionScheduler
+from src.sharding import RoutingSession
 
 # Centralized extensions registry for the Flask app
 # This avoids circular imports and allows clean testing configuration
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+password_hasher = PasswordHasher()
+availability_index = AvailabilityIndex()
+chat_proxy = ChatProxy()
+metrics = Metrics()
+response_cache = ResponseCache()
+rate_limiter = RateLimiter()
+score_distributions = ScoreDistributions()
+retention = RetentionScheduler()
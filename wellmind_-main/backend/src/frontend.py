@@ -0,0 +1,164 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Response, request, send_from_directory
+
+from src.metrics import timed
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip siblings are built without it
+    brotli = None
+
+# Precompressed siblings, in server preference order: (encoding, suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE_EXTENSIONS = {'.js', '.mjs', '.css', '.html', '.svg', '.json', '.map', '.txt', '.ico'}
+MIN_COMPRESS_SIZE = 1024
+
+# Vite emits content-hashed names such as assets/index-Z2PlQJ4x.js
+HASHED_ASSET_RE = re.compile(r'^assets/(?:.+/)?[^/]+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class IndexShell:
+    """Rendered SPA shell (index.html with its ETag).
+
+    The file is read once, then kept in memory. Each request only stats the
+    file and re-reads it when its mtime has changed. The model API key is
+    never put into the page; only the /api/chat proxy uses it.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._lock = threading.Lock()
+        # (mtime_ns, body, etag), swapped as a whole on re-render
+        self._state = (None, b'', '')
+
+    def _render(self, mtime):
+        with open(self.index_path, 'rb') as f:
+            body = f.read()
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        self._state = (mtime, body, etag)
+
+    def load(self):
+        """Return ``(body, etag)``, re-reading only if the file changed."""
+        mtime = os.stat(self.index_path).st_mtime_ns
+        state = self._state
+        if state[0] != mtime:
+            with self._lock:
+                state = self._state
+                if state[0] != mtime:
+                    self._render(mtime)
+                    state = self._state
+        return state[1], state[2]
+
+    def warm(self):
+        """Render ahead of the first request when the shell can be built."""
+        try:
+            self.load()
+        except OSError:
+            # Missing build: surface the error on first request instead
+            pass
+
+    def response(self):
+        with timed('shell'):
+            body, etag = self.load()
+        resp = Response(body, mimetype='text/html')
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = 'no-cache'
+        return resp.make_conditional(request)
+
+
+class StaticAssets:
+    """Static file serving with precompressed variants and long-lived caching.
+
+    At startup the static root is scanned for ``.br``/``.gz`` siblings of
+    compressible files (optionally building the missing ones). Requests are
+    answered with the best variant the client accepts, and content-hashed
+    files under ``assets/`` are marked immutable.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        # Relative asset path -> {encoding: relative path of the sibling}
+        self._variants = {}
+
+    def scan(self, build=False):
+        """Index precompressed siblings, creating missing ones if ``build``."""
+        variants = {}
+        for dirpath, _dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                    continue
+                full_path = os.path.join(dirpath, filename)
+                if build:
+                    self._build_siblings(full_path)
+
+                found = {}
+                for encoding, suffix in ENCODINGS:
+                    if os.path.exists(full_path + suffix):
+                        rel = os.path.relpath(full_path + suffix, self.root)
+                        found[encoding] = rel.replace(os.sep, '/')
+                if found:
+                    rel = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                    variants[rel] = found
+        self._variants = variants
+        return variants
+
+    def _build_siblings(self, full_path):
+        stat = os.stat(full_path)
+        if stat.st_size < MIN_COMPRESS_SIZE:
+            return
+
+        compressors = {'gzip': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressors['br'] = lambda data: brotli.compress(data, quality=11)
+
+        data = None
+        for encoding, suffix in ENCODINGS:
+            compress = compressors.get(encoding)
+            target = full_path + suffix
+            if compress is None:
+                continue
+            if os.path.exists(target) and os.stat(target).st_mtime_ns >= stat.st_mtime_ns:
+                continue
+            if data is None:
+                with open(full_path, 'rb') as f:
+                    data = f.read()
+            compressed = compress(data)
+            # Not worth a variant if it barely shrinks the file
+            if len(compressed) >= len(data) * 0.95:
+                continue
+            tmp_path = f'{target}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, target)
+
+    def negotiate(self, path):
+        """Return ``(encoding, sibling_path)`` for the request, or ``(None, path)``."""
+        variants = self._variants.get(path)
+        if variants:
+            accepted = request.accept_encodings
+            for encoding, _suffix in ENCODINGS:
+                if encoding in variants and accepted.quality(encoding) > 0:
+                    return encoding, variants[encoding]
+        return None, path
+
+    def send(self, path):
+        encoding, file_path = self.negotiate(path)
+        if encoding:
+            mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            resp = send_from_directory(self.root, file_path, mimetype=mimetype)
+            resp.headers['Content-Encoding'] = encoding
+        else:
+            resp = send_from_directory(self.root, path)
+
+        if path in self._variants:
+            resp.vary.add('Accept-Encoding')
+        if HASHED_ASSET_RE.match(path):
+            resp.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return resp
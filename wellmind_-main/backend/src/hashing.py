@@ -0,0 +1,118 @@
+"""Password hashing on a bounded process pool.
+
+scrypt/pbkdf2 hashing holds the GIL for tens of milliseconds, so running it
+on the request thread stalls every other request on the worker. Hashes are
+computed in a small process pool instead. The number of hashes in flight
+per worker is capped, and when the cap is reached callers get
+``HashPoolBusy``, which the auth routes turn into a 503 with Retry-After.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from flask import current_app, jsonify
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from src.metrics import timed
+
+DEFAULT_HASH_METHOD = 'scrypt:32768:8:1'
+
+
+class HashPoolBusy(Exception):
+    """Raised when the hashing queue of this worker is full."""
+
+    def __init__(self, retry_after=1):
+        super().__init__('Password hashing queue is full')
+        self.retry_after = retry_after
+
+
+def busy_response(exc):
+    resp = jsonify({'error': 'Server busy, please retry shortly'})
+    resp.status_code = 503
+    resp.headers['Retry-After'] = str(exc.retry_after)
+    return resp
+
+
+@lru_cache(maxsize=8)
+def stored_method(method):
+    """The method prefix werkzeug writes for ``method`` (e.g. 'pbkdf2:sha256:1000000')."""
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+class _HashPool:
+    """Per-app pool state. The executor is created lazily in each process."""
+
+    def __init__(self, method, workers, max_pending, timeout, retry_after):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        if self.workers <= 0:
+            return None
+        # A pool inherited through fork (e.g. gunicorn preload) is unusable
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashPoolBusy(self.retry_after)
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                return fn(*args)
+            return executor.submit(fn, *args).result(timeout=self.timeout)
+        finally:
+            self._slots.release()
+
+
+class PasswordHasher:
+    """Flask extension exposing pooled ``hash``/``verify``/``needs_rehash``."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1))
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 32)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+        app.config.setdefault('PASSWORD_HASH_RETRY_AFTER', 1)
+        app.extensions['password_hasher'] = _HashPool(
+            method=app.config['PASSWORD_HASH_METHOD'],
+            workers=app.config['PASSWORD_HASH_WORKERS'],
+            max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+            timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+            retry_after=app.config['PASSWORD_HASH_RETRY_AFTER'],
+        )
+
+    @property
+    def _pool(self):
+        return current_app.extensions['password_hasher']
+
+    def hash(self, password):
+        pool = self._pool
+        with timed('hash'):
+            return pool.run(generate_password_hash, password, pool.method)
+
+    def verify(self, pwhash, password):
+        with timed('hash'):
+            return self._pool.run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if ``pwhash`` was made with other parameters than configured."""
+        return pwhash.split('$', 1)[0] != stored_method(self._pool.method)
@@ -0,0 +1,253 @@
+"""Low-overhead request instrumentation.
+
+Every request gets a small timings record. SQLAlchemy cursor events add
+query counts and time to it, and ``timed()`` blocks add named components
+(password hashing, JSON encoding, the SPA shell). The record is emitted as
+a ``Server-Timing`` header and folded into per-endpoint histograms, which
+``/api/metrics`` exposes in the Prometheus text format.
+
+Metrics are kept per worker process. Scrape each worker, or aggregate them
+upstream.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import Response, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+_current = ContextVar('wellmind_request_timings', default=None)
+
+
+class _RequestTimings:
+    __slots__ = ('started', 'queries', 'query_time', 'components', 'lock')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.components = {}
+        # Sharded reads update the record from several threads (sharding.fan_out)
+        self.lock = threading.Lock()
+
+
+@contextmanager
+def timed(component):
+    """Attribute the enclosed time to ``component`` of the current request."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with timings.lock:
+            timings.components[component] = timings.components.get(component, 0.0) + elapsed
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Per-endpoint histograms and counters, guarded by a single lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}         # endpoint -> Histogram (seconds)
+        self.query_counts = {}    # endpoint -> Histogram (queries per request)
+        self.query_time = {}      # endpoint -> seconds spent in SQL
+        self.responses = {}       # (endpoint, method, status) -> count
+        self.components = {}      # (endpoint, component) -> seconds
+        self.job_runs = {}        # (job, outcome) -> count
+        self.job_seconds = {}     # (job, phase) -> seconds
+        self.job_rows = {}        # (job, table) -> rows processed
+        self.job_last_success = {}  # job -> unix time
+
+    def record(self, endpoint, method, status, duration, timings):
+        with self._lock:
+            hist = self.latency.get(endpoint)
+            if hist is None:
+                hist = self.latency[endpoint] = Histogram(LATENCY_BUCKETS)
+                self.query_counts[endpoint] = Histogram(QUERY_COUNT_BUCKETS)
+                self.query_time[endpoint] = 0.0
+            hist.observe(duration)
+            self.query_counts[endpoint].observe(timings.queries)
+            self.query_time[endpoint] += timings.query_time
+            key = (endpoint, method, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+            for component, seconds in timings.components.items():
+                ckey = (endpoint, component)
+                self.components[ckey] = self.components.get(ckey, 0.0) + seconds
+
+    def record_job(self, job, outcome, phases, rows):
+        """Fold one background job run into the job counters.
+
+        ``phases`` maps phase name to seconds, ``rows`` maps table to rows.
+        """
+        with self._lock:
+            key = (job, outcome)
+            self.job_runs[key] = self.job_runs.get(key, 0) + 1
+            for phase, seconds in phases.items():
+                pkey = (job, phase)
+                self.job_seconds[pkey] = self.job_seconds.get(pkey, 0.0) + seconds
+            for table, count in rows.items():
+                rkey = (job, table)
+                self.job_rows[rkey] = self.job_rows.get(rkey, 0) + count
+            if outcome == 'success':
+                self.job_last_success[job] = time.time()
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines.append('# HELP wellmind_request_duration_seconds Request latency by endpoint.')
+            lines.append('# TYPE wellmind_request_duration_seconds histogram')
+            for endpoint, hist in sorted(self.latency.items()):
+                lines.extend(_histogram_lines('wellmind_request_duration_seconds', endpoint, hist))
+
+            lines.append('# HELP wellmind_db_queries_per_request SQL statements executed per request.')
+            lines.append('# TYPE wellmind_db_queries_per_request histogram')
+            for endpoint, hist in sorted(self.query_counts.items()):
+                lines.extend(_histogram_lines('wellmind_db_queries_per_request', endpoint, hist))
+
+            lines.append('# HELP wellmind_db_seconds_total Time spent executing SQL by endpoint.')
+            lines.append('# TYPE wellmind_db_seconds_total counter')
+            for endpoint, seconds in sorted(self.query_time.items()):
+                lines.append(f'wellmind_db_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+
+            lines.append('# HELP wellmind_component_seconds_total Time spent in instrumented components.')
+            lines.append('# TYPE wellmind_component_seconds_total counter')
+            for (endpoint, component), seconds in sorted(self.components.items()):
+                lines.append(
+                    f'wellmind_component_seconds_total{{endpoint="{endpoint}",component="{component}"}} {seconds:.6f}'
+                )
+
+            lines.append('# HELP wellmind_responses_total Responses by endpoint, method and status.')
+            lines.append('# TYPE wellmind_responses_total counter')
+            for (endpoint, method, status), count in sorted(self.responses.items()):
+                lines.append(
+                    f'wellmind_responses_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}'
+                )
+
+            lines.append('# HELP wellmind_job_runs_total Background job runs by outcome.')
+            lines.append('# TYPE wellmind_job_runs_total counter')
+            for (job, outcome), count in sorted(self.job_runs.items()):
+                lines.append(f'wellmind_job_runs_total{{job="{job}",outcome="{outcome}"}} {count}')
+
+            lines.append('# HELP wellmind_job_seconds_total Time spent in background job phases.')
+            lines.append('# TYPE wellmind_job_seconds_total counter')
+            for (job, phase), seconds in sorted(self.job_seconds.items()):
+                lines.append(f'wellmind_job_seconds_total{{job="{job}",phase="{phase}"}} {seconds:.6f}')
+
+            lines.append('# HELP wellmind_job_rows_total Rows processed by background jobs.')
+            lines.append('# TYPE wellmind_job_rows_total counter')
+            for (job, table), count in sorted(self.job_rows.items()):
+                lines.append(f'wellmind_job_rows_total{{job="{job}",table="{table}"}} {count}')
+
+            lines.append('# HELP wellmind_job_last_success_timestamp_seconds End of the last successful run.')
+            lines.append('# TYPE wellmind_job_last_success_timestamp_seconds gauge')
+            for job, stamp in sorted(self.job_last_success.items()):
+                lines.append(f'wellmind_job_last_success_timestamp_seconds{{job="{job}"}} {stamp:.3f}')
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(name, endpoint, hist):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(hist.buckets, hist.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="+Inf"}} {hist.count}')
+    lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {hist.sum:.6f}')
+    lines.append(f'{name}_count{{endpoint="{endpoint}"}} {hist.count}')
+    return lines
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with encoding time reported as ``json``."""
+
+    def dumps(self, obj, **kwargs):
+        with timed('json'):
+            return super().dumps(obj, **kwargs)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('wellmind_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = _current.get()
+    if timings is None:
+        return
+    starts = conn.info.get('wellmind_query_start')
+    elapsed = time.perf_counter() - starts.pop() if starts else 0.0
+    with timings.lock:
+        timings.query_time += elapsed
+        timings.queries += 1
+
+
+class Metrics:
+    """Flask extension wiring the request hooks, SQL listeners and /api/metrics."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        registry = MetricsRegistry()
+        app.extensions['metrics'] = registry
+        app.json = TimedJSONProvider(app)
+
+        @app.before_request
+        def _start_request_timings():
+            _current.set(_RequestTimings())
+
+        @app.after_request
+        def _record_request_timings(response):
+            timings = _current.get()
+            if timings is None:
+                return response
+            duration = time.perf_counter() - timings.started
+            endpoint = request.endpoint or 'unmatched'
+            registry.record(endpoint, request.method, response.status_code, duration, timings)
+
+            parts = [f'db;dur={timings.query_time * 1000:.2f};desc="{timings.queries} queries"']
+            parts.extend(f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings.components.items())
+            parts.append(f'total;dur={duration * 1000:.2f}')
+            response.headers['Server-Timing'] = ', '.join(parts)
+            return response
+
+        @app.teardown_request
+        def _clear_request_timings(exc):
+            # Worker threads are reused across requests; don't leak the record
+            _current.set(None)
+
+        app.add_url_rule('/api/metrics', 'metrics', lambda: Response(
+            registry.render(), mimetype='text/plain; version=0.0.4'
+        ))
+
+    def instrument_engine(self, engine):
+        """Count and time the SQL executed by ``engine`` per request."""
+        if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
@@ -0,0 +1,94 @@
+"""Versioned schema migrations for existing SQLite databases.
+
+``db.create_all()`` only creates missing tables, so changes to tables that
+already exist are applied here. The applied version is tracked in SQLite's
+``PRAGMA user_version``.
+"""
+from sqlalchemy import inspect
+
+from src.analytics import rebuild_sketches
+from src.extensions import db
+from src.models import user as _user  # noqa: F401  (registers the user table)
+from src.models.mood import Mood, MoodLevel, TestResult
+from src.rollups import rebuild_rollups
+from src.search import rebuild_search_index
+
+
+def _migrate_mood_level_to_smallint(conn):
+    """Rebuild ``mood`` with an integer ``mood_level`` and add the list indexes."""
+    columns = {col['name']: col for col in inspect(conn).get_columns('mood')}
+    if 'VARCHAR' in str(columns['mood_level']['type']).upper():
+        # SQLite can't change a column's type in place: copy into a new table
+        conn.exec_driver_sql('ALTER TABLE mood RENAME TO _mood_old')
+        Mood.__table__.create(conn)
+        cases = ' '.join(f"WHEN '{level.name}' THEN {int(level)}" for level in MoodLevel)
+        conn.exec_driver_sql(
+            'INSERT INTO mood (id, user_id, mood_level, notes, date_created) '
+            f'SELECT id, user_id, CASE mood_level {cases} ELSE {int(MoodLevel.neutral)} END, '
+            'notes, date_created FROM _mood_old'
+        )
+        conn.exec_driver_sql('DROP TABLE _mood_old')
+
+    for index in list(Mood.__table__.indexes) + list(TestResult.__table__.indexes):
+        index.create(conn, checkfirst=True)
+
+
+def _backfill_mood_rollups(conn):
+    """Populate ``mood_rollup`` from the moods saved before it existed."""
+    rebuild_rollups(conn)
+
+
+def _index_mood_notes(conn):
+    """Create the ``mood_fts`` search index and its triggers, and fill it."""
+    rebuild_search_index(conn)
+
+
+def _backfill_score_sketches(conn):
+    """Populate ``score_sketch_bucket`` from the test results saved before it existed."""
+    rebuild_sketches(conn)
+
+
+# (version, migration) pairs, applied in order
+MIGRATIONS = [
+    (1, _migrate_mood_level_to_smallint),
+    (2, _backfill_mood_rollups),
+    (3, _index_mood_notes),
+    (4, _backfill_score_sketches),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def run_migrations(engine):
+    """Bring the database up to SCHEMA_VERSION. Returns the applied versions."""
+    if engine.dialect.name != 'sqlite':
+        return []
+
+    applied = []
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        # Take the write lock up front so concurrent workers migrate only once
+        conn.exec_driver_sql('BEGIN IMMEDIATE')
+        try:
+            version = conn.exec_driver_sql('PRAGMA user_version').scalar()
+            for target, migrate in MIGRATIONS:
+                if version < target:
+                    migrate(conn)
+                    applied.append(target)
+                    version = target
+            if applied:
+                conn.exec_driver_sql(f'PRAGMA user_version = {version}')
+            conn.exec_driver_sql('COMMIT')
+        except Exception:
+            conn.exec_driver_sql('ROLLBACK')
+            raise
+    return applied
+
+
+def init_schema(engine):
+    """Create missing tables, then run pending migrations.
+
+    Kept out of ``create_app`` so that schema introspection and DDL run once
+    per deploy (``flask --app main init-db``) instead of on every worker boot.
+    """
+    db.metadata.create_all(engine)
+    return run_migrations(engine)
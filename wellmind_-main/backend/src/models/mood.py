@@ -1,26 +1,96 @@
+import enum
 from datetime import datetime, timezone
+from sqlalchemy import DDL, event
+from sqlalchemy.orm import validates
 from src.extensions import db
+from src.search import DROP_SEARCH_DDL, SEARCH_DDL
+
+
+class MoodLevel(enum.IntEnum):
+    # Member names are the API's mood_level strings, values are the 1-5 scale
+    very_sad = 1
+    sad = 2
+    neutral = 3
+    happy = 4
+    very_happy = 5
+
+
+# Level names indexed by the stored 1-5 value, for serializing raw rows
+MOOD_LEVEL_NAMES = (None,) + tuple(level.name for level in MoodLevel)
+
+
+def parse_mood_level(value):
+    """Return the MoodLevel for a 1-5 int or a level name, None if invalid."""
+    if isinstance(value, int):
+        try:
+            return MoodLevel(value)
+        except ValueError:
+            return None
+    if isinstance(value, str):
+        return MoodLevel.__members__.get(value)
+    return None
+
+
+class MoodLevelType(db.TypeDecorator):
+    """Stores a MoodLevel as a SMALLINT and loads it back as the enum."""
+    impl = db.SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        level = parse_mood_level(value)
+        if level is None:
+            raise ValueError(f'Invalid mood level: {value!r}')
+        return int(level)
+
+    def process_result_value(self, value, dialect):
+        return MoodLevel(value) if value is not None else None
+
 
 class Mood(db.Model):
+    __table_args__ = (
+        db.Index('ix_mood_user_id_date_created', 'user_id', 'date_created'),
+        db.Index('ix_mood_date_created', 'date_created'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Allow anonymous mood tracking
-    mood_level = db.Column(db.String(20), nullable=False)  # 'very_happy', 'happy', 'neutral', 'sad', 'very_sad'
+    mood_level = db.Column(MoodLevelType, nullable=False)  # MoodLevel, 1 (very_sad) .. 5 (very_happy)
     notes = db.Column(db.Text, nullable=True)
     date_created = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     
     def __repr__(self):
-        return f'<Mood {self.mood_level} on {self.date_created}>'
+        return f'<Mood {self.mood_level.name} on {self.date_created}>'
+
+    @validates('mood_level')
+    def _coerce_mood_level(self, key, value):
+        level = parse_mood_level(value)
+        if level is None:
+            raise ValueError(f'Invalid mood level: {value!r}')
+        return level
     
     def to_dict(self):
         return {
             'id': self.id,
             'user_id': self.user_id,
-            'mood_level': self.mood_level,
+            'mood_level': self.mood_level.name,
             'notes': self.notes,
             'date_created': self.date_created.isoformat() if self.date_created else None
         }
 
+# The notes full-text index lives and dies with the mood table
+for _statement in SEARCH_DDL:
+    event.listen(Mood.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(Mood.__table__, 'before_drop', DDL(DROP_SEARCH_DDL).execute_if(dialect='sqlite'))
+
+
 class TestResult(db.Model):
+    __table_args__ = (
+        db.Index('ix_test_result_user_id_date_created', 'user_id', 'date_created'),
+        db.Index('ix_test_result_date_created', 'date_created'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Allow anonymous test taking
     test_type = db.Column(db.String(50), nullable=False)  # 'depression', 'anxiety', 'stress', etc.
@@ -41,3 +111,53 @@ class TestResult(db.Model):
             'date_created': self.date_created.isoformat() if self.date_created else None
         }
 
+
+class MoodRollup(db.Model):
+    """Pre-aggregated mood statistics per user per day/week bucket.
+
+    ``user_key`` is the user id, 0 for anonymous entries and -1 for the
+    all-users total. Maintained incrementally by ``src.rollups``.
+    """
+    __tablename__ = 'mood_rollup'
+
+    user_key = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(4), primary_key=True)  # 'day' or 'week'
+    period_start = db.Column(db.Date, primary_key=True)  # the day, or the Monday of the week
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    min_level = db.Column(db.SmallInteger, nullable=False)
+    max_level = db.Column(db.SmallInteger, nullable=False)
+    level_1 = db.Column(db.Integer, nullable=False, default=0)
+    level_2 = db.Column(db.Integer, nullable=False, default=0)
+    level_3 = db.Column(db.Integer, nullable=False, default=0)
+    level_4 = db.Column(db.Integer, nullable=False, default=0)
+    level_5 = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<MoodRollup {self.user_key} {self.period} {self.period_start}: {self.count}>'
+
+    def to_dict(self):
+        return {
+            'start': self.period_start.isoformat(),
+            'count': self.count,
+            'average': round(self.total / self.count, 2) if self.count else None,
+            'min': self.min_level,
+            'max': self.max_level,
+            'histogram': {str(level): getattr(self, f'level_{level}') for level in range(1, 6)},
+        }
+
+
+class ScoreSketchBucket(db.Model):
+    """One bucket of a per-test-type score distribution sketch.
+
+    ``bucket`` is the sketch index of the score (see ``src.analytics``).
+    Maintained incrementally as test results are saved.
+    """
+    __tablename__ = 'score_sketch_bucket'
+
+    test_type = db.Column(db.String(50), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ScoreSketchBucket {self.test_type} {self.bucket}: {self.count}>'
@@ -1,5 +1,4 @@
-from src.extensions import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from src.extensions import db, password_hasher
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -8,10 +7,13 @@ class User(db.Model):
     password_hash = db.Column(db.String(128), nullable=False)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
 
     def to_dict(self):
         return {
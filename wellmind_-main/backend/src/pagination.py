@@ -0,0 +1,135 @@
+"""Keyset (cursor) pagination helpers for the list endpoints.
+
+Pages are fetched with ``WHERE (key) < (last key) ORDER BY key LIMIT n``
+instead of OFFSET, so every page costs the same at any depth. The position
+is handed to clients as an opaque, URL-safe cursor token.
+"""
+import base64
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+
+from flask import current_app, request
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+# Response headers browsers need CORS permission to read
+PAGINATION_HEADERS = ['X-Next-Cursor', 'Link']
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(values, list):
+        raise InvalidCursor('Invalid cursor')
+    return values
+
+
+def get_page_size(default=DEFAULT_PAGE_SIZE, max_size=None):
+    """Read ``?limit=`` clamped to 1..``max_size`` (default PAGE_SIZE_MAX from app config)."""
+    if max_size is None:
+        max_size = current_app.config.get('PAGE_SIZE_MAX', MAX_PAGE_SIZE)
+    limit = request.args.get('limit', type=int)
+    if limit is None:
+        return min(default, max_size)
+    return max(1, min(limit, max_size))
+
+
+def get_cursor():
+    token = request.args.get('cursor')
+    return decode_cursor(token) if token else None
+
+
+def paginate_by_date(query, date_column, id_column, limit, cursor=None):
+    """Newest-first page ordered by ``(date_column, id_column)``.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    if cursor is not None:
+        try:
+            last_date, last_id = cursor
+            last_id = int(last_id)
+            last_date = datetime.fromisoformat(last_date) if last_date is not None else None
+        except (TypeError, ValueError):
+            raise InvalidCursor('Invalid cursor')
+
+        if last_date is None:
+            # NULL dates sort last in DESC order
+            query = query.filter(and_(date_column.is_(None), id_column < last_id))
+        else:
+            query = query.filter(or_(
+                date_column < last_date,
+                and_(date_column == last_date, id_column < last_id),
+                date_column.is_(None),
+            ))
+
+    rows = query.order_by(date_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _date_cursor(rows[-1], date_column.key, id_column.key)
+    return rows, next_cursor
+
+
+def _date_cursor(row, date_key, id_key):
+    last_date = getattr(row, date_key)
+    return encode_cursor([last_date.isoformat() if last_date is not None else None, getattr(row, id_key)])
+
+
+def merge_date_pages(pages, limit, date_key='date_created', id_key='id'):
+    """Merge ``paginate_by_date`` pages of the same query run on several databases.
+
+    Ids must be unique across the databases. Returns ``(rows, next_cursor)``.
+    """
+    def sort_key(row):
+        row_date = getattr(row, date_key)
+        # Same order as paginate_by_date: newest first, NULL dates last
+        return (row_date is not None, row_date or datetime.min, getattr(row, id_key))
+
+    rows = sorted((row for page_rows, _ in pages for row in page_rows), key=sort_key, reverse=True)
+    next_cursor = None
+    if len(rows) > limit or any(cursor for _, cursor in pages):
+        rows = rows[:limit]
+        next_cursor = _date_cursor(rows[-1], date_key, id_key) if rows else None
+    return rows, next_cursor
+
+
+def paginate_by_id(query, id_column, limit, cursor=None):
+    """Ascending page ordered by ``id_column``. Returns ``(rows, next_cursor)``."""
+    if cursor is not None:
+        try:
+            (last_id,) = cursor
+            last_id = int(last_id)
+        except (TypeError, ValueError):
+            raise InvalidCursor('Invalid cursor')
+        query = query.filter(id_column > last_id)
+
+    rows = query.order_by(id_column.asc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], id_column.key)])
+    return rows, next_cursor
+
+
+def add_pagination_headers(resp, next_cursor):
+    """Expose the next page through ``X-Next-Cursor`` and a ``Link`` header."""
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        resp.headers['X-Next-Cursor'] = next_cursor
+        resp.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return resp
@@ -0,0 +1,200 @@
+"""Token-bucket rate limiting for the auth and write endpoints.
+
+Each limit such as ``10/minute`` is a bucket of 10 tokens that refills at
+10 tokens per minute. A request takes one token from its client-IP
+bucket and, when authenticated, from its user bucket. An empty bucket
+answers 429 with ``Retry-After``. Responses carry ``RateLimit-Limit``,
+``RateLimit-Remaining`` and ``RateLimit-Reset`` (IETF draft headers) for
+the most constrained bucket.
+
+Defaults are set per route with ``@rate_limit`` and can be overridden per
+endpoint through the RATELIMITS config (``{'user.login': '5/minute'}``).
+
+Stores (RATELIMIT_BACKEND):
+
+- ``memory``: buckets live in the worker, spread over lock stripes so
+  concurrent requests rarely contend. With N workers a client effectively
+  gets up to N times the limit.
+- ``sqlite``: buckets in a SQLite file shared by the workers on the host
+  (RATELIMIT_STORAGE_PATH), for exact limits across workers.
+"""
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache, wraps
+
+from flask import current_app, g, jsonify, make_response, request
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$')
+
+
+@lru_cache(maxsize=None)
+def parse_limit(spec):
+    """``'10/minute'`` or ``'100/15minutes'`` -> ``(capacity, period_seconds)``."""
+    match = _LIMIT_RE.match(spec)
+    if not match:
+        raise ValueError(f'Invalid rate limit: {spec!r}')
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[unit]
+
+
+def _refill(tokens, updated, capacity, rate, now):
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+class MemoryBucketStore:
+    """Token buckets in a dict per lock stripe, as ``key -> (tokens, updated, full_at)``."""
+
+    def __init__(self, stripes=64, max_keys_per_stripe=4096):
+        self._stripes = [(threading.Lock(), {}) for _ in range(stripes)]
+        self._max_keys = max_keys_per_stripe
+
+    def consume(self, key, capacity, rate, now=None):
+        """Take one token. Returns ``(allowed, tokens_left)``."""
+        now = time.monotonic() if now is None else now
+        lock, buckets = self._stripes[hash(key) % len(self._stripes)]
+        with lock:
+            bucket = buckets.get(key)
+            tokens = capacity if bucket is None else _refill(bucket[0], bucket[1], capacity, rate, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            if bucket is None and len(buckets) > self._max_keys:
+                # A bucket that has refilled completely is the same as no bucket
+                for stale in [k for k, (_, _, full_at) in buckets.items() if full_at <= now]:
+                    del buckets[stale]
+        return allowed, tokens
+
+    def clear(self):
+        for lock, buckets in self._stripes:
+            with lock:
+                buckets.clear()
+
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file shared by the workers on one host."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS rate_bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+        )
+
+    @property
+    def _conn(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            local.conn.execute('PRAGMA synchronous=NORMAL')
+            local.pid = os.getpid()
+        return local.conn
+
+    def consume(self, key, capacity, rate, now=None):
+        # Wall clock: the monotonic clock is not shared between processes
+        now = time.time() if now is None else now
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM rate_bucket WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else _refill(row[0], row[1], capacity, rate, now)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO rate_bucket (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, tokens
+
+    def clear(self):
+        self._conn.execute('DELETE FROM rate_bucket')
+
+
+def _client_keys(kinds):
+    keys = []
+    for kind in kinds:
+        if kind == 'ip':
+            keys.append(f'ip:{request.remote_addr}')
+        elif kind == 'user' and g.get('user_id') is not None:
+            keys.append(f'user:{g.user_id}')
+    return keys
+
+
+def rate_limit(default, per=('ip', 'user')):
+    """Limit the decorated view to ``default`` (e.g. ``'10/minute'``) per client.
+
+    ``per`` names the buckets a request draws from: ``ip`` and/or ``user``
+    (the authenticated user, so place this under ``@auth_optional``).
+    """
+    parse_limit(default)  # fail at import time on a malformed default
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            limiter = current_app.extensions.get('rate_limiter')
+            if limiter is None:
+                return view(*args, **kwargs)
+            spec = current_app.config['RATELIMITS'].get(request.endpoint, default)
+            capacity, period = parse_limit(spec)
+            rate = capacity / period
+
+            remaining = capacity
+            for key in _client_keys(per):
+                allowed, tokens = limiter.consume(f'{request.endpoint}:{key}', capacity, rate)
+                remaining = min(remaining, tokens)
+                if not allowed:
+                    retry_after = math.ceil((1 - tokens) / rate)
+                    resp = jsonify({'error': 'Too many requests', 'retry_after': retry_after})
+                    resp.status_code = 429
+                    resp.headers['Retry-After'] = str(retry_after)
+                    break
+            else:
+                resp = make_response(view(*args, **kwargs))
+
+            resp.headers['RateLimit-Limit'] = str(capacity)
+            resp.headers['RateLimit-Remaining'] = str(int(remaining))
+            resp.headers['RateLimit-Reset'] = str(math.ceil((capacity - remaining) / rate))
+            resp.headers['RateLimit-Policy'] = f'{capacity};w={period}'
+            return resp
+        return wrapper
+    return decorator
+
+
+class RateLimiter:
+    """Flask extension holding the bucket store."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_BACKEND', 'memory')
+        app.config.setdefault('RATELIMIT_STORAGE_PATH', None)
+        app.config.setdefault('RATELIMITS', {})
+        for spec in app.config['RATELIMITS'].values():
+            parse_limit(spec)
+
+        if not app.config['RATELIMIT_ENABLED']:
+            return
+        backend = app.config['RATELIMIT_BACKEND']
+        if backend == 'memory':
+            store = MemoryBucketStore()
+        elif backend == 'sqlite':
+            if not app.config['RATELIMIT_STORAGE_PATH']:
+                raise ValueError('RATELIMIT_STORAGE_PATH is required for the sqlite rate limit store')
+            store = SQLiteBucketStore(app.config['RATELIMIT_STORAGE_PATH'])
+        else:
+            raise ValueError(f'Unknown RATELIMIT_BACKEND: {backend!r}')
+        app.extensions['rate_limiter'] = store
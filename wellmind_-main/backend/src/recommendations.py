@@ -0,0 +1,184 @@
+"""Mood-note recommendations, ported from ``getSmartRecommendation`` in App.jsx.
+
+All keyword categories are compiled into a single Aho-Corasick automaton,
+so a note is scanned once regardless of how many keywords there are.
+Matching is case-insensitive on substrings, like the frontend's regexes.
+The matched categories are then scored against the mood level to pick a
+recommendation.
+"""
+from collections import deque
+
+# Category -> keywords (substring matches, as in the frontend)
+KEYWORDS = {
+    'stress': ('stress', 'pressure', 'overwhelm', 'busy', 'work', 'exam', 'deadline'),
+    'sadness': ('sad', 'depressed', 'down', 'lonely', 'empty', 'hopeless'),
+    'anxiety': ('anxious', 'worry', 'nervous', 'panic', 'fear', 'scared'),
+    'relationship': ('friend', 'family', 'relationship', 'fight', 'argument', 'conflict'),
+    'sleep': ('tired', 'sleep', 'insomnia', 'exhausted', 'fatigue'),
+}
+CATEGORIES = tuple(KEYWORDS)
+
+RECOMMENDATIONS = {
+    'crisis_support': {
+        'title': "You're feeling overwhelmed - take one step",
+        'message': "When everything seems difficult, focus on one small thing you can control right now. You don't need to solve everything today.",
+        'action': 'Take 5 deep breaths and write down one thing you can do in the next hour',
+        'tips': ['Remember: this feeling is temporary', "You've overcome difficult times before", "It's okay to ask for help"],
+    },
+    'emotional_support': {
+        'title': 'Your feelings are valid',
+        'message': "It's completely natural to feel this way sometimes. You're not alone, and this difficult period will pass.",
+        'action': 'Reach out to someone you trust - a friend, family member, or counselor',
+        'tips': ["Your worth isn't determined by how you feel today", 'Small acts of self-care matter', 'Tomorrow is a new opportunity'],
+    },
+    'general_support': {
+        'title': "You're not alone",
+        'message': 'Having a very difficult day is part of being human. Be kind to yourself and remember that you matter.',
+        'action': 'Focus on basic needs: drink water, eat something, and rest if possible',
+        'tips': ['This feeling will pass', "You're stronger than you think", 'Consider talking to someone you trust'],
+    },
+    'stress_management': {
+        'title': 'Managing stress',
+        'message': "Stress is your body's way of responding to challenges. Let's work on some strategies to help you feel more in control.",
+        'action': 'Try the 4-7-8 breathing technique: inhale for 4, hold for 7, exhale for 8',
+        'tips': ['Break large tasks into smaller steps', 'Take regular breaks throughout your day', "Remember you can only control what's within your power"],
+    },
+    'anxiety_relief': {
+        'title': 'Calming the anxious mind',
+        'message': 'Anxiety can be exhausting, but there are ways to ground yourself and find peace in the present moment.',
+        'action': 'Use the 5-4-3-2-1 technique: name 5 things you see, 4 you can touch, 3 you hear, 2 you smell, 1 you taste',
+        'tips': ['Anxiety is temporary and will pass', 'Focus on what you can control right now', 'Practice self-compassion'],
+    },
+    'mood_lifting': {
+        'title': 'Gentle steps forward',
+        'message': 'Bad days happen to everyone. What matters is how we take care of ourselves during them.',
+        'action': 'Do something small that brings you joy - listen to a favorite song, call a friend, or take a short walk',
+        'tips': ['Every new day is a fresh start', 'Small progress is still progress', 'You deserve kindness and care'],
+    },
+    'maintenance': {
+        'title': 'Maintaining balance',
+        'message': "You're in a neutral place today. This is a good time to focus on self-care and activities that nourish your soul.",
+        'action': "Take some time to reflect on what you're grateful for today",
+        'tips': ['Ordinary days matter too', "Use this time to plan something you're looking forward to", 'Connect with friends or family'],
+    },
+    'positive_momentum': {
+        'title': 'Building on positive energy',
+        'message': "You're feeling good today! This is a great time to do things that bring you joy or work on your goals.",
+        'action': "Think about doing something kind for someone else - it can multiply your positive feelings",
+        'tips': ['Celebrate small victories', 'Share your positive energy with others', 'Use this energy to plan for the future'],
+    },
+    'peak_wellness': {
+        'title': "You're at your peak!",
+        'message': "What a wonderful day! You're feeling content and happy. This is a perfect time to reflect on what makes you feel this great.",
+        'action': 'Write in a journal about what made your day wonderful - it can help you in future difficult days',
+        'tips': ['Remember this feeling for tough times', 'Share your joy with loved ones', 'Use this positive energy to set new goals'],
+    },
+    'general': {
+        'title': 'Daily care',
+        'message': 'Every day is a new opportunity to grow and learn.',
+        'action': 'Take a moment to breathe deeply and appreciate the present moment',
+        'tips': ['Be kind to yourself', 'Small progress matters', "You're doing great work"],
+    },
+}
+
+# Mood level -> (default type, {category: (score, type)}). The highest-scoring
+# matched category wins, which reproduces the frontend's if/else order.
+RULES = {
+    1: ('general_support', {'stress': (2, 'crisis_support'), 'sadness': (1, 'emotional_support')}),
+    2: ('mood_lifting', {'stress': (2, 'stress_management'), 'anxiety': (1, 'anxiety_relief')}),
+    3: ('maintenance', {}),
+    4: ('positive_momentum', {}),
+    5: ('peak_wellness', {}),
+}
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton reporting which categories occur in a text.
+
+    The goto/failure functions are flattened into a full transition table
+    at build time, so scanning does one dict lookup per character.
+    """
+
+    def __init__(self, keywords):
+        self.categories = tuple(keywords)
+        transitions = [{}]
+        outputs = [0]
+        for bit, category in enumerate(self.categories):
+            for word in keywords[category]:
+                state = 0
+                for ch in word.lower():
+                    nxt = transitions[state].get(ch)
+                    if nxt is None:
+                        nxt = len(transitions)
+                        transitions.append({})
+                        outputs.append(0)
+                        transitions[state][ch] = nxt
+                    state = nxt
+                outputs[state] |= 1 << bit
+
+        # Breadth-first: resolve failure links into direct transitions
+        alphabet = {ch for table in transitions for ch in table}
+        fail = [0] * len(transitions)
+        queue = deque()
+        queue.extend(transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] |= outputs[fail[state]]
+            for ch in alphabet:
+                nxt = transitions[state].get(ch)
+                if nxt is None:
+                    # Borrow the failure state's (already complete) transition
+                    target = transitions[fail[state]].get(ch)
+                    if target is not None:
+                        transitions[state][ch] = target
+                else:
+                    fail[nxt] = transitions[fail[state]].get(ch, 0)
+                    queue.append(nxt)
+
+        self._transitions = transitions
+        self._outputs = outputs
+        self._all = (1 << len(self.categories)) - 1
+
+    def scan(self, text):
+        """Bitmask of the categories with at least one keyword in ``text``."""
+        transitions = self._transitions
+        outputs = self._outputs
+        everything = self._all
+        state = 0
+        found = 0
+        for ch in text.lower():
+            state = transitions[state].get(ch, 0)
+            if outputs[state]:
+                found |= outputs[state]
+                if found == everything:
+                    break
+        return found
+
+    def categories_in(self, mask):
+        return [category for bit, category in enumerate(self.categories) if mask >> bit & 1]
+
+
+matcher = KeywordMatcher(KEYWORDS)
+
+
+def recommendation_type(mood_level, notes):
+    """Return ``(type, categories)`` for a 1-5 mood level and its note."""
+    mask = matcher.scan(notes) if notes else 0
+    categories = matcher.categories_in(mask) if mask else []
+    rule = RULES.get(int(mood_level)) if mood_level is not None else None
+    if rule is None:
+        return 'general', categories
+
+    default, scored = rule
+    best_score, best_type = 0, default
+    for category in categories:
+        score, rec_type = scored.get(category, (0, None))
+        if score > best_score:
+            best_score, best_type = score, rec_type
+    return best_type, categories
+
+
+def recommend(mood_level, notes):
+    """Full recommendation dict for one mood entry, like the frontend's."""
+    rec_type, categories = recommendation_type(mood_level, notes)
+    return {'type': rec_type, 'categories': categories, **RECOMMENDATIONS[rec_type]}
@@ -0,0 +1,196 @@
+"""Read-through cache for the mood and test-result list responses.
+
+The serialized response body of ``GET /api/mood`` and
+``GET /api/test-results`` is memoized per caller and query string. Keys
+embed generation tokens. A commit that adds or removes a user's rows
+replaces the generation of that user's lists and of the global list, so
+stale entries are simply never read again and age out of the backend.
+Writes that can't be attributed to one user (bulk Core statements,
+updates) replace the generation of the whole table.
+
+Backends (RESPONSE_CACHE_BACKEND):
+
+- ``memory``: per-process LRU+TTL (TTLCache). Other workers' writes are
+  not seen until RESPONSE_CACHE_TTL expires, so keep the TTL short.
+- ``sqlite``: a SQLite file shared by every worker on the host
+  (RESPONSE_CACHE_PATH), so invalidations are seen by all of them.
+- ``none``: caching disabled (ETags are still sent).
+"""
+import hashlib
+import uuid
+
+from flask import Response, current_app, has_app_context, request
+from sqlalchemy import event
+
+from src.cache import SQLiteCache, TTLCache
+from src.metrics import timed
+from src.pagination import add_pagination_headers
+from src.serialization import dumps
+
+# Table name -> cache namespace
+CACHED_TABLES = {'mood': 'mood', 'test_result': 'test_result'}
+GLOBAL_SCOPE = 'all'
+TABLE_SCOPE = '*'
+
+_INFO_KEY = 'response_cache_invalidations'
+
+
+def _scope(user_id):
+    return GLOBAL_SCOPE if user_id is None else str(user_id)
+
+
+def _new_generation():
+    return uuid.uuid4().hex[:12].encode('ascii')
+
+
+def _etag(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class _NullCache:
+    def get(self, key, default=None):
+        return default
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+def _pending(session):
+    return session.info.setdefault(_INFO_KEY, set())
+
+
+def _after_flush(session, flush_context):
+    pending = _pending(session)
+    for obj in session.new | session.deleted:
+        name = CACHED_TABLES.get(getattr(obj, '__tablename__', None))
+        if name is not None:
+            pending.add((name, _scope(obj.user_id)))
+            pending.add((name, GLOBAL_SCOPE))
+    for obj in session.dirty:
+        name = CACHED_TABLES.get(getattr(obj, '__tablename__', None))
+        if name is not None:
+            pending.add((name, TABLE_SCOPE))
+
+
+def _do_orm_execute(state):
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    table = getattr(state.statement, 'table', None)
+    name = CACHED_TABLES.get(getattr(table, 'name', None))
+    if name is not None:
+        _pending(state.session).add((name, TABLE_SCOPE))
+
+
+def _after_commit(session):
+    pending = session.info.pop(_INFO_KEY, None)
+    if pending and has_app_context():
+        cache = current_app.extensions.get('response_cache')
+        if cache is not None:
+            cache.invalidate(pending)
+
+
+def _after_rollback(session):
+    session.info.pop(_INFO_KEY, None)
+
+
+class _ResponseCacheState:
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+
+    def _generation(self, name, scope):
+        key = f'gen:{name}:{scope}'
+        gen = self.backend.get(key)
+        if gen is None:
+            gen = _new_generation()
+            self.backend.set(key, gen, ttl=self.ttl * 10)
+        return gen.decode('ascii')
+
+    def key(self, name, user_id, query_string):
+        scope = _scope(user_id)
+        return (
+            f'list:{name}:{self._generation(name, TABLE_SCOPE)}:{scope}:'
+            f'{self._generation(name, scope)}:{query_string}'
+        )
+
+    def invalidate(self, pending):
+        for name, scope in pending:
+            self.backend.set(f'gen:{name}:{scope}', _new_generation(), ttl=self.ttl * 10)
+
+
+class ResponseCache:
+    """Flask extension memoizing list responses with commit-time invalidation."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_BACKEND', 'memory')
+        app.config.setdefault('RESPONSE_CACHE_TTL', 30)
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 1024)
+        app.config.setdefault('RESPONSE_CACHE_PATH', None)
+
+        backend_name = app.config['RESPONSE_CACHE_BACKEND']
+        ttl = app.config['RESPONSE_CACHE_TTL']
+        if backend_name == 'memory':
+            backend = TTLCache(maxsize=app.config['RESPONSE_CACHE_SIZE'], ttl=ttl)
+        elif backend_name == 'sqlite':
+            if not app.config['RESPONSE_CACHE_PATH']:
+                raise ValueError('RESPONSE_CACHE_PATH is required for the sqlite response cache')
+            backend = SQLiteCache(app.config['RESPONSE_CACHE_PATH'], ttl=ttl)
+        elif backend_name == 'none':
+            backend = _NullCache()
+        else:
+            raise ValueError(f'Unknown RESPONSE_CACHE_BACKEND: {backend_name!r}')
+        app.extensions['response_cache'] = _ResponseCacheState(backend, ttl)
+
+        # Imported here: this module is loaded by src.extensions
+        from src.extensions import db
+        for name, listener in (
+            ('after_flush', _after_flush),
+            ('do_orm_execute', _do_orm_execute),
+            ('after_commit', _after_commit),
+            ('after_rollback', _after_rollback),
+        ):
+            if not event.contains(db.session, name, listener):
+                event.listen(db.session, name, listener)
+
+    @property
+    def _state(self):
+        return current_app.extensions['response_cache']
+
+    def list_response(self, name, user_id, build):
+        """Serve a list endpoint from the cache, or ``build()`` and store it.
+
+        ``build`` returns ``(payload, next_cursor)``. The response carries
+        a strong ETag and answers ``If-None-Match`` with 304.
+        """
+        state = self._state
+        key = state.key(name, user_id, request.query_string.decode('latin-1'))
+        entry = state.backend.get(key)
+        if entry is not None:
+            etag, next_cursor, body = entry.split(b'\n', 2)
+            etag, next_cursor = etag.decode('ascii'), next_cursor.decode('ascii') or None
+            cache_status = 'HIT'
+        else:
+            payload, next_cursor = build()
+            with timed('json'):
+                body = dumps(payload)
+            etag = _etag(body)
+            state.backend.set(key, b'\n'.join([etag.encode('ascii'), (next_cursor or '').encode('ascii'), body]))
+            cache_status = 'MISS'
+
+        resp = Response(body, mimetype='application/json')
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = 'private, no-cache'
+        resp.headers['X-Cache'] = cache_status
+        resp.vary.add('Authorization')
+        add_pagination_headers(resp, next_cursor)
+        return resp.make_conditional(request)
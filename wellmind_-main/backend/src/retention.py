@@ -0,0 +1,293 @@
+"""Retention and compaction for old mood and test-result rows.
+
+A run moves rows older than the retention horizon out of the database:
+
+1. Rows are read oldest first in batches of RETENTION_BATCH_SIZE and
+   appended to gzip NDJSON archives, one file per table and month
+   (``<RETENTION_ARCHIVE_DIR>/mood/2024-01.ndjson.gz``), in the
+   ``GET /api/export`` record format. Each batch is deleted in its own short
+   transaction after its archive lines are on disk, with a pause between
+   batches so request writers get the lock. A crash between the two steps
+   can leave a batch archived twice, never lost; ``id`` tells duplicates
+   apart.
+2. The freed pages are returned to the file system with
+   ``PRAGMA incremental_vacuum`` (databases created with
+   ``auto_vacuum=INCREMENTAL``), the search index segments are merged and
+   the planner statistics are refreshed with a bounded ``ANALYZE``.
+
+``mood_rollup`` and ``score_sketch_bucket`` are kept, so mood stats and
+test-result percentiles still cover the archived periods. Mood series
+read the days up to the horizon (see ``archived_before``) from the day
+rollups and only later moods raw, so series and stats agree.
+
+RETENTION_DAYS applies to every row and RETENTION_ANONYMOUS_DAYS to rows
+with no user (usually shorter); 0 keeps rows forever. Runs come from
+``flask --app main retention`` or from the in-process scheduler
+(RETENTION_INTERVAL seconds), which takes a file lock so only one worker
+runs at a time and at most once per interval across workers.
+"""
+import fcntl
+import gzip
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, g
+from sqlalchemy import delete, func, or_, select
+
+from src.sharding import bind_key, shard_count
+
+JOB_NAME = 'retention'
+TABLES = ('mood', 'test_result')
+_LOCK_FILE = '.retention.lock'
+_LAST_RUN_FILE = '.retention-last-run'
+
+
+@contextmanager
+def _run_lock(archive_dir):
+    """Non-blocking exclusive lock shared by every process on the host."""
+    os.makedirs(archive_dir, exist_ok=True)
+    with open(os.path.join(archive_dir, _LOCK_FILE), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _horizons(config, now):
+    """``(label, cutoff, anonymous_only)`` passes for the configured horizons."""
+    passes = []
+    if config['RETENTION_ANONYMOUS_DAYS']:
+        passes.append(('anonymous', now - timedelta(days=config['RETENTION_ANONYMOUS_DAYS']), True))
+    if config['RETENTION_DAYS']:
+        passes.append(('all', now - timedelta(days=config['RETENTION_DAYS']), False))
+    return passes
+
+
+def archived_before(config, include_anonymous, now=None):
+    """Cutoff before which rows may already have been archived, or None.
+
+    ``include_anonymous`` covers reads that include rows with no user, which
+    RETENTION_ANONYMOUS_DAYS may archive sooner.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    cutoffs = [
+        cutoff for _, cutoff, anonymous_only in _horizons(config, now) if include_anonymous or not anonymous_only
+    ]
+    return max(cutoffs, default=None)
+
+
+def _append_archive(archive_dir, record_type, records_by_month):
+    """Append records to their monthly archive files and flush them to disk."""
+    from src.serialization import dumps
+
+    table_dir = os.path.join(archive_dir, record_type)
+    os.makedirs(table_dir, exist_ok=True)
+    for month, records in records_by_month.items():
+        path = os.path.join(table_dir, f'{month}.ndjson.gz')
+        # Every append is a new gzip member; concatenated members read as one stream
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                archive.write(b''.join(dumps(record) + b'\n' for record in records))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+
+def _expired(model, cutoff, anonymous_only):
+    condition = model.date_created < cutoff
+    if anonymous_only:
+        condition = condition & model.user_id.is_(None)
+    return condition
+
+
+def _count_expired(session, record_type, passes):
+    from src.routes.export import export_columns
+
+    model, _ = export_columns(record_type)
+    condition = or_(*(_expired(model, cutoff, anonymous_only) for _, cutoff, anonymous_only in passes))
+    return session.scalar(select(func.count()).select_from(model).where(condition))
+
+
+def _purge_table(session, record_type, cutoff, anonymous_only, config):
+    """Archive and delete one table's rows older than ``cutoff``. Returns the row count."""
+    from src.routes.export import export_columns, export_record
+
+    model, columns = export_columns(record_type)
+    condition = _expired(model, cutoff, anonymous_only)
+    batch_size = config['RETENTION_BATCH_SIZE']
+    stmt = select(*columns).where(condition).order_by(model.date_created, model.id).limit(batch_size)
+    total = 0
+    while True:
+        rows = session.execute(stmt).all()
+        if not rows:
+            break
+        records_by_month = {}
+        for row in rows:
+            records_by_month.setdefault(row.date_created.strftime('%Y-%m'), []).append(
+                export_record(record_type, row)
+            )
+        _append_archive(config['RETENTION_ARCHIVE_DIR'], record_type, records_by_month)
+        # ORM-enabled DELETE, so the response cache sees the table change
+        session.execute(
+            delete(model).where(model.id.in_([row.id for row in rows])).execution_options(synchronize_session=False)
+        )
+        session.commit()
+        total += len(rows)
+        current_app.logger.info('retention: %s archived %d rows (%d so far)', record_type, len(rows), total)
+        if len(rows) < batch_size:
+            break
+        time.sleep(config['RETENTION_BATCH_PAUSE'])
+    return total
+
+
+def _compact(engine, config):
+    """Incremental vacuum, FTS segment merge and bounded ANALYZE. Returns pages freed."""
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        freed = 0
+        if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2:  # INCREMENTAL
+            before = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+            conn.exec_driver_sql(f"PRAGMA incremental_vacuum({int(config['RETENTION_VACUUM_PAGES'])})").fetchall()
+            freed = before - conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+        conn.exec_driver_sql("INSERT INTO mood_fts(mood_fts, rank) VALUES ('merge', 500)")
+        # Sample at most ~1000 rows per index instead of scanning the tables
+        conn.exec_driver_sql('PRAGMA analysis_limit=1000')
+        for table in TABLES:
+            conn.exec_driver_sql(f'ANALYZE {table}')
+    return freed
+
+
+def run_retention(dry_run=False, min_interval=0):
+    """Run one retention pass for the current app.
+
+    Returns a report dict, or None if another process holds the run lock
+    or the last run finished less than ``min_interval`` seconds ago. With
+    ``dry_run`` only the eligible rows are counted.
+    """
+    from src.extensions import db
+
+    config = current_app.config
+    passes = _horizons(config, datetime.now(timezone.utc).replace(tzinfo=None))
+    with _run_lock(config['RETENTION_ARCHIVE_DIR']) as acquired:
+        if not acquired or time.time() - _last_run(config['RETENTION_ARCHIVE_DIR']) < min_interval:
+            return None
+        started = time.perf_counter()
+        phases = {}
+        rows = dict.fromkeys(TABLES, 0)
+        outcome = 'error'
+        try:
+            pages_freed = 0
+            # With sharding, every shard file is processed in turn
+            for shard in range(shard_count()) or [None]:
+                if shard is not None:
+                    g.shard = shard
+                if dry_run:
+                    if passes:
+                        for record_type in TABLES:
+                            rows[record_type] += _count_expired(db.session, record_type, passes)
+                    continue
+                for _, cutoff, anonymous_only in passes:
+                    for record_type in TABLES:
+                        phase_started = time.perf_counter()
+                        rows[record_type] += _purge_table(db.session, record_type, cutoff, anonymous_only, config)
+                        phase = f'archive_{record_type}'
+                        phases[phase] = phases.get(phase, 0.0) + time.perf_counter() - phase_started
+
+                phase_started = time.perf_counter()
+                pages_freed += _compact(db.engine if shard is None else db.engines[bind_key(shard)], config)
+                phases['compact'] = phases.get('compact', 0.0) + time.perf_counter() - phase_started
+            if not dry_run:
+                _touch(os.path.join(config['RETENTION_ARCHIVE_DIR'], _LAST_RUN_FILE))
+            outcome = 'success'
+        finally:
+            db.session.rollback()
+            if not dry_run:
+                registry = current_app.extensions.get('metrics')
+                if registry is not None:
+                    registry.record_job(JOB_NAME, outcome, phases, rows)
+
+    return {
+        'dry_run': dry_run,
+        'horizons': {label: cutoff.isoformat() for label, cutoff, _ in passes},
+        'rows': rows,
+        'pages_freed': pages_freed,
+        'phases': {phase: round(seconds, 3) for phase, seconds in phases.items()},
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def _touch(path):
+    with open(path, 'a'):
+        pass
+    os.utime(path)
+
+
+def _last_run(archive_dir):
+    try:
+        return os.path.getmtime(os.path.join(archive_dir, _LAST_RUN_FILE))
+    except OSError:
+        return 0.0
+
+
+class RetentionScheduler:
+    """Flask extension running ``run_retention`` every RETENTION_INTERVAL seconds.
+
+    ``start(app)`` launches the daemon thread in the current process; call
+    it in each worker after forking (see gunicorn.conf.py).
+    """
+
+    def __init__(self, app=None):
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RETENTION_DAYS', 0)
+        app.config.setdefault('RETENTION_ANONYMOUS_DAYS', 0)
+        app.config.setdefault('RETENTION_ARCHIVE_DIR', os.path.join(app.instance_path, 'archive'))
+        app.config.setdefault('RETENTION_BATCH_SIZE', 1000)
+        app.config.setdefault('RETENTION_BATCH_PAUSE', 0.05)
+        app.config.setdefault('RETENTION_VACUUM_PAGES', 2000)
+        app.config.setdefault('RETENTION_INTERVAL', 0)
+
+    def start(self, app):
+        """Start the scheduler thread, unless disabled or already running here."""
+        interval = app.config['RETENTION_INTERVAL']
+        if not interval or not (app.config['RETENTION_DAYS'] or app.config['RETENTION_ANONYMOUS_DAYS']):
+            return False
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return False
+        self._pid = os.getpid()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._loop, args=(app, interval), name='wellmind-retention', daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self, app, interval):
+        # Wake up more often than the interval, so a worker picks the run up
+        # soon after it becomes due even if another worker ran the last one
+        tick = max(1.0, min(interval / 4, 300.0))
+        while not self._stop.wait(tick):
+            if time.time() - _last_run(app.config['RETENTION_ARCHIVE_DIR']) < interval:
+                continue
+            with app.app_context():
+                try:
+                    report = run_retention(min_interval=interval)
+                except Exception:
+                    app.logger.exception('retention run failed')
+                    continue
+                if report is not None:
+                    app.logger.info('retention: %s', report)
@@ -0,0 +1,303 @@
+"""Incremental daily/weekly mood rollups.
+
+Every saved mood updates four ``mood_rollup`` rows (its user's day and week
+bucket plus the all-users day and week bucket) with an upsert in the same
+transaction, so range statistics read a handful of rollup rows instead of
+scanning ``mood``.
+"""
+import calendar
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Integer, cast, func, select, type_coerce
+from sqlalchemy.dialects.sqlite import insert
+
+from src.extensions import db
+from src.models.mood import Mood, MoodLevel, MoodRollup
+from src.sharding import fan_out, shard_count
+
+ANONYMOUS_USER_KEY = 0
+ALL_USERS_KEY = -1
+PERIODS = ('day', 'week')
+
+
+def user_key(user_id):
+    return ANONYMOUS_USER_KEY if user_id is None else user_id
+
+
+def period_start(day, period):
+    """First day of the bucket: the day itself, or the Monday of its week."""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def _utc_day(date_created):
+    if date_created is None:
+        date_created = datetime.now(timezone.utc)
+    elif date_created.tzinfo is not None:
+        date_created = date_created.astimezone(timezone.utc)
+    return date_created.date()
+
+
+def record_moods(session, entries):
+    """Fold ``(user_id, mood_level, date_created)`` entries into the rollups.
+
+    Entries are aggregated per bucket in Python first, then written with a
+    single executemany upsert. Call before committing the moods themselves.
+    """
+    buckets = defaultdict(lambda: {'count': 0, 'total': 0, 'min_level': 5, 'max_level': 1,
+                                   'level_1': 0, 'level_2': 0, 'level_3': 0, 'level_4': 0, 'level_5': 0})
+    for user_id, mood_level, date_created in entries:
+        level = int(MoodLevel(mood_level))
+        day = _utc_day(date_created)
+        for key in (user_key(user_id), ALL_USERS_KEY):
+            for period in PERIODS:
+                bucket = buckets[(key, period, period_start(day, period))]
+                bucket['count'] += 1
+                bucket['total'] += level
+                bucket['min_level'] = min(bucket['min_level'], level)
+                bucket['max_level'] = max(bucket['max_level'], level)
+                bucket[f'level_{level}'] += 1
+
+    if not buckets:
+        return
+
+    rows = [
+        {'user_key': key, 'period': period, 'period_start': start, **values}
+        for (key, period, start), values in buckets.items()
+    ]
+    stmt = insert(MoodRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_key', 'period', 'period_start'],
+        set_={
+            'count': MoodRollup.count + stmt.excluded.count,
+            'total': MoodRollup.total + stmt.excluded.total,
+            'min_level': func.min(MoodRollup.min_level, stmt.excluded.min_level),
+            'max_level': func.max(MoodRollup.max_level, stmt.excluded.max_level),
+            **{
+                f'level_{level}': getattr(MoodRollup, f'level_{level}') + getattr(stmt.excluded, f'level_{level}')
+                for level in range(1, 6)
+            },
+        },
+    )
+    session.execute(stmt, rows)
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup row from the raw ``mood`` table."""
+    conn.exec_driver_sql('DELETE FROM mood_rollup')
+    bucket_exprs = {
+        'day': "date(date_created)",
+        # SQLite: next Sunday (or today if Sunday), minus six days = Monday
+        'week': "date(date_created, 'weekday 0', '-6 days')",
+    }
+    histogram = ', '.join(f'SUM(mood_level = {level})' for level in range(1, 6))
+    for period, bucket_expr in bucket_exprs.items():
+        for key_expr in (f'COALESCE(user_id, {ANONYMOUS_USER_KEY})', str(ALL_USERS_KEY)):
+            conn.exec_driver_sql(
+                'INSERT INTO mood_rollup (user_key, period, period_start, count, total, min_level, max_level, '
+                'level_1, level_2, level_3, level_4, level_5) '
+                f"SELECT {key_expr}, '{period}', {bucket_expr}, COUNT(*), SUM(mood_level), "
+                f'MIN(mood_level), MAX(mood_level), {histogram} '
+                f'FROM mood WHERE date_created IS NOT NULL GROUP BY 1, 3'
+            )
+
+
+def _read_shards(session, user_id, query):
+    """``[query(session)]``, or one result per shard for an all-users read when sharded.
+
+    The all-users rollups (and raw mood aggregates) are additive, so the
+    callers sum each shard's share.
+    """
+    if user_id is None and shard_count():
+        return fan_out(lambda: query(db.session))
+    return [query(session)]
+
+
+def get_stats(session, user_id, period, start, end):
+    """Bucket rows and an overall summary for ``start``..``end`` (dates, inclusive).
+
+    ``user_id`` None means all users (summed over every shard when sharded).
+    """
+    key = ALL_USERS_KEY if user_id is None else user_id
+    stmt = (
+        select(MoodRollup.period_start, MoodRollup.count, MoodRollup.total, MoodRollup.min_level,
+               MoodRollup.max_level, *(getattr(MoodRollup, f'level_{level}') for level in range(1, 6)))
+        .where(
+            MoodRollup.user_key == key,
+            MoodRollup.period == period,
+            MoodRollup.period_start >= period_start(start, period),
+            MoodRollup.period_start <= end,
+        )
+        .order_by(MoodRollup.period_start)
+    )
+
+    merged = {}
+    for rows in _read_shards(session, user_id, lambda s: s.execute(stmt).all()):
+        for bucket_start, count, total, min_level, max_level, *levels in rows:
+            bucket = merged.get(bucket_start)
+            if bucket is None:
+                merged[bucket_start] = [count, total, min_level, max_level, levels]
+            else:
+                bucket[0] += count
+                bucket[1] += total
+                bucket[2] = min(bucket[2], min_level)
+                bucket[3] = max(bucket[3], max_level)
+                bucket[4] = [a + b for a, b in zip(bucket[4], levels)]
+
+    buckets = [
+        {
+            'start': bucket_start.isoformat(),
+            'count': count,
+            'average': round(total / count, 2) if count else None,
+            'min': min_level,
+            'max': max_level,
+            'histogram': {str(level): n for level, n in enumerate(levels, start=1)},
+        }
+        for bucket_start, (count, total, min_level, max_level, levels) in sorted(merged.items())
+    ]
+    count = sum(bucket[0] for bucket in merged.values())
+    total = sum(bucket[1] for bucket in merged.values())
+    summary = {
+        'count': count,
+        'average': round(total / count, 2) if count else None,
+        'min': min((bucket[2] for bucket in merged.values()), default=None),
+        'max': max((bucket[3] for bucket in merged.values()), default=None),
+        'histogram': {
+            str(level): sum(bucket[4][level - 1] for bucket in merged.values()) for level in range(1, 6)
+        },
+    }
+    return {'summary': summary, 'buckets': buckets}
+
+
+def _archived_days(start, end, archived_before):
+    """``(first, last)`` days, last exclusive, that a raw series reads from the rollups.
+
+    These are the whole days of ``start``..``end`` up to and including the
+    day of ``archived_before``; ``first >= last`` when there are none.
+    """
+    first = start.date() if start.time() == datetime.min.time() else start.date() + timedelta(days=1)
+    if archived_before is None:
+        return first, first
+    horizon_day = archived_before.date()
+    if archived_before.time() != datetime.min.time():
+        horizon_day += timedelta(days=1)
+    return first, min(horizon_day, end.date())
+
+
+def get_series(session, user_id, start, end, points, archived_before=None):
+    """Mood chart series for ``start`` <= date_created < ``end`` (naive UTC datetimes).
+
+    The range is cut into at most ``points`` equal buckets. Each returned
+    point has the bucket's start, mean, min, max and count; empty buckets
+    are omitted. When the range is whole days and a bucket spans at least
+    one day, the day rollups are aggregated instead of the raw moods, so
+    the cost depends on the number of days, not on the number of moods.
+    Otherwise raw moods are bucketed, except that whole days up to the
+    day of ``archived_before`` (the retention horizon) come from the day
+    rollups, which still count archived moods; those days are placed in
+    the bucket holding their midnight, so series and stats agree.
+    ``user_id`` None means all users (summed over every shard when sharded).
+    """
+    span = (end - start).total_seconds()
+    whole_days = start.time() == end.time() == datetime.min.time()
+    span_days = round(span / 86400)
+    key = ALL_USERS_KEY if user_id is None else user_id
+
+    if whole_days and span_days > points:
+        width_days = math.ceil(span_days / points)
+        first_day = start.date()
+        bucket = cast(
+            (func.julianday(MoodRollup.period_start) - func.julianday(first_day)) / width_days, Integer
+        ).label('bucket')
+        stmt = (
+            select(bucket, func.sum(MoodRollup.total), func.sum(MoodRollup.count),
+                   func.min(MoodRollup.min_level), func.max(MoodRollup.max_level))
+            .where(
+                MoodRollup.user_key == key,
+                MoodRollup.period == 'day',
+                MoodRollup.period_start >= first_day,
+                MoodRollup.period_start < end.date(),
+            )
+            .group_by(bucket)
+            .order_by(bucket)
+        )
+        statements = [stmt]
+        bucket_seconds = width_days * 86400
+
+        def bucket_start(index):
+            return (first_day + timedelta(days=index * width_days)).isoformat()
+    else:
+        bucket_seconds = max(1, math.ceil(span / points))
+        level = type_coerce(Mood.mood_level, Integer)
+        # Whole epoch seconds and integer division: julianday() floats put
+        # moods exactly on a bucket edge into the previous bucket
+        start_epoch = calendar.timegm(start.timetuple())
+        bucket = (
+            (cast(func.strftime('%s', Mood.date_created), Integer) - start_epoch) // bucket_seconds
+        ).label('bucket')
+        stmt = (
+            select(bucket, func.sum(level), func.count(), func.min(level), func.max(level))
+            .where(Mood.date_created >= start, Mood.date_created < end)
+            .group_by(bucket)
+            .order_by(bucket)
+        )
+        if user_id is not None:
+            stmt = stmt.where(Mood.user_id == user_id)
+        statements = [stmt]
+
+        archived_from, archived_until = _archived_days(start, end, archived_before)
+        if archived_from < archived_until:
+            # Archived moods are gone from ``mood``: read those days from the rollups
+            statements[0] = stmt.where(
+                (Mood.date_created < datetime.combine(archived_from, datetime.min.time()))
+                | (Mood.date_created >= datetime.combine(archived_until, datetime.min.time()))
+            )
+            day_bucket = (
+                (cast(func.strftime('%s', MoodRollup.period_start), Integer) - start_epoch) // bucket_seconds
+            ).label('bucket')
+            statements.append(
+                select(day_bucket, func.sum(MoodRollup.total), func.sum(MoodRollup.count),
+                       func.min(MoodRollup.min_level), func.max(MoodRollup.max_level))
+                .where(
+                    MoodRollup.user_key == key,
+                    MoodRollup.period == 'day',
+                    MoodRollup.period_start >= archived_from,
+                    MoodRollup.period_start < archived_until,
+                )
+                .group_by(day_bucket)
+            )
+
+        def bucket_start(index):
+            return (start + timedelta(seconds=index * bucket_seconds)).isoformat()
+
+    def read(s):
+        return [row for stmt in statements for row in s.execute(stmt)]
+
+    merged = {}
+    for rows in _read_shards(session, user_id, read):
+        for index, total, count, min_level, max_level in rows:
+            if not count:
+                continue
+            point = merged.get(index)
+            if point is None:
+                merged[index] = [total, count, min_level, max_level]
+            else:
+                point[0] += total
+                point[1] += count
+                point[2] = min(point[2], min_level)
+                point[3] = max(point[3], max_level)
+
+    series = [
+        {
+            'date': bucket_start(index),
+            'mood': round(total / count, 2),
+            'min': min_level,
+            'max': max_level,
+            'count': count,
+        }
+        for index, (total, count, min_level, max_level) in sorted(merged.items())
+    ]
+    return {'bucket_seconds': bucket_seconds, 'series': series}
@@ -0,0 +1,81 @@
+import json
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from flask_cors import cross_origin
+
+from src.chat import ChatUnavailable, UpstreamError
+from src.extensions import chat_proxy
+
+chat_bp = Blueprint('chat', __name__)
+
+MAX_MESSAGE_LENGTH = 4000
+MAX_HISTORY_TURNS = 20
+
+
+def _sse(data, event=None):
+    prefix = f'event: {event}\n' if event else ''
+    return f'{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def _sse_response(events, cache_status):
+    resp = Response(stream_with_context(events), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'  # don't let a proxy buffer the stream
+    resp.headers['X-Cache'] = cache_status
+    return resp
+
+
+@chat_bp.route('/chat', methods=['POST'])
+@cross_origin()
+def chat():
+    """Chat with MindHelper. Streams SSE unless ``"stream": false`` is sent"""
+    data = request.get_json(silent=True) or {}
+    message = data.get('message')
+    history = data.get('history') or []
+    stream = data.get('stream', True)
+
+    if not isinstance(message, str) or not message.strip():
+        return jsonify({'error': 'Message is required'}), 400
+    if len(message) > MAX_MESSAGE_LENGTH:
+        return jsonify({'error': f'Message must be at most {MAX_MESSAGE_LENGTH} characters'}), 400
+    if not isinstance(history, list) or not all(isinstance(turn, dict) for turn in history):
+        return jsonify({'error': 'History must be a list of {role, content} objects'}), 400
+    history = history[-MAX_HISTORY_TURNS:]
+    message = message.strip()
+
+    cached = chat_proxy.cached_reply(message, history)
+    if cached is not None:
+        if not stream:
+            return jsonify({'reply': cached, 'cached': True})
+        return _sse_response(iter([_sse({'text': cached}), _sse({}, event='done')]), 'HIT')
+
+    try:
+        fragments = chat_proxy.stream_reply(message, history)
+    except ChatUnavailable as e:
+        resp = jsonify({'error': str(e)})
+        resp.status_code = 503
+        if e.retry_after:
+            resp.headers['Retry-After'] = str(e.retry_after)
+        return resp
+    except UpstreamError as e:
+        return jsonify({'error': 'Chat upstream failed', 'details': str(e)}), 502
+
+    if not stream:
+        try:
+            return jsonify({'reply': ''.join(fragments), 'cached': False})
+        except Exception as e:
+            return jsonify({'error': 'Chat upstream failed', 'details': str(e)}), 502
+        finally:
+            fragments.close()
+
+    def events():
+        try:
+            for text in fragments:
+                yield _sse({'text': text})
+            yield _sse({}, event='done')
+        except Exception as e:
+            yield _sse({'error': str(e)}, event='error')
+        finally:
+            fragments.close()
+
+    return _sse_response(events(), 'MISS')
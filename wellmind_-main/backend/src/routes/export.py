@@ -0,0 +1,148 @@
+import csv
+import io
+import zlib
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from sqlalchemy import SmallInteger, select, type_coerce
+
+from src.auth import auth_required, scoped_user_id
+from src.extensions import db
+from src.models.mood import MOOD_LEVEL_NAMES, Mood, TestResult
+from src.serialization import dumps
+from src.sharding import select_shard
+
+export_bp = Blueprint('export', __name__)
+
+# Rows fetched from the cursor at a time, and bytes buffered per HTTP chunk
+EXPORT_FETCH_ROWS = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+EXPORT_TYPES = ('mood', 'test_result')
+CSV_FIELDS = [
+    'type', 'id', 'user_id', 'date_created',
+    'mood_level', 'mood', 'notes',
+    'test_type', 'score', 'result_category',
+]
+
+
+def export_columns(record_type):
+    """``(model, columns)`` selected for one table's export records."""
+    if record_type == 'mood':
+        return Mood, (
+            Mood.id, Mood.user_id, Mood.date_created,
+            type_coerce(Mood.mood_level, SmallInteger).label('mood'), Mood.notes,
+        )
+    return TestResult, (
+        TestResult.id, TestResult.user_id, TestResult.date_created,
+        TestResult.test_type, TestResult.score, TestResult.result_category,
+    )
+
+
+def export_record(record_type, row):
+    """Export dict for a row selected with ``export_columns``."""
+    record = {
+        'type': record_type,
+        'id': row.id,
+        'user_id': row.user_id,
+        'date_created': row.date_created.isoformat() if row.date_created else None,
+    }
+    if record_type == 'mood':
+        record['mood_level'] = MOOD_LEVEL_NAMES[row.mood]
+        record['mood'] = row.mood
+        record['notes'] = row.notes
+    else:
+        record['test_type'] = row.test_type
+        record['score'] = row.score
+        record['result_category'] = row.result_category
+    return record
+
+
+def _iter_records(record_type, user_id):
+    """Yield ``user_id``'s export dicts for one table, oldest first, without loading it all."""
+    model, columns = export_columns(record_type)
+    stmt = (
+        select(*columns)
+        .where(model.user_id == user_id)
+        .order_by(model.date_created, model.id)
+        .execution_options(yield_per=EXPORT_FETCH_ROWS)
+    )
+    select_shard(user_id)
+    for row in db.session.execute(stmt):
+        yield export_record(record_type, row)
+
+
+def _iter_lines(fmt, record_types, user_id):
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        yield buffer.getvalue().encode('utf-8')
+        for record_type in record_types:
+            for record in _iter_records(record_type, user_id):
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerow(record)
+                yield buffer.getvalue().encode('utf-8')
+    else:
+        for record_type in record_types:
+            for record in _iter_records(record_type, user_id):
+                yield dumps(record) + b'\n'
+
+
+def _iter_chunks(lines, compress):
+    """Group encoded lines into ~EXPORT_CHUNK_BYTES chunks, gzip-compressing if asked."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending = []
+    size = 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = b''.join(pending)
+            pending, size = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b''.join(pending)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+@export_bp.route('/export', methods=['GET'])
+@auth_required
+def export_history():
+    """Stream the caller's mood and test-result history as NDJSON or CSV.
+
+    Query args: ``format`` (ndjson|csv), ``type`` (mood|test_result|all),
+    and ``gzip=1`` for a gzip-encoded stream. Requires a token; ``user_id``
+    must name the caller.
+    """
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    record_type = request.args.get('type', 'all')
+    if record_type == 'all':
+        record_types = EXPORT_TYPES
+    elif record_type in EXPORT_TYPES:
+        record_types = (record_type,)
+    else:
+        return jsonify({'error': 'type must be mood, test_result or all'}), 400
+
+    user_id, error = scoped_user_id()
+    if error:
+        return error
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+    chunks = _iter_chunks(_iter_lines(fmt, record_types, user_id), compress)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    resp = Response(stream_with_context(chunks), mimetype=mimetype)
+    resp.headers['Content-Disposition'] = f'attachment; filename=wellmind-export.{fmt}'
+    if compress:
+        resp.headers['Content-Encoding'] = 'gzip'
+        resp.vary.add('Accept-Encoding')
+    return resp
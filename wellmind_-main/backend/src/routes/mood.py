@@ -1,96 +1,402 @@
-from flask import Blueprint, request, jsonify
-from src.models.mood import Mood, TestResult
-from src.extensions import db
-from datetime import datetime
+from flask import Blueprint, current_app, g, request, jsonify
+from sqlalchemy import SmallInteger, func, insert, type_coerce
+from src.models.mood import MOOD_LEVEL_NAMES, Mood, TestResult, parse_mood_level
+from src.auth import auth_optional, auth_required, scoped_user_id
+from src.ratelimit import rate_limit
+from src.analytics import DEFAULT_QUANTILES, RELATIVE_ACCURACY, record_scores
+from src.extensions import db, response_cache, score_distributions
+from src.pagination import InvalidCursor, add_pagination_headers, get_cursor, get_page_size, paginate_by_date
+from src.recommendations import RECOMMENDATIONS, recommend, recommendation_type
+from src.retention import archived_before
+from src.rollups import PERIODS, get_series, get_stats, record_moods
+from src.search import build_match_query, highlight, search_moods
+from src.serialization import json_response
+from src.sharding import select_shard, sharded_page
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
+import math
 
 mood_bp = Blueprint('mood', __name__)
 
+DEFAULT_BATCH_MAX_ITEMS = 1000
+TEST_TYPE_MAX_LENGTH = TestResult.__table__.c.test_type.type.length
+# Default and largest number of points returned by /mood/series
+SERIES_DEFAULT_POINTS = 100
+SERIES_MAX_POINTS = 1000
+# Page size (and limit) of the bulk /mood/recommendations endpoint
+RECOMMENDATIONS_PAGE_SIZE = 1000
+
+# Columns selected by the list endpoints. mood_level is read as its raw 1-5
+# value and the calendar date is computed by the database.
+MOOD_LIST_COLUMNS = (
+    Mood.id, Mood.user_id, type_coerce(Mood.mood_level, SmallInteger).label('mood'),
+    Mood.notes, Mood.date_created, func.date(Mood.date_created).label('date'),
+)
+TEST_RESULT_LIST_COLUMNS = (
+    TestResult.id, TestResult.user_id, TestResult.test_type, TestResult.score,
+    TestResult.result_category, TestResult.date_created,
+)
+
+
+def validate_mood(data):
+    """Return ``(values, error)`` for a mood payload."""
+    mood_level = data.get('mood_level')
+    if mood_level is None:
+        return None, 'Mood level is required'
+
+    # Accepts 1-5 or 'very_sad' .. 'very_happy'
+    level = parse_mood_level(mood_level)
+    if level is None:
+        return None, 'Invalid mood level'
+
+    notes = data.get('notes', '')
+    if notes is not None and not isinstance(notes, str):
+        return None, 'Notes must be a string'
+
+    return {'mood_level': level, 'notes': notes}, None
+
+
+def validate_test_result(data, categorize=None, integer_score=False):
+    """Return ``(values, error)`` for a test result payload.
+
+    ``categorize(test_type, score)`` derives ``result_category`` from the
+    score distribution. A derived category replaces the client's; the
+    client's is required only when none can be derived yet. Batches pass
+    ``integer_score``; single results still accept fractional scores.
+    """
+    test_type = data.get('test_type')
+    score = data.get('score')
+    result_category = data.get('result_category')
+
+    if not test_type or score is None:
+        return None, 'All fields are required'
+
+    # Anything else can't key a sketch or fit the column
+    if not isinstance(test_type, str) or len(test_type) > TEST_TYPE_MAX_LENGTH:
+        return None, f'test_type must be a string of at most {TEST_TYPE_MAX_LENGTH} characters'
+
+    if isinstance(score, bool) or not isinstance(score, (int, float)) or not math.isfinite(score):
+        return None, 'Score must be a number'
+    if integer_score and not isinstance(score, int):
+        return None, 'Score must be an integer'
+
+    derived = categorize(test_type, score) if categorize else None
+    result_category = derived or result_category
+    if not result_category:
+        return None, 'All fields are required'
+    if not isinstance(result_category, str):
+        return None, 'result_category must be a string'
+
+    return {'test_type': test_type, 'score': score, 'result_category': result_category}, None
+
+
+def _parse_date_created(value):
+    """Client timestamp for queued offline entries, defaulting to now (UTC)."""
+    if value is None:
+        return datetime.now(timezone.utc)
+    date_created = datetime.fromisoformat(value)
+    if date_created.tzinfo is None:
+        return date_created.replace(tzinfo=timezone.utc)
+    return date_created.astimezone(timezone.utc)
+
+
+def _parse_series_bound(value, is_end):
+    """Naive UTC datetime for a /mood/series bound. A ``to`` date is inclusive."""
+    if len(value) == 10:
+        day = datetime.combine(date.fromisoformat(value), datetime.min.time())
+        return day + timedelta(days=1) if is_end else day
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _batch_items():
+    """The list of items in a batch request (a bare list or ``{'items': [...]}``)."""
+    data = request.get_json()
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return None, ({'error': 'A non-empty list of items is required'}, 400)
+
+    max_items = current_app.config.get('BATCH_MAX_ITEMS', DEFAULT_BATCH_MAX_ITEMS)
+    if len(items) > max_items:
+        return None, ({'error': f'Batch too large (max {max_items} items)'}, 413)
+    return items, None
+
+
+def _save_batch(model, items, validate, user_id=None, before_commit=None):
+    """Validate every item, bulk insert the valid ones in one transaction.
+
+    Rows are owned by ``user_id`` (None for anonymous entries).
+    ``before_commit(rows)`` runs inside the same transaction after the insert.
+    Returns the per-item results in request order.
+    """
+    select_shard(user_id)
+    results = []
+    rows = []
+    row_positions = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results.append({'index': index, 'status': 'error', 'error': 'Item must be an object'})
+            continue
+        values, error = validate(item)
+        if error is None:
+            try:
+                values['date_created'] = _parse_date_created(item.get('date_created'))
+            except (TypeError, ValueError):
+                error = 'Invalid date_created'
+        if error:
+            results.append({'index': index, 'status': 'error', 'error': error})
+            continue
+        values['user_id'] = user_id
+        row_positions.append(len(results))
+        results.append({'index': index, 'status': 'created'})
+        rows.append(values)
+
+    if rows:
+        # One executemany INSERT ... RETURNING and a single commit for the batch
+        ids = db.session.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True), rows
+        ).all()
+        if before_commit:
+            before_commit(rows)
+        db.session.commit()
+        for position, new_id in zip(row_positions, ids):
+            results[position]['id'] = new_id
+
+    return results
+
+
+def _record_mood_rows(rows):
+    record_moods(db.session, [(row['user_id'], row['mood_level'], row['date_created']) for row in rows])
+
+
+def _record_test_result_rows(rows):
+    record_scores(db.session, [(row['test_type'], row['score']) for row in rows])
+
+
 @mood_bp.route('/mood', methods=['POST'])
+@auth_optional
+@rate_limit('60/minute')
 def save_mood():
     try:
         data = request.get_json()
-        mood_level = data.get('mood_level')
-        notes = data.get('notes', '')
-
-        if mood_level is None:
-            return jsonify({'error': 'Mood level is required'}), 400
-
-        # Map numbers to strings
-        mood_mapping = {
-            1: 'very_sad',
-            2: 'sad',
-            3: 'neutral',
-            4: 'happy',
-            5: 'very_happy'
-        }
-
-        if isinstance(mood_level, int) and mood_level in mood_mapping:
-            mood_level = mood_mapping[mood_level]
-        elif isinstance(mood_level, str) and mood_level in mood_mapping.values():
-            pass  # Already correct
-        else:
-            return jsonify({'error': 'Invalid mood level'}), 400
+        values, error = validate_mood(data)
+        if error:
+            return jsonify({'error': error}), 400
 
-        mood = Mood(
-            mood_level=mood_level,
-            notes=notes
-        )
+        mood = Mood(user_id=g.user_id, **values)
 
+        select_shard(g.user_id)
         db.session.add(mood)
+        db.session.flush()
+        record_moods(db.session, [(mood.user_id, mood.mood_level, mood.date_created)])
         db.session.commit()
 
         return jsonify({
             'message': 'Mood saved successfully',
-            'mood': mood.to_dict()
+            'mood': mood.to_dict(),
+            'recommendation': recommend(mood.mood_level, mood.notes)
         }), 201
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @mood_bp.route('/mood', methods=['GET'])
+@auth_optional
 def get_moods():
     try:
-        moods = Mood.query.order_by(Mood.date_created.desc()).limit(10).all()
-
-        # Map strings back to numbers for frontend
-        mood_reverse_mapping = {
-            'very_sad': 1,
-            'sad': 2,
-            'neutral': 3,
-            'happy': 4,
-            'very_happy': 5
-        }
+        def build():
+            limit, cursor, user_id = get_page_size(), get_cursor(), g.user_id
+
+            def page():
+                # Runs in a separate app context per shard: use no request state here
+                query = db.session.query(*MOOD_LIST_COLUMNS)
+                if user_id is not None:
+                    query = query.filter(Mood.user_id == user_id)
+                return paginate_by_date(query, Mood.date_created, Mood.id, limit, cursor)
+
+            rows, next_cursor = sharded_page(user_id, page, limit)
+            return [{
+                'id': row.id,
+                'user_id': row.user_id,
+                'mood_level': MOOD_LEVEL_NAMES[row.mood],
+                'notes': row.notes,
+                'date_created': row.date_created,
+                # Numeric 1-5 scale for the frontend
+                'mood': row.mood,
+                'date': row.date,
+            } for row in rows], next_cursor
+
+        return response_cache.list_response('mood', g.user_id, build)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@mood_bp.route('/mood/recommendations', methods=['GET'])
+@auth_optional
+def get_mood_recommendations():
+    """Recommendation type and matched note categories for stored moods.
+
+    Paginated like ``GET /mood``, RECOMMENDATIONS_PAGE_SIZE rows per page. Each
+    recommendation's text is sent once in ``recommendations``, keyed by type.
+    """
+    try:
+        limit, cursor = get_page_size(RECOMMENDATIONS_PAGE_SIZE, RECOMMENDATIONS_PAGE_SIZE), get_cursor()
+        user_id = g.user_id
+
+        def page():
+            query = db.session.query(
+                Mood.id, Mood.date_created, type_coerce(Mood.mood_level, SmallInteger).label('mood'), Mood.notes,
+            )
+            if user_id is not None:
+                query = query.filter(Mood.user_id == user_id)
+            return paginate_by_date(query, Mood.date_created, Mood.id, limit, cursor)
+
+        rows, next_cursor = sharded_page(user_id, page, limit)
 
-        result = []
-        for mood in moods:
-            mood_dict = mood.to_dict()
-            mood_dict['mood'] = mood_reverse_mapping.get(mood.mood_level, 3)
-            mood_dict['date'] = mood.date_created.date().isoformat() if mood.date_created else None
-            result.append(mood_dict)
+        items = []
+        counts = {}
+        for row in rows:
+            rec_type, categories = recommendation_type(row.mood, row.notes)
+            counts[rec_type] = counts.get(rec_type, 0) + 1
+            items.append({
+                'id': row.id,
+                'date_created': row.date_created,
+                'mood': row.mood,
+                'type': rec_type,
+                'categories': categories,
+            })
 
-        return jsonify(result)
+        return add_pagination_headers(json_response({
+            'items': items,
+            'counts': counts,
+            'recommendations': {rec_type: RECOMMENDATIONS[rec_type] for rec_type in counts},
+        }), next_cursor)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@mood_bp.route('/mood/search', methods=['GET'])
+@auth_required
+def search_mood_notes():
+    """Full-text search over the caller's mood notes, best matches first.
+
+    Query args: ``q`` (every word must match, as a word prefix), ``limit``
+    and ``cursor``. Requires a token; ``user_id`` must name the caller.
+    Each result carries an HTML ``snippet`` with the matches in ``<mark>``.
+    """
+    try:
+        match = build_match_query(request.args.get('q'))
+        if match is None:
+            return jsonify({'error': 'q must contain at least one word'}), 400
+
+        user_id, error = scoped_user_id()
+        if error:
+            return error
+        select_shard(user_id)
+        rows, next_cursor = search_moods(db.session, match, get_page_size(), get_cursor(), user_id)
+        result = [{
+            'id': row.id,
+            'user_id': row.user_id,
+            'mood_level': MOOD_LEVEL_NAMES[row.mood],
+            'mood': row.mood,
+            'date_created': row.date_created,
+            'snippet': highlight(row.snippet),
+            'score': -row.rank,
+        } for row in rows]
+        return add_pagination_headers(json_response(result), next_cursor)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@mood_bp.route('/mood/stats', methods=['GET'])
+@auth_optional
+def get_mood_stats():
+    """Mood statistics from the rollup tables.
+
+    Query args: ``period`` (day|week), ``from``/``to`` (YYYY-MM-DD, default
+    the last 30 days). Anonymous callers get all users' statistics and
+    authenticated callers their own; ``user_id`` must name the caller.
+    """
+    try:
+        period = request.args.get('period', 'day')
+        if period not in PERIODS:
+            return jsonify({'error': 'period must be day or week'}), 400
+
+        try:
+            end = date.fromisoformat(request.args['to']) if 'to' in request.args else datetime.now(timezone.utc).date()
+            start = date.fromisoformat(request.args['from']) if 'from' in request.args else end - timedelta(days=29)
+        except ValueError:
+            return jsonify({'error': 'from/to must be YYYY-MM-DD dates'}), 400
+        if start > end:
+            return jsonify({'error': 'from must not be after to'}), 400
+
+        user_id, error = scoped_user_id()
+        if error:
+            return error
+        select_shard(user_id)
+        stats = get_stats(db.session, user_id, period, start, end)
+        return jsonify({'period': period, 'from': start.isoformat(), 'to': end.isoformat(), **stats})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@mood_bp.route('/mood/series', methods=['GET'])
+@auth_optional
+def get_mood_series():
+    """Downsampled mood chart series: at most ``points`` bucketed points.
+
+    Query args: ``from``/``to`` (YYYY-MM-DD, inclusive, or ISO datetimes;
+    default the last 30 days) and ``points`` (default 100). Anonymous callers
+    get all users' series and authenticated callers their own; ``user_id``
+    must name the caller.
+    """
+    try:
+        try:
+            if 'to' in request.args:
+                end = _parse_series_bound(request.args['to'], is_end=True)
+            else:
+                end = datetime.combine(datetime.now(timezone.utc).date() + timedelta(days=1), datetime.min.time())
+            start = _parse_series_bound(request.args['from'], is_end=False) if 'from' in request.args else end - timedelta(days=30)
+        except ValueError:
+            return jsonify({'error': 'from/to must be YYYY-MM-DD dates or ISO datetimes'}), 400
+        if start >= end:
+            return jsonify({'error': 'from must be before to'}), 400
+
+        points = request.args.get('points', SERIES_DEFAULT_POINTS, type=int)
+        if not 1 <= points <= SERIES_MAX_POINTS:
+            return jsonify({'error': f'points must be between 1 and {SERIES_MAX_POINTS}'}), 400
+
+        user_id, error = scoped_user_id()
+        if error:
+            return error
+        select_shard(user_id)
+        horizon = archived_before(current_app.config, include_anonymous=user_id is None)
+        series = get_series(db.session, user_id, start, end, points, archived_before=horizon)
+        return json_response({'from': start.isoformat(), 'to': end.isoformat(), 'points': points, **series})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @mood_bp.route('/test-result', methods=['POST'])
+@auth_optional
+@rate_limit('30/minute')
 def save_test_result():
     try:
         data = request.get_json()
-        test_type = data.get('test_type')
-        score = data.get('score')
-        result_category = data.get('result_category')
+        values, error = validate_test_result(data, score_distributions.category)
+        if error:
+            return jsonify({'error': error}), 400
         
-        if not all([test_type, score is not None, result_category]):
-            return jsonify({'error': 'All fields are required'}), 400
-        
-        test_result = TestResult(
-            test_type=test_type,
-            score=score,
-            result_category=result_category
-        )
+        test_result = TestResult(user_id=g.user_id, **values)
         
+        select_shard(g.user_id)
         db.session.add(test_result)
+        record_scores(db.session, [(test_result.test_type, test_result.score)])
         db.session.commit()
+        score_distributions.invalidate([test_result.test_type])
         
         return jsonify({
             'message': 'Test result saved successfully',
@@ -101,10 +407,108 @@ def save_test_result():
         return jsonify({'error': str(e)}), 500
 
 @mood_bp.route('/test-results', methods=['GET'])
+@auth_optional
 def get_test_results():
     try:
-        results = TestResult.query.order_by(TestResult.date_created.desc()).limit(10).all()
-        return jsonify([result.to_dict() for result in results])
+        def build():
+            limit, cursor, user_id = get_page_size(), get_cursor(), g.user_id
+
+            def page():
+                query = db.session.query(*TEST_RESULT_LIST_COLUMNS)
+                if user_id is not None:
+                    query = query.filter(TestResult.user_id == user_id)
+                return paginate_by_date(query, TestResult.date_created, TestResult.id, limit, cursor)
+
+            rows, next_cursor = sharded_page(user_id, page, limit)
+            return [row._asdict() for row in rows], next_cursor
+
+        return response_cache.list_response('test_result', g.user_id, build)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@mood_bp.route('/test-results/percentiles', methods=['GET'])
+def get_test_result_percentiles():
+    """Quantiles of a test type's scores and, with ``score``, that score's percentile.
+
+    Read from the per-type sketch, so the cost does not grow with the
+    number of results. Scores are approximate within RELATIVE_ACCURACY.
+    """
+    try:
+        test_type = request.args.get('test_type')
+        if not test_type:
+            return jsonify({'error': 'test_type is required'}), 400
+        # Single results may have fractional scores, so any finite number is accepted
+        score = request.args.get('score', type=float)
+        if (score is None and request.args.get('score')) or (score is not None and not math.isfinite(score)):
+            return jsonify({'error': 'Score must be a number'}), 400
+        if score is not None and score.is_integer():
+            score = int(score)
+        try:
+            quantiles = [float(q) for q in request.args['q'].split(',')] if request.args.get('q') else DEFAULT_QUANTILES
+        except ValueError:
+            quantiles = None
+        if not quantiles or any(not 0 <= q <= 1 for q in quantiles):
+            return jsonify({'error': 'q must be comma-separated quantiles between 0 and 1'}), 400
+
+        sketch = score_distributions.sketch(test_type)
+        payload = {
+            'test_type': test_type,
+            'count': sketch.count,
+            'relative_accuracy': RELATIVE_ACCURACY,
+            'quantiles': {
+                f'{q:g}': None if sketch.count == 0 else round(sketch.quantile(q), 2) for q in quantiles
+            },
+        }
+        if score is not None:
+            percentile = sketch.percentile(score)
+            payload['score'] = {
+                'score': score,
+                'percentile': None if percentile is None else round(percentile, 2),
+                'category': score_distributions.category(test_type, score),
+            }
+        return json_response(payload)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+
+@mood_bp.route('/mood/batch', methods=['POST'])
+@auth_optional
+@rate_limit('10/minute')
+def save_moods_batch():
+    try:
+        items, error = _batch_items()
+        if error:
+            return jsonify(error[0]), error[1]
+
+        results = _save_batch(Mood, items, validate_mood, user_id=g.user_id, before_commit=_record_mood_rows)
+        created = sum(1 for r in results if r['status'] == 'created')
+        return jsonify({'created': created, 'failed': len(results) - created, 'results': results}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@mood_bp.route('/test-results/batch', methods=['POST'])
+@auth_optional
+@rate_limit('10/minute')
+def save_test_results_batch():
+    try:
+        items, error = _batch_items()
+        if error:
+            return jsonify(error[0]), error[1]
+
+        # Categories are derived against the distributions as they were before the batch
+        validate = partial(validate_test_result, categorize=score_distributions.category, integer_score=True)
+        results = _save_batch(
+            TestResult, items, validate, user_id=g.user_id, before_commit=_record_test_result_rows,
+        )
+        score_distributions.invalidate({items[r['index']]['test_type'] for r in results if r['status'] == 'created'})
+        created = sum(1 for r in results if r['status'] == 'created')
+        return jsonify({'created': created, 'failed': len(results) - created, 'results': results}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
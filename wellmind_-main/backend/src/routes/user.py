@@ -1,23 +1,37 @@
-from flask import Blueprint, jsonify, request, abort
-from sqlalchemy import or_
+from flask import Blueprint, current_app, jsonify, request, abort
+from sqlalchemy import or_, select
 from src.models.user import User
-from src.extensions import db
+from src.extensions import availability_index, db
+from src.auth import DEFAULT_TOKEN_MAX_AGE, issue_token
+from src.hashing import HashPoolBusy, busy_response
+from src.ratelimit import rate_limit
 from flask_cors import cross_origin
+from src.pagination import (
+    MAX_PAGE_SIZE, PAGINATION_HEADERS, InvalidCursor, add_pagination_headers, get_cursor, get_page_size,
+    paginate_by_id,
+)
+from src.serialization import json_response
 
 user_bp = Blueprint('user', __name__)
 
+MAX_AVAILABILITY_CANDIDATES = 50
+
 @user_bp.route('/users', methods=['GET'])
-@cross_origin()
+@cross_origin(expose_headers=PAGINATION_HEADERS)
 def get_users():
-    """Get all users"""
+    """Get users, one page at a time (?limit=&cursor=)"""
     try:
-        users = User.query.all()
-        return jsonify([user.to_dict() for user in users])
+        query = db.session.query(User.id, User.username, User.email)
+        rows, next_cursor = paginate_by_id(query, User.id, get_page_size(MAX_PAGE_SIZE), get_cursor())
+        return add_pagination_headers(json_response([row._asdict() for row in rows]), next_cursor)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to fetch users', 'details': str(e)}), 500
 
 @user_bp.route('/register', methods=['POST'])
 @cross_origin()
+@rate_limit('5/minute', per=('ip',))
 def register():
     """Register a new user"""
     try:
@@ -61,6 +75,7 @@ def register():
         
         db.session.add(user)
         db.session.commit()
+        availability_index.add(user.username, user.email)
 
         response_data = {
             'message': 'User registered successfully',
@@ -71,12 +86,16 @@ def register():
         resp.status_code = 201
         return resp
 
+    except HashPoolBusy as e:
+        db.session.rollback()
+        return busy_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Registration failed', 'details': str(e)}), 500
 
 @user_bp.route('/login', methods=['POST'])
 @cross_origin()
+@rate_limit('10/minute', per=('ip',))
 def login():
     """User login - accepts both email and username"""
     try:
@@ -93,13 +112,22 @@ def login():
         ).first()
 
         if user and user.check_password(password):
+            # Upgrade hashes made with older/weaker parameters while we have the password
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
             return jsonify({
                 'message': 'Login successful',
-                'user': user.to_dict()
+                'user': user.to_dict(),
+                'token': issue_token(user),
+                'expires_in': current_app.config.get('AUTH_TOKEN_MAX_AGE', DEFAULT_TOKEN_MAX_AGE)
             })
         
         return jsonify({'error': 'Invalid email/username or password'}), 401
 
+    except HashPoolBusy as e:
+        db.session.rollback()
+        return busy_response(e)
     except Exception as e:
         return jsonify({'error': 'Login failed', 'details': str(e)}), 500
 
@@ -145,10 +173,13 @@ def update_user(user_id):
                 return jsonify({'error': 'Email already exists'}), 409
 
         # Update user
+        old_username, old_email = user.username, user.email
         user.username = new_username
         user.email = new_email
         
         db.session.commit()
+        availability_index.remove(old_username, old_email)
+        availability_index.add(new_username, new_email)
         
         return jsonify({
             'message': 'User updated successfully',
@@ -168,8 +199,10 @@ def delete_user(user_id):
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
+        username, email = user.username, user.email
         db.session.delete(user)
         db.session.commit()
+        availability_index.remove(username, email)
         
         return jsonify({'message': 'User deleted successfully'}), 200
 
@@ -194,6 +227,9 @@ def check_email():
         if not email:
             return jsonify({'error': 'Email is required'}), 400
 
+        # Unknown to the index means free; known names are confirmed in the DB
+        if not availability_index.may_have_email(email):
+            return jsonify({'available': True})
         existing_user = User.query.filter_by(email=email).first()
         return jsonify({'available': existing_user is None})
 
@@ -211,8 +247,52 @@ def check_username():
         if not username:
             return jsonify({'error': 'Username is required'}), 400
 
+        if not availability_index.may_have_username(username):
+            return jsonify({'available': True})
         existing_user = User.query.filter_by(username=username).first()
         return jsonify({'available': existing_user is None})
 
     except Exception as e:
-        return jsonify({'error': 'Check failed', 'details': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': 'Check failed', 'details': str(e)}), 500
+
+@user_bp.route('/check-availability', methods=['POST'])
+@cross_origin()
+def check_availability():
+    """Check several usernames and/or emails at once"""
+    try:
+        data = request.get_json() or {}
+        usernames = data.get('usernames', [])
+        emails = data.get('emails', [])
+
+        if not isinstance(usernames, list) or not isinstance(emails, list):
+            return jsonify({'error': 'usernames and emails must be lists'}), 400
+        if not usernames and not emails:
+            return jsonify({'error': 'At least one username or email is required'}), 400
+        if len(usernames) + len(emails) > MAX_AVAILABILITY_CANDIDATES:
+            return jsonify({'error': f'At most {MAX_AVAILABILITY_CANDIDATES} candidates per request'}), 400
+
+        usernames = {str(name).strip() for name in usernames} - {''}
+        emails = {str(email).strip().lower() for email in emails} - {''}
+
+        # Only candidates the index knows about need the authoritative query
+        maybe_taken_usernames = [name for name in usernames if availability_index.may_have_username(name)]
+        maybe_taken_emails = [email for email in emails if availability_index.may_have_email(email)]
+
+        taken_usernames = set()
+        if maybe_taken_usernames:
+            taken_usernames = set(db.session.scalars(
+                select(User.username).where(User.username.in_(maybe_taken_usernames))
+            ))
+        taken_emails = set()
+        if maybe_taken_emails:
+            taken_emails = set(db.session.scalars(
+                select(User.email).where(User.email.in_(maybe_taken_emails))
+            ))
+
+        return jsonify({
+            'usernames': {name: name not in taken_usernames for name in usernames},
+            'emails': {email: email not in taken_emails for email in emails}
+        })
+
+    except Exception as e:
+        return jsonify({'error': 'Check failed', 'details': str(e)}), 500
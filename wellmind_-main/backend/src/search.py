@@ -0,0 +1,102 @@
+"""Full-text search over mood notes with SQLite FTS5.
+
+``mood_fts`` is an external-content FTS5 table over ``mood.notes``: it
+stores only the index, and triggers on ``mood`` keep it in sync on insert,
+update and delete. It is created along with the ``mood`` table (and by
+migration 3 for older databases). ``rebuild_search_index`` re-indexes
+every note, e.g. after a bulk load that bypassed the triggers.
+"""
+import html
+import re
+
+from sqlalchemy import DateTime, text
+
+from src.pagination import InvalidCursor, encode_cursor
+
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS mood_fts USING fts5("
+    "notes, content='mood', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS mood_fts_ai AFTER INSERT ON mood BEGIN "
+    "INSERT INTO mood_fts(rowid, notes) VALUES (new.id, new.notes); END",
+    "CREATE TRIGGER IF NOT EXISTS mood_fts_ad AFTER DELETE ON mood BEGIN "
+    "INSERT INTO mood_fts(mood_fts, rowid, notes) VALUES ('delete', old.id, old.notes); END",
+    "CREATE TRIGGER IF NOT EXISTS mood_fts_au AFTER UPDATE OF notes ON mood BEGIN "
+    "INSERT INTO mood_fts(mood_fts, rowid, notes) VALUES ('delete', old.id, old.notes); "
+    "INSERT INTO mood_fts(rowid, notes) VALUES (new.id, new.notes); END",
+]
+DROP_SEARCH_DDL = 'DROP TABLE IF EXISTS mood_fts'
+
+# Snippet markers: control characters that can't clash with note text, swapped
+# for <mark> after the note has been HTML-escaped
+_MARK_START, _MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 12
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_SEARCH_SQL = f"""
+SELECT * FROM (
+    SELECT m.id, m.user_id, m.mood_level AS mood, m.date_created,
+           snippet(mood_fts, 0, '{_MARK_START}', '{_MARK_END}', '…', {SNIPPET_TOKENS}) AS snippet,
+           bm25(mood_fts) AS rank
+    FROM mood_fts JOIN mood m ON m.id = mood_fts.rowid
+    WHERE mood_fts MATCH :match {{user_filter}}
+)
+{{cursor_filter}}
+ORDER BY rank, id
+LIMIT :limit
+"""
+
+
+def create_search_index(conn):
+    for statement in SEARCH_DDL:
+        conn.exec_driver_sql(statement)
+
+
+def rebuild_search_index(conn):
+    """Re-index every note from the ``mood`` table."""
+    create_search_index(conn)
+    conn.exec_driver_sql("INSERT INTO mood_fts(mood_fts) VALUES ('rebuild')")
+
+
+def build_match_query(q):
+    """Turn free text into an FTS5 query: every word must match (as a prefix).
+
+    Words are quoted, so FTS5 operators and punctuation in ``q`` are
+    treated as plain text. Returns None if ``q`` has no words.
+    """
+    words = _TOKEN_RE.findall(q or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def highlight(snippet):
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def search_moods(session, match, limit, cursor=None, user_id=None):
+    """Best-matching moods first (bm25). Returns ``(rows, next_cursor)``."""
+    params = {'match': match, 'limit': limit + 1}
+    user_filter = cursor_filter = ''
+    if user_id is not None:
+        user_filter = 'AND m.user_id = :user_id'
+        params['user_id'] = user_id
+    if cursor is not None:
+        try:
+            last_rank, last_id = cursor
+            params['last_rank'] = float(last_rank)
+            params['last_id'] = int(last_id)
+        except (TypeError, ValueError):
+            raise InvalidCursor('Invalid cursor')
+        cursor_filter = 'WHERE rank > :last_rank OR (rank = :last_rank AND id > :last_id)'
+
+    sql = text(_SEARCH_SQL.format(user_filter=user_filter, cursor_filter=cursor_filter)).columns(
+        date_created=DateTime()
+    )
+    rows = session.execute(sql, params).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1].rank, rows[-1].id])
+    return rows, next_cursor
@@ -0,0 +1,43 @@
+"""Fast JSON encoding for list endpoints and exports.
+
+List endpoints select plain column rows instead of ORM objects and build
+their dicts directly, so they skip identity-map bookkeeping and the
+``to_dict()`` copies. The result is encoded with ``orjson`` when it is
+installed; otherwise the stdlib encoder is used, with the same output.
+"""
+import json
+from datetime import date, datetime
+
+from flask import Response
+
+from src.metrics import timed
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    def dumps(obj):
+        """Encode ``obj`` as compact UTF-8 JSON bytes."""
+        return orjson.dumps(obj)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+
+    def dumps(obj):
+        """Encode ``obj`` as compact UTF-8 JSON bytes."""
+        return _encoder.encode(obj).encode('utf-8')
+
+
+def json_response(obj, status=200):
+    """Like ``jsonify`` but using the fast encoder."""
+    with timed('json'):
+        body = dumps(obj)
+    return Response(body, status=status, mimetype='application/json')
@@ -0,0 +1,185 @@
+"""Optional per-user sharding of the mood and test-result data.
+
+With DB_SHARDS = N > 0, every table except ``user`` lives in N extra SQLite
+files (SQLAlchemy binds ``shard0`` .. ``shardN-1``). A user's moods, test
+results, rollups, search index rows and score sketch counts all go to
+shard ``blake2b(user_id) % N``, and anonymous rows go to shard 0. Each file
+has its own write lock, so writers for different users don't queue behind
+each other. The ``user`` table stays in the main database.
+
+Routing is per request. A view calls ``select_shard(user_id)``, and
+``RoutingSession`` then sends every statement that doesn't target ``user``
+to that shard. Executing a sharded statement with no shard selected raises
+``ShardNotSelected`` rather than silently reading the main database.
+
+Reads that span users fan out. ``sharded_page`` runs a list page on every
+shard in parallel and merges the results by date. ``fan_out`` runs any
+callable once per shard. Row ids stay unique across shards because shard
+``i`` allocates ids from ``i * 2**40`` (AUTOINCREMENT, seeded at creation).
+"""
+import contextvars
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import MetaData, Table, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.util import find_tables
+
+GLOBAL_TABLES = frozenset({'user'})
+# Tables whose ids are returned by the API, allocated from disjoint ranges per shard
+ID_RANGE_TABLES = ('mood', 'test_result')
+SHARD_ID_BITS = 40
+
+
+class ShardNotSelected(RuntimeError):
+    pass
+
+
+def shard_count():
+    return current_app.config.get('DB_SHARDS', 0) if has_app_context() else 0
+
+
+def bind_key(index):
+    return f'shard{index}'
+
+
+def shard_for(user_id, shards):
+    """Shard index of ``user_id`` (anonymous rows go to shard 0)."""
+    if user_id is None:
+        return 0
+    digest = hashlib.blake2b(str(user_id).encode('ascii'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shards
+
+
+def shard_binds(database_uri, shards):
+    """SQLALCHEMY_BINDS for ``shards`` files next to the main SQLite database."""
+    url = make_url(database_uri)
+    if url.database in (None, '', ':memory:'):
+        return {bind_key(i): 'sqlite://' for i in range(shards)}
+    stem, ext = os.path.splitext(url.database)
+    return {
+        bind_key(i): url.set(database=f'{stem}-shard{i}{ext or ".db"}').render_as_string(hide_password=False)
+        for i in range(shards)
+    }
+
+
+def select_shard(user_id):
+    """Route this request's sharded statements to ``user_id``'s shard. No-op without sharding."""
+    shards = shard_count()
+    if shards:
+        g.shard = shard_for(user_id, shards)
+
+
+def _table_names(mapper, clause):
+    if mapper is not None:
+        return {inspect(mapper).local_table.name}
+    if isinstance(clause, Table):
+        return {clause.name}
+    if isinstance(clause, UpdateBase) and isinstance(clause.table, Table):
+        return {clause.table.name}
+    if clause is not None:
+        return {table.name for table in find_tables(clause, include_crud=True) if isinstance(table, Table)}
+    return set()
+
+
+class RoutingSession(Session):
+    """``db.session`` class sending sharded statements to the selected shard."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and shard_count():
+            names = _table_names(mapper, clause)
+            if not names or not names <= GLOBAL_TABLES:
+                shard = g.get('shard')
+                if shard is None:
+                    raise ShardNotSelected('No shard selected for a query on sharded tables')
+                return self._db.engines[bind_key(shard)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+_executor_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def _get_executor(shards):
+    global _executor, _executor_pid
+    with _executor_lock:
+        # Threads don't survive fork: rebuild the pool in each worker
+        if _executor is None or _executor_pid != os.getpid() or _executor._max_workers < shards:
+            _executor = ThreadPoolExecutor(max_workers=shards, thread_name_prefix='wellmind-shard')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def fan_out(fn):
+    """Run ``fn()`` once per shard in parallel and return the results in shard order.
+
+    Each call gets its own app context (and so its own session) with that
+    shard selected, and runs in a copy of the caller's ``contextvars`` so the
+    request's query timings count the shard queries. Without sharding, ``fn``
+    runs once in the current context.
+    """
+    shards = shard_count()
+    if not shards:
+        return [fn()]
+    app = current_app._get_current_object()
+
+    def run(index):
+        with app.app_context():
+            g.shard = index
+            return fn()
+
+    # A context can only be entered by one thread at a time: one copy per shard
+    contexts = [contextvars.copy_context() for _ in range(shards)]
+    return list(_get_executor(shards).map(lambda index: contexts[index].run(run, index), range(shards)))
+
+
+def sharded_page(user_id, page, limit):
+    """One newest-first list page for ``user_id`` (None = every user).
+
+    ``page()`` returns ``(rows, next_cursor)`` from ``paginate_by_date`` for
+    the current shard. A single user's page is read from their shard; an
+    all-users page is read from every shard and merged.
+    """
+    from src.pagination import merge_date_pages
+
+    if not shard_count() or user_id is not None:
+        select_shard(user_id)
+        return page()
+    return merge_date_pages(fan_out(page), limit)
+
+
+def shard_metadata(metadata):
+    """Copy of ``metadata`` for a shard file, with AUTOINCREMENT ids.
+
+    ``user`` is copied too so the foreign keys resolve; it stays empty.
+    """
+    copy = MetaData()
+    for table in metadata.sorted_tables:
+        table.to_metadata(copy)
+    for name in ID_RANGE_TABLES:
+        copy.tables[name].dialect_options['sqlite']['autoincrement'] = True
+    return copy
+
+
+def create_shard_schema(engine, index, metadata):
+    """Create the tables of shard ``index`` and seed its id ranges. Returns True if created."""
+    from src.migrations import SCHEMA_VERSION
+    from src.search import create_search_index
+
+    with engine.begin() as conn:
+        if inspect(conn).has_table('mood'):
+            return False
+        shard_metadata(metadata).create_all(conn)
+        create_search_index(conn)
+        for name in ID_RANGE_TABLES:
+            conn.exec_driver_sql(
+                'INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (name, index << SHARD_ID_BITS)
+            )
+        conn.exec_driver_sql(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    return True
@@ -0,0 +1,84 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Named SQLite tuning profiles selectable through create_app / DB_PROFILE.
+# "pragmas" run on every new DBAPI connection, "engine_options" are passed
+# straight to SQLAlchemy's create_engine.
+SQLITE_PROFILES = {
+    'default': {
+        'pragmas': {},
+        'engine_options': {},
+    },
+    'production': {
+        'pragmas': {
+            # Only takes effect on a new database (or after a full VACUUM);
+            # lets the retention job return freed pages to the file system
+            'auto_vacuum': 'INCREMENTAL',
+            'journal_mode': 'WAL',            # readers no longer block the writer
+            'synchronous': 'NORMAL',          # fsync on checkpoint, safe with WAL
+            'busy_timeout': 5000,             # ms to wait on the write lock
+            'mmap_size': 256 * 1024 * 1024,   # bytes
+            'cache_size': -64000,             # negative = KiB, ~64 MB per connection
+            'temp_store': 'MEMORY',
+        },
+        'engine_options': {
+            'pool_size': 10,
+            'max_overflow': 10,
+            'pool_timeout': 30,
+            'pool_pre_ping': True,
+            'pool_recycle': 3600,
+        },
+    },
+}
+
+
+def is_file_sqlite(uri):
+    """True for on-disk SQLite URIs (profiles don't apply to :memory:)."""
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def get_sqlite_profile(name):
+    try:
+        return SQLITE_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown DB_PROFILE '{name}'. Choose one of: {', '.join(SQLITE_PROFILES)}")
+
+
+def configure_sqlite_profile(app, name):
+    """Store the profile's engine options on the app config.
+
+    Must run before ``db.init_app`` since engines are built there.
+    """
+    profile = get_sqlite_profile(name)
+    app.config['DB_PROFILE'] = name
+    if not is_file_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+    options = dict(profile['engine_options'])
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    """Apply ``pragmas`` to every new connection made by ``engine``."""
+    if not pragmas:
+        return
+
+    statements = [f'PRAGMA {key}={value}' for key, value in pragmas.items()]
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def apply_sqlite_profile(app, engine):
+    """Install the configured profile's pragmas on ``engine``."""
+    if not is_file_sqlite(str(engine.url)):
+        return
+    profile = get_sqlite_profile(app.config.get('DB_PROFILE', 'default'))
+    install_sqlite_pragmas(engine, profile['pragmas'])
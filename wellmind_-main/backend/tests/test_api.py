@@ -1,5 +1,5 @@
 import pytest
-from main import create_app
+from main import create_app, init_db
 from src.extensions import db
 
 
@@ -110,3 +110,922 @@ def test_test_results_endpoints(client):
     items = resp.get_json()
     assert isinstance(items, list)
     assert len(items) >= 1
+
+
+def test_index_shell_etag(client):
+    resp = client.get('/dashboard')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/html'
+    etag = resp.headers.get('ETag')
+    assert etag and not etag.startswith('W/')
+
+    resp = client.get('/', headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.data == b''
+
+
+def test_index_shell_never_contains_api_key(client, monkeypatch):
+    monkeypatch.setenv('GOOGLE_API_KEY', 'secret-model-key')
+    resp = client.get('/')
+    assert resp.status_code == 200
+    assert b'secret-model-key' not in resp.data
+    assert b'API_KEY' not in resp.data
+
+    # The shell doesn't need the key at all
+    monkeypatch.delenv('GOOGLE_API_KEY')
+    assert client.get('/').status_code == 200
+
+
+def test_hashed_assets_are_immutable(client):
+    resp = client.get('/assets/index-CGsbAMLv.js')
+    assert resp.status_code == 200
+    assert 'immutable' in resp.headers['Cache-Control']
+    assert 'max-age=31536000' in resp.headers['Cache-Control']
+    resp.close()
+
+
+def test_precompressed_assets(app, tmp_path):
+    from src.frontend import StaticAssets
+
+    assets_dir = tmp_path / 'assets'
+    assets_dir.mkdir()
+    (assets_dir / 'app-abcd1234.js').write_text('console.log("well mind");\n' * 200)
+
+    static_assets = StaticAssets(str(tmp_path))
+    variants = static_assets.scan(build=True)
+    assert 'gzip' in variants['assets/app-abcd1234.js']
+    assert (assets_dir / 'app-abcd1234.js.gz').exists()
+
+    with app.test_request_context(headers={'Accept-Encoding': 'gzip, deflate'}):
+        resp = static_assets.send('assets/app-abcd1234.js')
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert resp.mimetype == 'text/javascript'
+        assert 'Accept-Encoding' in resp.headers['Vary']
+        resp.close()
+
+    with app.test_request_context(headers={'Accept-Encoding': 'identity'}):
+        resp = static_assets.send('assets/app-abcd1234.js')
+        assert 'Content-Encoding' not in resp.headers
+        resp.close()
+
+
+def test_production_sqlite_profile(tmp_path):
+    from sqlalchemy import text
+
+    prod_app = create_app(database_uri=f"sqlite:///{tmp_path / 'prod.db'}", db_profile='production')
+    with prod_app.app_context():
+        assert db.engine.pool.size() == 10
+        with db.engine.connect() as conn:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+            assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+        db.engine.dispose()
+
+
+def test_mood_level_migration(tmp_path):
+    import sqlite3
+
+    db_path = tmp_path / 'legacy.db'
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        'CREATE TABLE mood (id INTEGER NOT NULL, user_id INTEGER, mood_level VARCHAR(20) NOT NULL, '
+        'notes TEXT, date_created DATETIME, PRIMARY KEY (id))'
+    )
+    conn.executemany(
+        "INSERT INTO mood (mood_level, notes, date_created) VALUES (?, ?, '2024-01-01 10:00:00.000000')",
+        [('very_happy', 'great'), ('sad', None)],
+    )
+    conn.commit()
+    conn.close()
+
+    legacy_app = create_app(database_uri=f'sqlite:///{db_path}')
+    assert init_db(legacy_app) == [1, 2, 3, 4]
+    with legacy_app.test_client() as c:
+        items = c.get('/api/mood').get_json()
+    with legacy_app.app_context():
+        db.engine.dispose()
+
+    assert sorted((item['mood_level'], item['mood']) for item in items) == [('sad', 2), ('very_happy', 5)]
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT DISTINCT typeof(mood_level) FROM mood').fetchall() == [('integer',)]
+    assert conn.execute('PRAGMA user_version').fetchone()[0] >= 1
+    conn.close()
+
+
+def test_mood_cursor_pagination(client):
+    for level in [1, 2, 3, 4, 5, 1, 2]:
+        client.post('/api/mood', json={'mood_level': level})
+
+    seen = []
+    url = '/api/mood?limit=3'
+    while True:
+        resp = client.get(url)
+        assert_json_response(resp, 200)
+        page = resp.get_json()
+        assert len(page) <= 3
+        seen.extend(item['id'] for item in page)
+        cursor = resp.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+        url = f'/api/mood?limit=3&cursor={cursor}'
+
+    assert len(seen) == 7
+    assert seen == sorted(seen, reverse=True)
+
+    resp = client.get('/api/mood?cursor=not-a-cursor')
+    assert_json_response(resp, 400)
+
+
+def test_user_scope_is_the_caller(client):
+    from src.auth import issue_token
+    from src.models.user import User
+
+    users = [User(username=f'scope{i}', email=f'scope{i}@example.com', password_hash='x') for i in range(2)]
+    db.session.add_all(users)
+    db.session.commit()
+    own, other = users
+    auth = {'Authorization': f'Bearer {issue_token(own)}'}
+    client.post('/api/mood', json={'mood_level': 2, 'notes': 'private'}, headers=auth)
+
+    for path in ('/api/mood/stats', '/api/mood/series', '/api/mood/search?q=private', '/api/export?type=mood'):
+        sep = '&' if '?' in path else '?'
+        assert client.get(f'{path}{sep}user_id={own.id}').status_code == 401
+        assert client.get(f'{path}{sep}user_id={other.id}', headers=auth).status_code == 403
+        assert client.get(f'{path}{sep}user_id={own.id}', headers=auth).status_code == 200
+    assert client.get('/api/mood/stats', headers=auth).get_json()['summary']['count'] == 1
+
+
+def test_mood_batch(client):
+    resp = client.post('/api/mood/batch', json={'items': [
+        {'mood_level': 5, 'notes': 'slept well', 'date_created': '2024-03-01T08:00:00+00:00'},
+        {'mood_level': 'sad'},
+        {'mood_level': 9},
+        {'notes': 'missing level'},
+        {'mood_level': 3, 'notes': {'text': 'not a string'}},
+    ]})
+    assert_json_response(resp, 200)
+    body = resp.get_json()
+    assert body['created'] == 2
+    assert [r['status'] for r in body['results']] == ['created', 'created', 'error', 'error', 'error']
+    assert body['results'][2]['error'] == 'Invalid mood level'
+    assert body['results'][4]['error'] == 'Notes must be a string'
+    assert all('id' in r for r in body['results'][:2])
+
+    items = client.get('/api/mood').get_json()
+    assert {item['mood'] for item in items} == {5, 2}
+    assert '2024-03-01' in {item['date'] for item in items}
+
+    resp = client.post('/api/test-results/batch', json=[
+        {'test_type': 'anxiety', 'score': 7, 'result_category': 'moderate'},
+        {'test_type': 'anxiety', 'score': 'seven', 'result_category': 'moderate'},
+        {'test_type': 'anxiety', 'score': 7.5, 'result_category': 'moderate'},
+    ])
+    assert_json_response(resp, 200)
+    assert resp.get_json()['created'] == 1
+    assert [r.get('error') for r in resp.get_json()['results']] == [
+        None, 'Score must be a number', 'Score must be an integer',
+    ]
+
+    # Malformed test types fail their own item, not the whole batch
+    resp = client.post('/api/test-results/batch', json=[
+        {'test_type': 'anxiety', 'score': 4, 'result_category': 'low'},
+        {'test_type': ['x'], 'score': 4, 'result_category': 'low'},
+        {'test_type': {'a': 1}, 'score': 4, 'result_category': 'low'},
+        {'test_type': 'x' * 51, 'score': 4, 'result_category': 'low'},
+        {'test_type': 'stress', 'score': 4, 'result_category': ['low']},
+        {'test_type': 'stress', 'score': 9, 'result_category': 'high'},
+    ])
+    assert_json_response(resp, 200)
+    assert [r['status'] for r in resp.get_json()['results']] == ['created', 'error', 'error', 'error', 'error', 'created']
+    assert resp.get_json()['results'][1]['error'] == 'test_type must be a string of at most 50 characters'
+    resp = client.post('/api/test-result', json={'test_type': ['x'], 'score': 4, 'result_category': 'low'})
+    assert_json_response(resp, 400)
+
+    # A single result still accepts a fractional score, as before batches existed
+    resp = client.post('/api/test-result', json={'test_type': 'anxiety', 'score': 7.5, 'result_category': 'moderate'})
+    assert_json_response(resp, 201)
+    assert resp.get_json()['result']['score'] == 7.5
+
+    resp = client.post('/api/mood/batch', json={'items': []})
+    assert_json_response(resp, 400)
+
+
+def test_export_stream(client):
+    import gzip
+    import json
+    from src.auth import issue_token
+    from src.models.user import User
+
+    user = User(username='exporter', email='exporter@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {issue_token(user)}'
+    client.post('/api/mood', json={'mood_level': 4, 'notes': 'walk, then tea'})
+    client.post('/api/test-result', json={'test_type': 'stress', 'score': 12, 'result_category': 'moderate'})
+    # Other people's rows never show up in an export
+    client.post('/api/mood', json={'mood_level': 1, 'notes': 'anonymous'}, headers={'Authorization': ''})
+
+    resp = client.get('/api/export')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/x-ndjson'
+    records = [json.loads(line) for line in resp.data.decode().splitlines()]
+    assert [r['type'] for r in records] == ['mood', 'test_result']
+    assert records[0]['mood'] == 4 and records[0]['mood_level'] == 'happy'
+
+    resp = client.get('/api/export?format=csv&type=mood&gzip=1')
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(resp.data).decode().splitlines()
+    assert lines[0].startswith('type,id,user_id')
+    assert len(lines) == 2 and '"walk, then tea"' in lines[1]
+
+    resp = client.get('/api/export?format=xml')
+    assert_json_response(resp, 400)
+
+    del client.environ_base['HTTP_AUTHORIZATION']
+    assert_json_response(client.get('/api/export'), 401)
+
+
+def test_mood_stats_rollups(client, app):
+    client.post('/api/mood/batch', json=[
+        {'mood_level': 2, 'date_created': '2024-05-06T09:00:00'},  # Monday
+        {'mood_level': 4, 'date_created': '2024-05-06T21:00:00'},
+        {'mood_level': 5, 'date_created': '2024-05-12T10:00:00'},  # Sunday, same week
+    ])
+    client.post('/api/mood', json={'mood_level': 1})
+
+    resp = client.get('/api/mood/stats?period=day&from=2024-05-01&to=2024-05-31')
+    assert_json_response(resp, 200)
+    body = resp.get_json()
+    assert body['summary']['count'] == 3
+    assert body['summary']['histogram'] == {'1': 0, '2': 1, '3': 0, '4': 1, '5': 1}
+    assert [(b['start'], b['count'], b['min'], b['max']) for b in body['buckets']] == [
+        ('2024-05-06', 2, 2, 4), ('2024-05-12', 1, 5, 5),
+    ]
+
+    resp = client.get('/api/mood/stats?period=week&from=2024-05-01&to=2024-05-31')
+    buckets = resp.get_json()['buckets']
+    assert [(b['start'], b['count'], b['average']) for b in buckets] == [('2024-05-06', 3, 3.67)]
+
+    # A rebuild from the raw rows gives the same rollups
+    from src.models.mood import MoodRollup
+    from src.rollups import rebuild_rollups
+    with app.app_context():
+        before = sorted(tuple(r.to_dict().values())[:4] for r in MoodRollup.query.all())
+        rebuild_rollups(db.session.connection())
+        db.session.commit()
+        after = sorted(tuple(r.to_dict().values())[:4] for r in MoodRollup.query.all())
+    assert before == after
+
+
+def test_login_rehashes_outdated_password(client, app):
+    from werkzeug.security import generate_password_hash
+    from src.models.user import User
+
+    resp = client.post('/api/register', json={'username': 'carol', 'email': 'carol@example.com', 'password': 'secret1'})
+    assert_json_response(resp, 201)
+
+    with app.app_context():
+        user = User.query.filter_by(username='carol').first()
+        assert user.password_hash.startswith('scrypt:')
+        user.password_hash = generate_password_hash('secret1', 'pbkdf2:sha256:1000')
+        db.session.commit()
+
+    resp = client.post('/api/login', json={'username': 'carol', 'password': 'secret1'})
+    assert_json_response(resp, 200)
+    with app.app_context():
+        assert User.query.filter_by(username='carol').first().password_hash.startswith('scrypt:')
+
+    resp = client.post('/api/login', json={'username': 'carol', 'password': 'wrong-pass'})
+    assert resp.status_code == 401
+
+
+def test_hash_pool_sheds_load():
+    import threading
+    from src.hashing import HashPoolBusy, _HashPool
+
+    pool = _HashPool(method='pbkdf2:sha256:1000', workers=0, max_pending=1, timeout=5, retry_after=2)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_hash():
+        started.set()
+        release.wait(5)
+        return 'done'
+
+    worker = threading.Thread(target=pool.run, args=(slow_hash,))
+    worker.start()
+    started.wait(5)
+    with pytest.raises(HashPoolBusy) as excinfo:
+        pool.run(len, 'x')
+    assert excinfo.value.retry_after == 2
+    release.set()
+    worker.join()
+    assert pool.run(len, 'x') == 1
+
+
+def test_hash_pool_process_workers():
+    from werkzeug.security import check_password_hash, generate_password_hash
+    from src.hashing import _HashPool
+
+    pool = _HashPool(method='pbkdf2:sha256:1000', workers=1, max_pending=4, timeout=30, retry_after=1)
+    pwhash = pool.run(generate_password_hash, 'secret1', pool.method)
+    assert pool.run(check_password_hash, pwhash, 'secret1') is True
+    pool._executor.shutdown()
+
+
+def test_login_token_scopes_mood_endpoints(client):
+    client.post('/api/register', json={'username': 'dana', 'email': 'dana@example.com', 'password': 'secret1'})
+    resp = client.post('/api/login', json={'email': 'dana@example.com', 'password': 'secret1'})
+    assert_json_response(resp, 200)
+    body = resp.get_json()
+    token = body['token']
+    auth = {'Authorization': f'Bearer {token}'}
+
+    client.post('/api/mood', json={'mood_level': 3})  # anonymous
+    resp = client.post('/api/mood', json={'mood_level': 5}, headers=auth)
+    assert_json_response(resp, 201)
+    assert resp.get_json()['mood']['user_id'] == body['user']['id']
+
+    items = client.get('/api/mood', headers=auth).get_json()
+    assert [item['mood'] for item in items] == [5]
+    assert len(client.get('/api/mood').get_json()) == 2
+
+    resp = client.get('/api/mood', headers={'Authorization': f'Bearer {token}x'})
+    assert_json_response(resp, 401)
+
+
+def test_availability_checks(client, app):
+    from src.extensions import availability_index
+
+    client.post('/api/register', json={'username': 'erin', 'email': 'Erin@Example.com', 'password': 'secret1'})
+
+    assert client.post('/api/check-username', json={'username': 'erin'}).get_json() == {'available': False}
+    assert client.post('/api/check-email', json={'email': 'erin@example.com '}).get_json() == {'available': False}
+    with app.test_request_context():
+        assert not availability_index.may_have_username('frank')
+    assert client.post('/api/check-username', json={'username': 'frank'}).get_json() == {'available': True}
+
+    resp = client.post('/api/check-availability', json={
+        'usernames': ['erin', 'frank'], 'emails': ['erin@example.com', 'frank@example.com'],
+    })
+    assert_json_response(resp, 200)
+    assert resp.get_json() == {
+        'usernames': {'erin': False, 'frank': True},
+        'emails': {'erin@example.com': False, 'frank@example.com': True},
+    }
+
+    user_id = client.post('/api/login', json={'username': 'erin', 'password': 'secret1'}).get_json()['user']['id']
+    client.put(f'/api/users/{user_id}', json={'username': 'erin2'})
+    assert client.post('/api/check-username', json={'username': 'erin'}).get_json() == {'available': True}
+    assert client.post('/api/check-username', json={'username': 'erin2'}).get_json() == {'available': False}
+
+
+@pytest.fixture
+def fake_upstream():
+    """Local stand-in for the model API's SSE streaming endpoint."""
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            calls.append({'payload': payload, 'api_key': self.headers.get('x-goog-api-key')})
+            chunks = ['Hello', ' there']
+            body = ''.join(
+                'data: ' + json.dumps({'candidates': [{'content': {'parts': [{'text': text}]}}]}) + '\r\n\r\n'
+                for text in chunks
+            ).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/v1/models/test:streamGenerateContent?alt=sse', calls
+    server.shutdown()
+    server.server_close()
+
+
+def test_chat_proxy_streams_and_caches(fake_upstream, monkeypatch):
+    url, calls = fake_upstream
+    monkeypatch.setenv('GOOGLE_API_KEY', 'test-key')
+    monkeypatch.setenv('CHAT_UPSTREAM_URL', url)
+    chat_app = create_app(testing=True, database_uri='sqlite:///:memory:')
+    client = chat_app.test_client()
+
+    resp = client.post('/api/chat', json={'message': "I've been feeling really anxious lately"})
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/event-stream'
+    assert resp.headers['X-Cache'] == 'MISS'
+    text = resp.get_data(as_text=True)
+    assert 'data: {"text": "Hello"}' in text and 'event: done' in text
+    assert calls[0]['api_key'] == 'test-key'
+    assert calls[0]['payload']['contents'][-1]['parts'][0]['text'] == "I've been feeling really anxious lately"
+
+    # Same quick-topic prompt, different spacing/case: served from the cache
+    resp = client.post('/api/chat', json={'message': "i've been  feeling really ANXIOUS lately", 'stream': False})
+    assert resp.get_json() == {'reply': 'Hello there', 'cached': True}
+    assert len(calls) == 1
+
+    # Conversations with history always go upstream, over the pooled connection
+    resp = client.post('/api/chat', json={
+        'message': 'Thanks', 'stream': False, 'history': [{'role': 'user', 'content': 'hi'}],
+    })
+    assert resp.get_json() == {'reply': 'Hello there', 'cached': False}
+    assert len(calls) == 2
+
+    resp = client.post('/api/chat', json={'message': ''})
+    assert resp.status_code == 400
+
+
+def test_server_timing_and_metrics(client):
+    client.post('/api/register', json={'username': 'tim', 'email': 'tim@example.com', 'password': 'secret123'})
+    resp = client.get('/api/mood')
+    assert resp.status_code == 200
+    timing = resp.headers['Server-Timing']
+    assert timing.startswith('db;dur=')
+    assert 'queries"' in timing and 'json;dur=' in timing and 'total;dur=' in timing
+
+    resp = client.post('/api/login', json={'username': 'tim', 'password': 'secret123'})
+    assert 'hash;dur=' in resp.headers['Server-Timing']
+
+    resp = client.get('/api/metrics')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain'
+    body = resp.get_data(as_text=True)
+    assert '# TYPE wellmind_request_duration_seconds histogram' in body
+    assert 'wellmind_request_duration_seconds_bucket{endpoint="mood.get_moods",le="+Inf"}' in body
+    assert 'wellmind_db_queries_per_request_count{endpoint="mood.get_moods"}' in body
+    assert 'wellmind_component_seconds_total{endpoint="user.login",component="hash"}' in body
+    assert 'wellmind_responses_total{endpoint="mood.get_moods",method="GET",status="200"}' in body
+
+
+def test_list_endpoints_serialize_rows(client):
+    client.post('/api/mood', json={'mood_level': 'happy', 'notes': 'ünïcode'})
+    client.post('/api/test-result', json={'test_type': 'phq9', 'score': 7, 'result_category': 'mild'})
+
+    resp = client.get('/api/mood')
+    assert resp.mimetype == 'application/json'
+    (mood,) = resp.get_json()
+    assert mood['mood_level'] == 'happy' and mood['mood'] == 4
+    assert mood['notes'] == 'ünïcode'
+    assert mood['date'] == mood['date_created'][:10]
+    assert 'T' in mood['date_created']
+
+    (result,) = client.get('/api/test-results').get_json()
+    assert set(result) == {'id', 'user_id', 'test_type', 'score', 'result_category', 'date_created'}
+    assert result['score'] == 7
+
+
+def test_serialization_fallback_matches_fast_encoder(monkeypatch):
+    import importlib.util
+    import sys
+    from datetime import date, datetime
+    from src import serialization
+
+    orjson = pytest.importorskip('orjson')
+    # Load a second copy of the module with orjson unimportable, to exercise the stdlib branch
+    monkeypatch.setitem(sys.modules, 'orjson', None)
+    spec = importlib.util.spec_from_file_location('serialization_fallback', serialization.__file__)
+    fallback = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(fallback)
+    assert fallback.orjson is None
+
+    payload = [
+        {'id': 1, 'notes': 'ünï "quoted" \\ / \u2028', 'date_created': datetime(2024, 1, 2, 3, 4, 5, 6),
+         'date': date(2024, 1, 2), 'mood': None, 'score': 7.5, 'flags': [True, False], 'nested': {'a': []}},
+        {'id': 2, 'notes': '', 'date_created': datetime(2024, 1, 2, 3, 4, 5), 'mood': 3},
+    ]
+    assert fallback.dumps(payload) == orjson.dumps(payload) == serialization.dumps(payload)
+
+
+def test_create_app_leaves_schema_to_init_db(tmp_path):
+    import sqlite3
+
+    db_path = tmp_path / 'fresh.db'
+    fresh_app = create_app(database_uri=f'sqlite:///{db_path}')
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall() == []
+
+    result = fresh_app.test_cli_runner().invoke(args=['init-db'])
+    assert 'Applied migrations' in result.output
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'user', 'mood', 'test_result', 'mood_rollup'} <= tables
+
+    result = fresh_app.test_cli_runner().invoke(args=['init-db'])
+    assert 'Schema is up to date' in result.output
+    conn.close()
+    with fresh_app.app_context():
+        db.engine.dispose()
+
+
+def test_mood_recommendations(client):
+    resp = client.post('/api/mood', json={'mood_level': 1, 'notes': 'So much Pressure at work, I feel sad'})
+    assert resp.status_code == 201
+    rec = resp.get_json()['recommendation']
+    assert rec['type'] == 'crisis_support'
+    assert rec['categories'] == ['stress', 'sadness']
+    assert rec['title'] and rec['tips']
+
+    client.post('/api/mood', json={'mood_level': 2, 'notes': 'nervous and could not sleep'})
+    client.post('/api/mood', json={'mood_level': 1})
+    client.post('/api/mood', json={'mood_level': 5, 'notes': 'great day with family'})
+
+    resp = client.get('/api/mood/recommendations?limit=3')
+    assert resp.status_code == 200
+    assert resp.headers.get('X-Next-Cursor')
+    body = resp.get_json()
+    assert [item['type'] for item in body['items']] == ['peak_wellness', 'general_support', 'anxiety_relief']
+    assert body['items'][2]['categories'] == ['anxiety', 'sleep']
+    assert body['counts'] == {'peak_wellness': 1, 'general_support': 1, 'anxiety_relief': 1}
+    assert set(body['recommendations']) == set(body['counts'])
+
+
+def test_keyword_matcher_matches_regex_semantics():
+    from src.recommendations import KeywordMatcher
+
+    matcher = KeywordMatcher({'a': ('he', 'hers'), 'b': ('she',), 'c': ('his',)})
+    assert matcher.categories_in(matcher.scan('uSHERs')) == ['a', 'b']
+    assert matcher.categories_in(matcher.scan('ahishers')) == ['a', 'b', 'c']
+    assert matcher.scan('xyz') == 0
+
+
+def test_mood_search(client, app):
+    from src.auth import issue_token
+    from src.models.user import User
+
+    assert client.get('/api/mood/search?q=sleep').status_code == 401
+    user = User(username='searcher', email='searcher@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    # Someone else's note never matches the caller's search
+    client.post('/api/mood', json={'mood_level': 1, 'notes': 'Anonymous sleep diary'})
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {issue_token(user)}'
+    client.post('/api/mood', json={'mood_level': 2, 'notes': 'Could not sleep, <b>sleeping</b> badly all week'})
+    client.post('/api/mood', json={'mood_level': 4, 'notes': 'Sleeps well after a long walk'})
+    client.post('/api/mood', json={'mood_level': 3, 'notes': 'Sleep was fine, work was sleep-inducing'})
+    client.post('/api/mood', json={'mood_level': 5, 'notes': 'Great day'})
+
+    resp = client.get('/api/mood/search?q=sleep&limit=1')
+    assert resp.status_code == 200
+    first = resp.get_json()
+    assert len(first) == 1
+    assert '<mark>' in first[0]['snippet']
+    cursor = resp.headers['X-Next-Cursor']
+    second = client.get(f'/api/mood/search?q=sleep&limit=5&cursor={cursor}').get_json()
+    ids = [first[0]['id']] + [item['id'] for item in second]
+    assert len(ids) == len(set(ids)) == 3  # porter stemming: sleep/sleeping/sleeps
+    assert all(item['score'] <= first[0]['score'] for item in second)
+    html_snippets = [item['snippet'] for item in first + second if '&lt;b&gt;' in item['snippet']]
+    assert html_snippets and '<b>' not in html_snippets[0]
+
+    assert client.get('/api/mood/search?q=%22+%2A').status_code == 400
+    assert client.get('/api/mood/search?q=long+walk%22%29').get_json()[0]['mood'] == 4
+
+    # Triggers keep the index in sync with updates and deletes
+    from src.models.mood import Mood
+    mood = Mood.query.filter(Mood.notes == 'Great day').one()
+    mood.notes = 'Great sleep tonight'
+    db.session.commit()
+    assert len(client.get('/api/mood/search?q=sleep').get_json()) == 4
+    db.session.delete(mood)
+    db.session.commit()
+    assert len(client.get('/api/mood/search?q=sleep').get_json()) == 3
+
+    result = app.test_cli_runner().invoke(args=['rebuild-search'])
+    assert 'rebuilt' in result.output
+    assert len(client.get('/api/mood/search?q=sleep').get_json()) == 3
+    del client.environ_base['HTTP_AUTHORIZATION']
+
+
+def test_list_response_cache_and_etags(client):
+    client.post('/api/mood', json={'mood_level': 3})
+    first = client.get('/api/mood')
+    assert first.headers['X-Cache'] == 'MISS'
+    etag = first.headers['ETag']
+    second = client.get('/api/mood')
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_data() == first.get_data() and second.headers['ETag'] == etag
+    assert client.get('/api/mood', headers={'If-None-Match': etag}).status_code == 304
+
+    # A commit invalidates the cached list
+    client.post('/api/mood', json={'mood_level': 5})
+    third = client.get('/api/mood', headers={'If-None-Match': etag})
+    assert third.status_code == 200 and third.headers['X-Cache'] == 'MISS'
+    assert len(third.get_json()) == 2
+
+    # Writes by one user leave other users' cached lists alone
+    tokens = {}
+    for name in ('ann', 'bob'):
+        client.post('/api/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'secret123'})
+        token = client.post('/api/login', json={'username': name, 'password': 'secret123'}).get_json()['token']
+        tokens[name] = {'Authorization': f'Bearer {token}'}
+    client.get('/api/test-results', headers=tokens['ann'])
+    client.get('/api/test-results', headers=tokens['bob'])
+    client.post('/api/test-result', json={'test_type': 'stress', 'score': 4, 'result_category': 'low'}, headers=tokens['ann'])
+    assert client.get('/api/test-results', headers=tokens['bob']).headers['X-Cache'] == 'HIT'
+    ann = client.get('/api/test-results', headers=tokens['ann'])
+    assert ann.headers['X-Cache'] == 'MISS' and len(ann.get_json()) == 1
+
+
+def test_sqlite_cache_backend(tmp_path):
+    from src.cache import SQLiteCache
+
+    cache = SQLiteCache(str(tmp_path / 'cache.db'), ttl=60)
+    other_worker = SQLiteCache(str(tmp_path / 'cache.db'), ttl=60)
+    cache.set('k', b'value')
+    assert other_worker.get('k') == b'value'
+    cache.set('old', b'x', ttl=-1)
+    assert other_worker.get('old') is None
+    other_worker.delete('k')
+    assert cache.get('k', b'missing') == b'missing'
+
+
+def test_rate_limits_auth_and_writes(monkeypatch):
+    monkeypatch.setenv('RATELIMIT_ENABLED', '1')
+    monkeypatch.setenv('RATELIMITS', 'user.login=2/minute')
+    limited_app = create_app(testing=True, database_uri='sqlite:///:memory:')
+    init_db(limited_app)
+    client = limited_app.test_client()
+
+    for expected_remaining in ('1', '0'):
+        resp = client.post('/api/login', json={'username': 'nobody', 'password': 'x'})
+        assert resp.status_code == 401
+        assert resp.headers['RateLimit-Limit'] == '2'
+        assert resp.headers['RateLimit-Remaining'] == expected_remaining
+    resp = client.post('/api/login', json={'username': 'nobody', 'password': 'x'})
+    assert resp.status_code == 429
+    assert int(resp.headers['Retry-After']) == 30
+    assert resp.headers['RateLimit-Policy'] == '2;w=60'
+
+    # Other routes and other clients have their own buckets
+    resp = client.post('/api/register', json={})
+    assert resp.headers['RateLimit-Limit'] == '5'
+    resp = client.post('/api/login', json={'username': 'nobody', 'password': 'x'},
+                       environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    assert resp.status_code == 401
+
+
+def test_token_buckets_refill(tmp_path):
+    from src.ratelimit import MemoryBucketStore, SQLiteBucketStore, parse_limit
+
+    assert parse_limit('100/15minutes') == (100, 900)
+    store = MemoryBucketStore(stripes=1, max_keys_per_stripe=2)
+    assert [store.consume('k', 2, 1.0, now=0)[0] for _ in range(3)] == [True, True, False]
+    assert store.consume('k', 2, 1.0, now=1.0)[0] is True
+    for i in range(20):
+        store.consume(f'other{i}', 2, 1.0, now=100.0)
+    assert sum(len(buckets) for _, buckets in store._stripes) < 21  # full buckets pruned
+
+    shared = SQLiteBucketStore(str(tmp_path / 'buckets.db'))
+    other_worker = SQLiteBucketStore(str(tmp_path / 'buckets.db'))
+    assert shared.consume('k', 1, 1.0, now=0)[0] is True
+    assert other_worker.consume('k', 1, 1.0, now=0.5)[0] is False
+    assert other_worker.consume('k', 1, 1.0, now=2)[0] is True
+
+
+def test_mood_series_downsampling(client):
+    from datetime import datetime, timedelta
+
+    start = datetime(2024, 1, 1, 0, 30)
+    items = [
+        {'mood_level': (i % 5) + 1, 'date_created': (start + timedelta(hours=6 * i)).isoformat()}
+        for i in range(4 * 365)  # four moods a day for a year
+    ]
+    for offset in range(0, len(items), 1000):
+        chunk = items[offset:offset + 1000]
+        assert client.post('/api/mood/batch', json=chunk).get_json()['created'] == len(chunk)
+
+    # A year in 50 points: aggregated from the day rollups, 8-day buckets
+    body = client.get('/api/mood/series?from=2024-01-01&to=2024-12-30&points=50').get_json()
+    assert body['bucket_seconds'] == 8 * 86400
+    assert len(body['series']) <= 50
+    assert sum(point['count'] for point in body['series']) == len(items)
+    first = body['series'][0]
+    assert first['date'] == '2024-01-01' and first['count'] == 32
+    assert first['min'] == 1 and first['max'] == 5 and first['mood'] == round(93 / 32, 2)
+
+    # Two days in 4 points: 12-hour buckets over the raw moods
+    body = client.get('/api/mood/series?from=2024-01-01&to=2024-01-02&points=4').get_json()
+    assert body['bucket_seconds'] == 12 * 3600
+    assert [(p['date'], p['count'], p['mood']) for p in body['series']] == [
+        ('2024-01-01T00:00:00', 2, 1.5), ('2024-01-01T12:00:00', 2, 3.5),
+        ('2024-01-02T00:00:00', 2, 3.0), ('2024-01-02T12:00:00', 2, 2.5),
+    ]
+
+    assert client.get('/api/mood/series?points=0').status_code == 400
+    assert client.get('/api/mood/series?from=2024-02-01&to=2024-01-01').status_code == 400
+
+
+def test_mood_series_bucket_edges(client):
+    # Moods exactly on bucket boundaries belong to the bucket starting there
+    items = [{'mood_level': 3, 'date_created': f'2024-01-01T{hour:02d}:00:00'} for hour in range(24)]
+    assert client.post('/api/mood/batch', json=items).get_json()['created'] == 24
+
+    for points, step in ((24, 3600), (96, 900)):
+        body = client.get(f'/api/mood/series?from=2024-01-01&to=2024-01-01&points={points}').get_json()
+        assert body['bucket_seconds'] == step
+        assert [(p['date'], p['count']) for p in body['series']] == [
+            (f'2024-01-01T{hour:02d}:00:00', 1) for hour in range(24)
+        ]
+
+
+def test_test_result_percentiles(app, client, monkeypatch):
+    from collections import Counter
+    from src.analytics import ScoreSketch, bucket_key, bucket_value
+
+    sketch = ScoreSketch(Counter(bucket_key(s) for s in range(1, 101)))
+    assert abs(sketch.quantile(0.5) - 50) / 50 <= 0.01
+    assert abs(bucket_value(bucket_key(-37)) + 37) / 37 <= 0.01
+
+    monkeypatch.setitem(app.config, 'TEST_RESULT_CUTOFFS', {'gad7': [[50, 'low'], [85, 'moderate'], [100, 'high']]})
+
+    # Below TEST_RESULT_MIN_SAMPLES the client's category is kept
+    resp = client.post('/api/test-result', json={'test_type': 'gad7', 'score': 3, 'result_category': 'minimal'})
+    assert resp.get_json()['result']['result_category'] == 'minimal'
+    items = [{'test_type': 'gad7', 'score': score, 'result_category': 'n/a'} for score in range(1, 21) for _ in range(2)]
+    assert client.post('/api/test-results/batch', json=items).get_json()['created'] == 40
+
+    body = client.get('/api/test-results/percentiles?test_type=gad7&score=18&q=0.5,0.9').get_json()
+    assert body['count'] == 41
+    assert abs(body['quantiles']['0.5'] - 10) <= 0.1
+    assert abs(body['quantiles']['0.9'] - 18) <= 0.2
+    assert body['score']['score'] == 18 and isinstance(body['score']['score'], int)
+    assert 85 < body['score']['percentile'] < 90 and body['score']['category'] == 'high'
+
+    # Enough samples now: the category is derived from the distribution
+    resp = client.post('/api/test-result', json={'test_type': 'gad7', 'score': 2, 'result_category': 'severe'})
+    assert resp.get_json()['result']['result_category'] == 'low'
+    resp = client.post('/api/test-result', json={'test_type': 'gad7', 'score': 13})
+    assert resp.get_json()['result']['result_category'] == 'moderate'
+
+    # Fractional scores are accepted by single posts, so percentiles take them too
+    body = client.get('/api/test-results/percentiles?test_type=gad7&score=2.5').get_json()
+    assert body['score']['score'] == 2.5 and body['score']['percentile'] < 15
+    for bad in ('abc', 'nan', 'inf'):
+        assert client.get(f'/api/test-results/percentiles?test_type=gad7&score={bad}').status_code == 400
+
+    # Types without configured cutoffs always keep the client's category
+    items = [{'test_type': 'phq9', 'score': score, 'result_category': 'severe'} for score in range(1, 41)]
+    assert client.post('/api/test-results/batch', json=items).get_json()['created'] == 40
+    resp = client.post('/api/test-result', json={'test_type': 'phq9', 'score': 1, 'result_category': 'severe'})
+    assert resp.get_json()['result']['result_category'] == 'severe'
+    assert client.post('/api/test-result', json={'test_type': 'phq9', 'score': 1}).status_code == 400
+    body = client.get('/api/test-results/percentiles?test_type=phq9&score=1').get_json()
+    assert body['score']['category'] is None
+
+    assert client.get('/api/test-results/percentiles').status_code == 400
+    assert client.get('/api/test-results/percentiles?test_type=gad7&q=2').status_code == 400
+    assert client.get('/api/test-results/percentiles?test_type=gad7&score=x').status_code == 400
+
+
+def test_retention_archives_and_deletes(tmp_path):
+    import gzip
+    import json
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy import text
+    from src.models.mood import Mood
+    from src.models.user import User
+    from src.rollups import record_moods
+
+    retention_app = create_app(testing=True, database_uri=f"sqlite:///{tmp_path / 'retention.db'}")
+    retention_app.config.update(
+        RETENTION_DAYS=365, RETENTION_ANONYMOUS_DAYS=30, RETENTION_BATCH_SIZE=2, RETENTION_BATCH_PAUSE=0,
+        RETENTION_ARCHIVE_DIR=str(tmp_path / 'archive'),
+    )
+    init_db(retention_app)
+    now = datetime.now(timezone.utc)
+    with retention_app.app_context():
+        db.session.add(User(username='ann', email='ann@example.com', password_hash='x'))
+        db.session.commit()
+        ann_id = User.query.one().id
+    client = retention_app.test_client()
+
+    def ago(days):
+        return (now - timedelta(days=days)).isoformat()
+
+    client.post('/api/mood/batch', json=[
+        {'mood_level': 3, 'notes': 'ancient', 'date_created': '2020-01-15T10:00:00+00:00'},
+        {'mood_level': 4, 'notes': 'old anonymous', 'date_created': ago(60)},
+        {'mood_level': 5, 'notes': 'recent', 'date_created': ago(1)},
+    ])
+    with retention_app.app_context():
+        kept = Mood(user_id=ann_id, mood_level=2, notes='old but kept', date_created=now - timedelta(days=60))
+        db.session.add(kept)
+        record_moods(db.session, [(kept.user_id, kept.mood_level, kept.date_created)])
+        db.session.commit()
+    assert client.get('/api/mood').headers['X-Cache'] == 'MISS'
+
+    runner = retention_app.test_cli_runner()
+    with retention_app.app_context():  # the autouse fixture has pushed the shared app's context
+        assert 'Would archive 2 mood rows' in runner.invoke(args=['retention', '--dry-run']).output
+        result = runner.invoke(args=['retention'])
+    assert 'Archived 2 mood rows' in result.output and 'Archived 0 test_result rows' in result.output
+
+    assert {item['notes'] for item in client.get('/api/mood').get_json()} == {'recent', 'old but kept'}
+    with gzip.open(tmp_path / 'archive' / 'mood' / '2020-01.ndjson.gz') as archive:
+        (record,) = [json.loads(line) for line in archive]
+    assert record['notes'] == 'ancient' and record['mood_level'] == 'neutral'
+    with retention_app.app_context():
+        assert db.session.execute(text("SELECT COUNT(*) FROM mood_fts WHERE mood_fts MATCH 'ancient'")).scalar() == 0
+    # Rollups still count archived moods, so series and stats agree across the horizon
+    assert client.get('/api/mood/stats?from=2020-01-01&to=2020-01-31').get_json()['summary']['count'] == 1
+    for points in (100, 5):
+        series = client.get(f'/api/mood/series?from=2020-01-01&to=2020-01-31&points={points}').get_json()['series']
+        assert [(point['count'], point['mood']) for point in series] == [(1, 3)]
+    span = f'from={(now - timedelta(days=90)).date()}&to={now.date()}'
+    assert client.get(f'/api/mood/stats?{span}').get_json()['summary']['count'] == 3
+    series = client.get(f'/api/mood/series?{span}&points=500').get_json()['series']
+    assert [(point['count'], point['min'], point['max']) for point in series] == [(2, 2, 4), (1, 5, 5)]
+
+    metrics_text = client.get('/api/metrics').get_data(as_text=True)
+    assert 'wellmind_job_rows_total{job="retention",table="mood"} 2' in metrics_text
+    with retention_app.app_context():
+        db.engine.dispose()
+
+
+def test_sharded_storage(tmp_path):
+    import sqlite3
+    from src.auth import issue_token
+    from src.models.user import User
+    from src.sharding import SHARD_ID_BITS, shard_for
+
+    sharded_app = create_app(testing=True, database_uri=f"sqlite:///{tmp_path / 'app.db'}", db_shards=2)
+    init_db(sharded_app)
+    with sharded_app.app_context():
+        users = [User(username=f'u{i}', email=f'u{i}@example.com', password_hash='x') for i in range(4)]
+        db.session.add_all(users)
+        db.session.commit()
+        headers = {user.id: {'Authorization': f'Bearer {issue_token(user)}'} for user in users}
+    client = sharded_app.test_client()
+
+    for user_id, auth in headers.items():
+        client.post('/api/mood/batch', json=[{'mood_level': 3, 'notes': f'user {user_id}'}] * 3, headers=auth)
+        client.post('/api/test-result', json={'test_type': 'phq9', 'score': user_id, 'result_category': 'x'},
+                    headers=auth)
+    client.post('/api/mood', json={'mood_level': 1})
+
+    for index in range(2):
+        conn = sqlite3.connect(tmp_path / f'app-shard{index}.db')
+        rows = conn.execute('SELECT id, user_id FROM mood').fetchall()
+        conn.close()
+        assert all(shard_for(user_id, 2) == index for _, user_id in rows)
+        assert all(row_id >> SHARD_ID_BITS == index for row_id, _ in rows)
+
+    # All-users pages are merged from both shards
+    ids, url = [], '/api/mood?limit=5'
+    while url:
+        resp = client.get(url)
+        ids += [item['id'] for item in resp.get_json()]
+        cursor = resp.headers.get('X-Next-Cursor')
+        url = cursor and f'/api/mood?limit=5&cursor={cursor}'
+    assert len(ids) == len(set(ids)) == 13
+    # The shard queries run in pool threads but still count towards the request
+    resp = client.get('/api/mood/stats')
+    assert '2 queries' in resp.headers['Server-Timing']
+    metrics_text = client.get('/api/metrics').get_data(as_text=True)
+    assert 'wellmind_db_queries_per_request_sum{endpoint="mood.get_mood_stats"} 2.000000' in metrics_text
+
+    some_user = next(iter(headers))
+    assert {item['user_id'] for item in client.get('/api/mood', headers=headers[some_user]).get_json()} == {some_user}
+    assert client.get('/api/mood/stats', headers=headers[some_user]).get_json()['summary']['count'] == 3
+    # All-users rollups are summed over the shards; search needs a token
+    summary = client.get('/api/mood/stats').get_json()['summary']
+    assert summary['count'] == 13 and summary['histogram']['3'] == 12 and summary['min'] == 1
+    series = client.get('/api/mood/series?points=1').get_json()['series']
+    assert [(point['count'], point['min'], point['max']) for point in series] == [(13, 1, 3)]
+    assert client.get('/api/mood/search?q=user').status_code == 401
+
+    # Re-indexing covers the shard files, where the notes live
+    for index in range(2):
+        conn = sqlite3.connect(tmp_path / f'app-shard{index}.db')
+        conn.execute("INSERT INTO mood_fts(mood_fts) VALUES ('delete-all')")
+        conn.commit()
+        conn.close()
+    assert client.get('/api/mood/search?q=user', headers=headers[some_user]).get_json() == []
+    with sharded_app.app_context():
+        assert 'rebuilt in 2 shards' in sharded_app.test_cli_runner().invoke(args=['rebuild-search']).output
+    assert len(client.get('/api/mood/search?q=user', headers=headers[some_user]).get_json()) == 3
+
+    # Migrations applied to a shard are reported too
+    conn = sqlite3.connect(tmp_path / 'app-shard1.db')
+    conn.execute('PRAGMA user_version = 3')
+    conn.close()
+    assert init_db(sharded_app) == [4]
+    assert init_db(sharded_app) == []
+    assert client.get('/api/test-results/percentiles?test_type=phq9').get_json()['count'] == 4
+    assert len(client.get('/api/export?type=mood', headers=headers[some_user]).get_data().splitlines()) == 3
+
+    with sharded_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
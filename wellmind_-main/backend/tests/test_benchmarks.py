@@ -0,0 +1,38 @@
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+
+from harness import compare_to_baseline, percentile, run_benchmark  # noqa: E402
+
+
+def test_percentile_interpolates():
+    values = [1.0, 2.0, 3.0, 4.0]
+    assert percentile(values, 0) == 1.0
+    assert percentile(values, 50) == 2.5
+    assert percentile(values, 100) == 4.0
+    assert percentile([], 99) == 0.0
+
+
+def test_compare_to_baseline_flags_regressions():
+    baseline = {'mood_list': {'rps': 1000.0, 'p99_ms': 10.0, 'errors': 0}}
+    ok = {'mood_list': {'rps': 900.0, 'p99_ms': 11.0, 'errors': 0}}
+    slow = {'mood_list': {'rps': 500.0, 'p99_ms': 30.0, 'errors': 2}}
+
+    assert compare_to_baseline(ok, baseline, tolerance=0.25) == []
+    assert len(compare_to_baseline(slow, baseline, tolerance=0.25)) == 3
+
+
+def test_run_benchmark_smoke(monkeypatch):
+    monkeypatch.setenv('PASSWORD_HASH_WORKERS', '0')
+    monkeypatch.setenv('RATELIMIT_ENABLED', '1')
+    results = run_benchmark(['health', 'mood_list', 'shell'], users=3, moods=20, threads=2, requests=3)
+    # The run's environment is restored, so it doesn't leak into later tests
+    assert os.environ['RATELIMIT_ENABLED'] == '1'
+
+    for endpoint in ('health', 'mood_list', 'shell'):
+        assert results[endpoint]['requests'] == 6
+        assert results[endpoint]['errors'] == 0
+        assert results[endpoint]['rps'] > 0
+        assert results[endpoint]['peak_rss_mb'] > 0
@@ -23,18 +23,8 @@ const Chatbot = () => {
   const [userInput, setUserInput] = useState('')
   const [isTyping, setIsTyping] = useState(false)
 
-  const API_KEY = process.env.REACT_APP_GOOGLE_API_KEY
-  const API_URL = `https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key=${API_KEY}`
-
-  const systemPrompt = `You are MindHelper, the friendly AI assistant for Well Mind website created by Basel Hossam Alshawqery.
-
-WEBSITE FEATURES:
-- Mood tracker with AI recommendations
-- Therapy sessions with mental health professionals
-- Mental health articles and podcasts
-- Certified assessments (PHQ-9, GAD-7, etc.)
-
-Talk like a caring friend. Be warm, supportive, and helpful.`
+  // Proxied by the backend, which holds the model API key
+  const API_URL = '/api/chat'
 
   const toggleChat = () => {
     setIsChatOpen(!isChatOpen)
@@ -74,27 +64,16 @@ Talk like a caring friend. Be warm, supportive, and helpful.`
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({
-          contents: [{
-            parts: [{
-              text: systemPrompt + "\n\nUser: " + message + "\n\nPlease respond in a warm, friendly way:"
-            }]
-          }],
-          generationConfig: {
-            temperature: 0.8,
-            maxOutputTokens: 500,
-          }
-        })
+        body: JSON.stringify({ message, stream: false })
       })
 
       const data = await response.json()
       setIsTyping(false)
 
-      if (data.candidates && data.candidates[0].content.parts[0].text) {
-        const botResponse = data.candidates[0].content.parts[0].text
-        setMessages(prev => [...prev, { type: 'bot', content: botResponse }])
+      if (response.ok && data.reply) {
+        setMessages(prev => [...prev, { type: 'bot', content: data.reply }])
       } else {
-        throw new Error('No response from AI')
+        throw new Error(data.error || 'No response from AI')
       }
 
     } catch (error) {